@@ -4,37 +4,14 @@
 Восстанавливает читаемый исходный код
 """
 
-import struct
 from pathlib import Path
 from typing import List, Dict, Any
 
-class LuaDecompiler:
-    def __init__(self, data):
-        self.data = data
-        self.pos = 0
-        
-    def read_byte(self):
-        b = self.data[self.pos]
-        self.pos += 1
-        return b
-    
-    def read_int(self):
-        val = struct.unpack('<I', self.data[self.pos:self.pos+4])[0]
-        self.pos += 4
-        return val
-    
-    def read_number(self):
-        val = struct.unpack('<d', self.data[self.pos:self.pos+8])[0]
-        self.pos += 8
-        return val
-    
-    def read_string(self):
-        size = self.read_int()
-        if size == 0:
-            return ""
-        s = self.data[self.pos:self.pos+size-1].decode('utf-8', errors='replace')
-        self.pos += size
-        return s
+from lua_pack import read_lua, lua_exists
+from lua_chunk import ChunkReader, is_lua_chunk
+
+class LuaDecompiler(ChunkReader):
+    __slots__ = ()
     
     def decompile(self):
         # Пропускаем заголовок
@@ -44,43 +21,15 @@ class LuaDecompiler:
     def read_function(self, level):
         indent = "  " * level
         
-        # Source name
-        source = self.read_string()
-        
-        # Line info
-        line_defined = self.read_int()
-        last_line_defined = self.read_int()
-        
-        # Function info
-        num_upvalues = self.read_byte()
-        num_params = self.read_byte()
-        is_vararg = self.read_byte()
-        max_stack_size = self.read_byte()
+        # Source name, line info, function info
+        (source, line_defined, last_line_defined,
+         num_upvalues, num_params, is_vararg, max_stack_size) = self.read_function_info()
         
         # Code
-        num_instructions = self.read_int()
-        instructions = []
-        for i in range(num_instructions):
-            inst = self.read_int()
-            instructions.append(self.decode_instruction(inst))
+        instructions = [self.decode_instruction(inst) for inst in self.read_ints(self.read_int())]
         
         # Constants
-        num_constants = self.read_int()
-        constants = []
-        for i in range(num_constants):
-            const_type = self.read_byte()
-            
-            if const_type == 0:  # nil
-                constants.append(None)
-            elif const_type == 1:  # boolean
-                val = self.read_byte()
-                constants.append(bool(val))
-            elif const_type == 3:  # number
-                val = self.read_number()
-                constants.append(val)
-            elif const_type == 4:  # string
-                val = self.read_string()
-                constants.append(val)
+        constants = self.read_constants()
         
         # Prototypes
         num_protos = self.read_int()
@@ -89,23 +38,13 @@ class LuaDecompiler:
             protos.append(self.read_function(level + 1))
         
         # Line info (debug)
-        num_lines = self.read_int()
-        for i in range(num_lines):
-            self.read_int()
+        self.skip_ints(self.read_int())
         
         # Locals (debug)
-        num_locals = self.read_int()
-        locals_info = []
-        for i in range(num_locals):
-            name = self.read_string()
-            startpc = self.read_int()
-            endpc = self.read_int()
-            locals_info.append((name, startpc, endpc))
+        locals_info = self.read_locals()
         
         # Upvalues (debug)
-        num_upvalue_names = self.read_int()
-        for i in range(num_upvalue_names):
-            self.read_string()
+        self.read_strings()
         
         # Генерируем код
         return self.generate_lua_code(instructions, constants, protos, locals_info, num_params, is_vararg, indent)
@@ -274,10 +213,13 @@ class LuaDecompiler:
 def decompile_file(filepath):
     """Декомпиляция файла"""
     
-    with open(filepath, 'rb') as f:
-        data = f.read()
+    data = read_lua(filepath)
+    return decompile_data(data)
+
+def decompile_data(data):
+    """Декомпиляция байткода, уже находящегося в памяти"""
     
-    if not data.startswith(b'\x1bLua'):
+    if not is_lua_chunk(data):
         return None, "Not Lua bytecode"
     
     try:
@@ -303,7 +245,7 @@ def main():
     for test_file in test_files:
         filepath = Path(test_file)
         
-        if not filepath.exists():
+        if not lua_exists(filepath):
             print(f"❌ Файл не найден: {filepath}")
             continue
         
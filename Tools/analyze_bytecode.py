@@ -5,12 +5,12 @@
 
 import struct
 from pathlib import Path
+from lua_pack import read_lua, lua_exists
 
 def analyze_lua_header(filepath):
     """Анализ заголовка Lua файла"""
     
-    with open(filepath, 'rb') as f:
-        data = f.read(100)
+    data = bytes(read_lua(filepath)[:100])
     
     print("=" * 80)
     print(f"📁 Файл: {filepath.name}")
@@ -150,7 +150,7 @@ def main():
     
     for test_file in test_files:
         filepath = base_path / test_file
-        if filepath.exists():
+        if lua_exists(filepath):
             analyze_lua_header(filepath)
             print()
         else:
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Асинхронный конвейер: чтение → вычисление → запись с перекрытием
+Для медленных (сетевых) дисков, где задержка I/O больше времени расшифровки:
+- Входные файлы читаются заранее в пуле потоков (ограниченная очередь)
+- Вычисления идут в пуле процессов, ядра не простаивают во время I/O
+- Запись - отдельные писатели из своей очереди, папки создаются одним проходом
+"""
+
+import asyncio
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Потоков для чтения/записи (задержка сети, а не CPU)
+IO_THREADS = 8
+
+# Сколько прочитанных файлов ждет вычисления, на один процесс
+PREFETCH_PER_JOB = 4
+
+# Сколько задач вычисления держим в пуле на один процесс
+INFLIGHT_PER_JOB = 2
+
+_DONE = object()
+
+
+def make_parent_dirs(paths):
+    """Создание всех нужных папок одним проходом (каждая - один раз)"""
+    parents = sorted({Path(path).parent for path in paths})
+    for parent in parents:
+        parent.mkdir(parents=True, exist_ok=True)
+    return len(parents)
+
+
+async def _pipeline(tasks, read, work, write, on_result, jobs, io_threads, writers, prefetch):
+    loop = asyncio.get_running_loop()
+    computers = max(jobs, 1) * INFLIGHT_PER_JOB
+    read_queue = asyncio.Queue(maxsize=prefetch)
+    write_queue = asyncio.Queue(maxsize=computers)
+    pending = iter(tasks)
+    
+    if jobs > 1:
+        cpu_pool = ProcessPoolExecutor(max_workers=jobs)
+    else:
+        cpu_pool = ThreadPoolExecutor(max_workers=1)
+    io_pool = ThreadPoolExecutor(max_workers=io_threads)
+    
+    async def reader():
+        for task in pending:
+            data = await loop.run_in_executor(io_pool, read, task)
+            await read_queue.put((task, data))
+    
+    async def computer():
+        while True:
+            item = await read_queue.get()
+            if item is _DONE:
+                return
+            task, data = item
+            result = await loop.run_in_executor(cpu_pool, work, task, data)
+            del item, data
+            await write_queue.put((task, result))
+    
+    async def writer():
+        while True:
+            item = await write_queue.get()
+            if item is _DONE:
+                return
+            task, result = item
+            final = await loop.run_in_executor(io_pool, write, task, result)
+            del item, result
+            on_result(task, final)
+    
+    async def close(stage, queue, count):
+        """Стадия отработала - по _DONE каждой задаче следующей стадии"""
+        await asyncio.gather(*stage)
+        for _ in range(count):
+            await queue.put(_DONE)
+    
+    try:
+        reader_tasks = [asyncio.ensure_future(reader()) for _ in range(io_threads)]
+        computer_tasks = [asyncio.ensure_future(computer()) for _ in range(computers)]
+        writer_tasks = [asyncio.ensure_future(writer()) for _ in range(writers)]
+        stages = reader_tasks + computer_tasks + writer_tasks + [
+            asyncio.ensure_future(close(reader_tasks, read_queue, computers)),
+            asyncio.ensure_future(close(computer_tasks, write_queue, writers)),
+        ]
+        
+        # Первая же ошибка (в т.ч. BrokenProcessPool) останавливает всё:
+        # иначе читатели навсегда повиснут на полной read_queue
+        done, running = await asyncio.wait(stages, return_when=asyncio.FIRST_EXCEPTION)
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.wait(running)
+        for task in stages:
+            if task in done and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+    finally:
+        io_pool.shutdown(wait=True)
+        cpu_pool.shutdown(wait=True)
+
+
+def run_pipeline(tasks, read, work, write, on_result, jobs,
+                 io_threads=IO_THREADS, writers=None, prefetch=None):
+    """Обработка tasks конвейером
+    
+    read(task) -> data              поток ввода-вывода
+    work(task, data) -> result      процесс-воркер (функция верхнего уровня модуля)
+    write(task, result) -> final    поток ввода-вывода
+    on_result(task, final)          основной поток (прогресс, манифест)
+    
+    Ошибки по отдельным файлам стадии возвращают как часть результата.
+    Исключение стадии или падение воркера (BrokenProcessPool) прерывает
+    весь прогон: остальные задачи отменяются, пулы закрываются, исключение
+    пробрасывается вызывающему. Задачи обрабатываются в порядке tasks (крупные
+    файлы лучше ставить первыми). writers=1 - запись строго по одной
+    (например, в PackWriter).
+    """
+    if writers is None:
+        writers = io_threads
+    if prefetch is None:
+        prefetch = max(jobs, 1) * PREFETCH_PER_JOB
+    
+    asyncio.run(_pipeline(list(tasks), read, work, write, on_result,
+                          jobs, io_threads, writers, prefetch))
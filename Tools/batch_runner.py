@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Параллельная пакетная обработка файлов
+Общий планировщик для decrypt_ULTIMATE.py и других массовых утилит:
+- Крупные файлы запускаются первыми (не остаются в хвосте на одном ядре)
+- Мелкие файлы объединяются в пачки (меньше накладных расходов на задачу)
+- Ограниченное число задач в полете, свободный процесс берет следующую
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    import resource
+except ImportError:  # Windows - пиковую память не показываем
+    resource = None
+
+# Сколько пачек в среднем приходится на один процесс
+CHUNKS_PER_JOB = 8
+
+# Сколько пачек держим отправленными в пул на каждый процесс
+INFLIGHT_PER_JOB = 2
+
+
+def default_jobs():
+    """Число процессов по умолчанию - по числу ядер"""
+    return os.cpu_count() or 1
+
+
+def peak_rss_mb():
+    """Пиковая память (RSS) в МБ: (этот процесс, самый большой из завершенных воркеров)
+    
+    Для воркеров пула значение доступно после его закрытия. (None, None),
+    если платформа не дает этих данных.
+    """
+    if resource is None:
+        return None, None
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, children
+
+
+def current_rss_mb():
+    """Текущая память (RSS) этого процесса в МБ или None
+    
+    Linux - /proc/self/statm (дешево, можно звать часто). На других
+    платформах текущего значения нет - берется пиковое (ru_maxrss).
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss_mb()[0]
+
+
+def plan_chunks(tasks, jobs, chunks_per_job=CHUNKS_PER_JOB):
+    """Разбиение задач на пачки
+    
+    tasks - список пар (вес, задача), вес обычно размер файла в байтах.
+    Задачи сортируются по убыванию веса; тяжелые идут отдельными пачками,
+    легкие собираются в пачки примерно одинакового суммарного веса.
+    """
+    tasks = sorted(tasks, key=lambda t: t[0], reverse=True)
+    if not tasks:
+        return []
+    
+    total = sum(weight for weight, _ in tasks)
+    budget = max(total / max(jobs * chunks_per_job, 1), 1)
+    
+    chunks = []
+    current = []
+    current_weight = 0
+    for weight, task in tasks:
+        if weight >= budget:
+            chunks.append([task])
+            continue
+        current.append(task)
+        current_weight += weight
+        if current_weight >= budget:
+            chunks.append(current)
+            current = []
+            current_weight = 0
+    
+    if current:
+        chunks.append(current)
+    
+    return chunks
+
+
+def run_chunks(worker, chunks, jobs):
+    """Выполнение worker(chunk) для каждой пачки, результаты по мере готовности
+    
+    worker должен быть функцией верхнего уровня модуля (для pickle) и
+    возвращать список результатов пачки. При jobs <= 1 все выполняется
+    в текущем процессе без пула.
+    """
+    if jobs <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from worker(chunk)
+        return
+    
+    pending = iter(chunks)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        inflight = set()
+        
+        def submit_more():
+            while len(inflight) < jobs * INFLIGHT_PER_JOB:
+                chunk = next(pending, None)
+                if chunk is None:
+                    return
+                inflight.add(executor.submit(worker, chunk))
+        
+        submit_more()
+        while inflight:
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            inflight -= done
+            submit_more()
+            for future in done:
+                yield from future.result()
+
+
+class Progress:
+    """Сводный прогресс одной строкой вместо построчного вывода каждого файла"""
+    __slots__ = ('total', 'done', 'counts', 'errors', 'max_errors', 'tty', 'last_shown')
+    
+    def __init__(self, total, max_errors=10):
+        self.total = total
+        self.done = 0
+        self.counts = {}
+        self.errors = []
+        self.max_errors = max_errors
+        self.tty = sys.stdout.isatty()
+        self.last_shown = -1
+    
+    def update(self, name, status, ok, key=None):
+        """Учет результата одного файла (key - своя категория, например SKIPPED)"""
+        self.done += 1
+        if key is None:
+            key = 'OK' if ok else 'ERROR'
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if not ok and len(self.errors) < self.max_errors:
+            self.errors.append((name, status))
+        self.show()
+    
+    def count(self, key):
+        """Сколько файлов попало в категорию key"""
+        return self.counts.get(key, 0)
+    
+    def show(self):
+        """Строка прогресса (в терминале - на месте, иначе примерно каждые 10%)"""
+        percent = self.done * 100 // max(self.total, 1)
+        if self.tty:
+            line = f"\r⏳ [{self.done}/{self.total}] {percent}%"
+            for key, value in sorted(self.counts.items()):
+                line += f"  {key}: {value}"
+            sys.stdout.write(line)
+            if self.done == self.total:
+                sys.stdout.write("\n")
+            sys.stdout.flush()
+        elif percent // 10 != self.last_shown:
+            self.last_shown = percent // 10
+            print(f"⏳ [{self.done}/{self.total}] {percent}%")
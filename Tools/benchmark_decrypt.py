@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк расшифровки по стадиям на синтетическом корпусе
+Файлы DHGAMES генерируются обратной цепочкой (encrypt_data) с размерами
+от 1 КБ до 10 МБ (лог-равномерно, как в lua_backup: много мелких, мало крупных).
+Каждая стадия decrypt_file замеряется отдельно, результат - JSON для
+сравнения между коммитами (--compare старый.json). Строка batch - пачки
+воркеров (plan_chunks): XOR и XXTEA пачки одним decrypt_buffers_inplace.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import zlib
+import random
+import platform
+import argparse
+import tempfile
+import subprocess
+from io import BytesIO
+from pathlib import Path
+
+import decrypt_ULTIMATE as du
+from batch_runner import default_jobs, plan_chunks
+
+BENCH_VERSION = 1
+
+# Стадии decrypt_file в порядке выполнения
+STAGES = ['read', 'header', 'xor', 'key', 'xxtea', 'dhzames', 'zlib']
+
+KB = 1024
+MB = 1024 * 1024
+
+
+def random_bytes(rng, size):
+    """size случайных байт из rng (Random.randbytes есть только с Python 3.9)"""
+    return rng.getrandbits(8 * size).to_bytes(size, 'little')
+
+
+def make_payload(rng, size):
+    """Псевдо-байткод: токены из небольшого словаря + случайные байты
+    
+    Сжимается ZLIB примерно как настоящий байткод (в 3-5 раз).
+    """
+    vocab = [random_bytes(rng, rng.randint(4, 16)) for _ in range(256)]
+    parts = [b"\x1bLuaQ\x00\x01\x04\x04\x04\x08\x00"]
+    total = len(parts[0])
+    while total < size:
+        if rng.random() < 0.2:
+            part = random_bytes(rng, rng.randint(4, 64))
+        else:
+            part = b"".join(rng.choices(vocab, k=64))
+        parts.append(part)
+        total += len(part)
+    return b"".join(parts)[:size]
+
+
+def make_corpus(corpus_dir, count, min_size, max_size, seed):
+    """Синтетический корпус: [(путь, исходные байты)]"""
+    rng = random.Random(seed)
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    
+    files = []
+    for i in range(count):
+        size = int(math.exp(rng.uniform(math.log(min_size), math.log(max_size))))
+        plain = make_payload(rng, size)
+        filepath = corpus_dir / f"bench_{i:04d}.lua"
+        with open(filepath, 'wb') as f:
+            f.write(du.encrypt_data(plain))
+        files.append((filepath, plain))
+    return files
+
+
+def time_stages(filepath):
+    """Одна расшифровка как в decrypt_file, с замером каждой стадии: (результат, {стадия: сек})"""
+    times = {}
+    clock = time.perf_counter
+    
+    t = clock()
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    times['read'] = clock() - t
+    
+    t = clock()
+    if not data.startswith(b"DHGAMES"):
+        raise ValueError("No DHGAMES header")
+    encrypted = data[7:]
+    times['header'] = clock() - t
+    
+    t = clock()
+    xored = du.xor_data(encrypted)
+    times['xor'] = clock() - t
+    
+    t = clock()
+    key = du.generate_key()
+    times['key'] = clock() - t
+    
+    t = clock()
+    decrypted = du.xxtea_decrypt(xored, key)
+    times['xxtea'] = clock() - t
+    
+    t = clock()
+    if not decrypted.startswith(b"DHZAMES"):
+        raise ValueError("No DHZAMES")
+    payload = decrypted[7:]
+    times['dhzames'] = clock() - t
+    
+    t = clock()
+    result = zlib.decompress(payload)
+    times['zlib'] = clock() - t
+    
+    return result, times
+
+
+def time_stream(filepath):
+    """Потоковый путь (read_buffer + decrypt_buffer_to, как в main): (результат, сек)"""
+    clock = time.perf_counter
+    output = BytesIO()
+    t = clock()
+    buf = du.read_buffer(filepath)
+    written, status = du.decrypt_buffer_to(buf, output)
+    elapsed = clock() - t
+    if written is None:
+        raise ValueError(status)
+    return output.getvalue(), elapsed
+
+
+def time_batch(files, jobs):
+    """Пачки как в воркерах decrypt_ULTIMATE (plan_chunks на jobs процессов): [сек на пачку]"""
+    clock = time.perf_counter
+    chunks = plan_chunks([(os.path.getsize(filepath), (filepath, plain)) for filepath, plain in files], jobs)
+    seconds = []
+    for chunk in chunks:
+        t = clock()
+        bufs = [du.read_buffer(filepath) for filepath, _ in chunk]
+        outputs = []
+        for buf, (real_len, status) in zip(bufs, du.decrypt_buffers_inplace(bufs)):
+            output = BytesIO()
+            if real_len is None or du.decrypt_buffer_to(buf, output, real_len=real_len)[0] is None:
+                raise ValueError(status)
+            outputs.append(output.getvalue())
+        seconds.append(clock() - t)
+        for (filepath, plain), result in zip(chunk, outputs):
+            if result != plain:
+                raise ValueError(f"Wrong batch result: {filepath.name}")
+    return seconds
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу (values отсортированы)"""
+    if not values:
+        return 0.0
+    rank = max(int(math.ceil(p / 100 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(seconds, total_bytes):
+    """Сводка одной стадии: суммарное время, MB/s и латентность на файл (мс)"""
+    total = sum(seconds)
+    latencies = sorted(s * 1000 for s in seconds)
+    return {
+        'seconds': round(total, 6),
+        'mb_per_s': round(total_bytes / MB / total, 2) if total > 0 else None,
+        'p50_ms': round(percentile(latencies, 50), 4),
+        'p90_ms': round(percentile(latencies, 90), 4),
+        'p99_ms': round(percentile(latencies, 99), 4),
+        'max_ms': round(latencies[-1], 4) if latencies else 0.0,
+    }
+
+
+def git_commit():
+    """Текущий коммит (для сравнения результатов), None если не git"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(files, repeat, jobs):
+    """Замер всех файлов; для каждого файла и стадии берется лучший из repeat прогонов
+    
+    Для пачек (batch) - лучший из repeat прогонов всего корпуса по сумме.
+    """
+    stage_times = {stage: [] for stage in STAGES}
+    totals = []
+    streams = []
+    batches = min((time_batch(files, jobs) for _ in range(repeat)), key=sum)
+    
+    for filepath, plain in files:
+        best = None
+        best_stream = None
+        for _ in range(repeat):
+            result, times = time_stages(filepath)
+            if result != plain:
+                raise ValueError(f"Wrong result: {filepath.name}")
+            best = times if best is None else {s: min(best[s], times[s]) for s in STAGES}
+            
+            result, elapsed = time_stream(filepath)
+            if result != plain:
+                raise ValueError(f"Wrong stream result: {filepath.name}")
+            best_stream = elapsed if best_stream is None else min(best_stream, elapsed)
+        
+        for stage in STAGES:
+            stage_times[stage].append(best[stage])
+        totals.append(sum(best.values()))
+        streams.append(best_stream)
+    
+    return stage_times, totals, streams, batches
+
+
+def print_report(report, baseline=None):
+    """Таблица по стадиям (и ускорение относительно baseline)"""
+    print(f"{'Стадия':<14}{'MB/s':>10}{'p50 мс':>10}{'p90 мс':>10}{'p99 мс':>10}{'max мс':>10}"
+          + (f"{'x base':>9}" if baseline else ""))
+    print("-" * (64 + (9 if baseline else 0)))
+    
+    rows = list(report['stages'].items()) + [('total', report['total']), ('stream', report['stream'])]
+    if 'batch' in report:
+        rows.append(('batch', report['batch']))
+    base_rows = {}
+    if baseline:
+        base_rows = dict(baseline.get('stages', {}))
+        base_rows['total'] = baseline.get('total')
+        base_rows['stream'] = baseline.get('stream')
+        base_rows['batch'] = baseline.get('batch')
+    
+    for name, row in rows:
+        mbps = f"{row['mb_per_s']:.1f}" if row['mb_per_s'] else "-"
+        line = (f"{name:<14}{mbps:>10}{row['p50_ms']:>10.3f}{row['p90_ms']:>10.3f}"
+                f"{row['p99_ms']:>10.3f}{row['max_ms']:>10.3f}")
+        base = base_rows.get(name)
+        if baseline:
+            if base and base.get('seconds') and row['seconds']:
+                line += f"{base['seconds'] / row['seconds']:>8.2f}x"
+            else:
+                line += f"{'-':>9}"
+        print(line)
+
+
+def parse_args(argv=None):
+    """Аргументы командной строки"""
+    parser = argparse.ArgumentParser(
+        description="Бенчмарк стадий расшифровки (DHGAMES → XOR → XXTEA → DHZAMES → ZLIB)")
+    parser.add_argument("-n", "--count", type=int, default=60,
+                        help="число синтетических файлов (по умолчанию 60)")
+    parser.add_argument("--min-size", type=int, default=1 * KB,
+                        help="минимальный размер файла в байтах (по умолчанию 1 КБ)")
+    parser.add_argument("--max-size", type=int, default=10 * MB,
+                        help="максимальный размер файла в байтах (по умолчанию 10 МБ)")
+    parser.add_argument("--seed", type=int, default=1344,
+                        help="seed генератора (одинаковый корпус между запусками)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="прогонов на файл, берется лучший (по умолчанию 3)")
+    parser.add_argument("-j", "--jobs", type=int, default=default_jobs(),
+                        help="на сколько процессов делить корпус на пачки для batch "
+                             "(по умолчанию - по числу ядер, как decrypt_ULTIMATE)")
+    parser.add_argument("--corpus", default=None,
+                        help="папка для корпуса (по умолчанию - временная, удаляется)")
+    parser.add_argument("-o", "--output", default=None,
+                        help="сохранить результат в JSON")
+    parser.add_argument("--compare", default=None,
+                        help="JSON прошлого запуска для сравнения")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    print("=" * 80)
+    print("⏱️  БЕНЧМАРК РАСШИФРОВКИ ПО СТАДИЯМ")
+    print("=" * 80)
+    print()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = Path(args.corpus) if args.corpus else Path(tmp_dir)
+        
+        print(f"🧪 Генерация корпуса: {args.count} файлов, {args.min_size}..{args.max_size} байт (seed {args.seed})")
+        files = make_corpus(corpus_dir, args.count, args.min_size, args.max_size, args.seed)
+        
+        total_bytes = sum(os.path.getsize(filepath) for filepath, _ in files)
+        plain_bytes = sum(len(plain) for _, plain in files)
+        print(f"📁 Зашифровано: {total_bytes / MB:.1f} MB (исходных {plain_bytes / MB:.1f} MB)")
+        print(f"🔁 Прогонов на файл: {args.repeat}")
+        print()
+        
+        stage_times, totals, streams, batches = run_benchmark(files, args.repeat, args.jobs)
+    
+    report = {
+        'version': BENCH_VERSION,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': du.np.__version__ if du.np is not None else None,
+        'corpus': {
+            'files': len(files),
+            'seed': args.seed,
+            'min_size': args.min_size,
+            'max_size': args.max_size,
+            'encrypted_bytes': total_bytes,
+            'plain_bytes': plain_bytes,
+        },
+        'repeat': args.repeat,
+        # MB/s всех стадий считается от размера зашифрованных файлов
+        'throughput_basis': 'encrypted_bytes',
+        'stages': {stage: summarize(stage_times[stage], total_bytes) for stage in STAGES},
+        'total': summarize(totals, total_bytes),
+        'stream': summarize(streams, total_bytes),
+        # Латентность batch - на пачку, а не на файл
+        'batch': summarize(batches, total_bytes),
+        'jobs': args.jobs,
+    }
+    
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"📊 Сравнение с: {args.compare} (коммит {baseline.get('commit')})")
+        print()
+    
+    print_report(report, baseline)
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print()
+        print(f"💾 Результат: {args.output}")
+    
+    print("=" * 80)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Колоночный снимок таблицы конфига для сервера
+Формат: CFGSNAP1 | массивы колонок подряд (выравнивание 8) | JSON заголовок | футер
+- Числовые поля и bool - типизированные массивы NumPy (наименьший целый тип по диапазону)
+- Строки - смещения (int64, n + 1) в общую кучу UTF-8 байт таблицы
+- Вложенные таблицы и поля смешанных типов - JSON в той же куче (таблица
+  с нестроковыми ключами - списком пар, ключи JSON бывают только строками)
+- Пропущенное в записи поле - маска присутствия (uint8) у колонки
+Чтение через mmap: колонки - np.frombuffer поверх отображенного файла,
+строка таблицы и отдельные ячейки декодируются только при обращении.
+"""
+
+import os
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+SNAPSHOT_MAGIC = b"CFGSNAP1"
+SNAPSHOT_SUFFIX = ".snap"
+SNAPSHOT_VERSION = 1
+
+# Футер: смещение заголовка, размер заголовка, сигнатура (как в lua_pack)
+_FOOTER = struct.Struct('<QQ8s')
+
+# Целые типы по возрастанию: берется первый, в который помещается диапазон колонки
+_INT_DTYPES = ('<i1', '<i2', '<i4', '<i8')
+
+# Колонка ключей записи
+KEY_COLUMN = '__key__'
+
+# Таблица с нестроковыми ключами в JSON: {"__pairs__": [[ключ, значение], ...]}
+_PAIRS = '__pairs__'
+
+
+def _column_kind(values: List[Any]) -> str:
+    """Тип колонки по присутствующим значениям: bool, int, float, str или json"""
+    kinds = {value.__class__ for value in values}
+    if kinds == {bool}:
+        return 'bool'
+    if kinds == {int}:
+        return 'int'
+    if kinds and kinds <= {int, float}:
+        return 'float'
+    if kinds == {str}:
+        return 'str'
+    return 'json'
+
+
+def _json_value(value: Any) -> Any:
+    """Значение для JSON без потери ключей: dict с нестроковыми ключами - списком пар"""
+    if value.__class__ is dict:
+        if all(key.__class__ is str for key in value):
+            return {key: _json_value(item) for key, item in value.items()}
+        return {_PAIRS: [[key, _json_value(item)] for key, item in value.items()]}
+    if value.__class__ is list:
+        return [_json_value(item) for item in value]
+    return value
+
+
+def _from_pairs(obj: Dict[str, Any]) -> Dict[Any, Any]:
+    """object_hook: список пар обратно в dict с исходными ключами"""
+    if len(obj) == 1 and _PAIRS in obj:
+        return {key: item for key, item in obj[_PAIRS]}
+    return obj
+
+
+def _int_dtype(values: List[int]) -> Optional[str]:
+    """Наименьший целый тип для значений (None - не помещается в int64)"""
+    low, high = min(values), max(values)
+    for dtype in _INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return None
+
+
+class SnapshotWriter:
+    """Запись снимка одной таблицы (через временный файл, как PackWriter)"""
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + '.tmp')
+        self.file = open(self.tmp_path, 'wb')
+        self.file.write(SNAPSHOT_MAGIC)
+        self.heap = bytearray()
+    
+    def _array(self, array: np.ndarray) -> List[int]:
+        """Записать массив с выравниванием 8 байт: [смещение, число элементов]"""
+        pad = -self.file.tell() % 8
+        if pad:
+            self.file.write(b'\0' * pad)
+        offset = self.file.tell()
+        self.file.write(array.tobytes())
+        return [offset, len(array)]
+    
+    def _strings(self, values: List[Any], encode) -> List[int]:
+        """Строки в кучу, в файл - массив смещений n + 1"""
+        heap = self.heap
+        offsets = np.empty(len(values) + 1, dtype='<i8')
+        offsets[0] = len(heap)
+        for i, value in enumerate(values):
+            if value is not None:
+                heap += encode(value)
+            offsets[i + 1] = len(heap)
+        return self._array(offsets)
+    
+    def column(self, name: str, values: List[Any]) -> Dict[str, Any]:
+        """Колонка из значений по строкам (None - поле отсутствует)"""
+        present = [value for value in values if value is not None]
+        kind = _column_kind(present)
+        spec = {'name': name, 'kind': kind}
+        
+        if kind == 'int':
+            dtype = _int_dtype(present)
+            if dtype is None:
+                kind = spec['kind'] = 'json'
+        
+        if kind in ('bool', 'int', 'float'):
+            dtype = {'bool': '|b1', 'float': '<f8'}.get(kind) or _int_dtype(present)
+            fill = False if kind == 'bool' else 0
+            spec['dtype'] = dtype
+            spec['data'] = self._array(np.array(
+                [fill if value is None else value for value in values], dtype=dtype))
+        elif kind == 'str':
+            spec['offsets'] = self._strings(values, lambda value: value.encode('utf-8'))
+        else:
+            spec['offsets'] = self._strings(values, lambda value: json.dumps(
+                _json_value(value), ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        
+        if len(present) < len(values):
+            spec['mask'] = self._array(np.array(
+                [value is not None for value in values], dtype='|u1'))
+        return spec
+    
+    def write_table(self, records: Dict[Any, Any]):
+        """Таблица {ключ: запись}: колонки - объединение полей записей
+        
+        Запись - dict полей; запись другого вида (список, число) хранится
+        одной колонкой __value__. Целые ключи сортируются - поиск по ключу
+        в загрузчике двоичный. Имя колонки - строка; если это не сам ключ
+        поля (число, или строка, чье имя занято), ключ хранится как field.
+        """
+        keys = list(records)
+        if all(key.__class__ is int for key in keys):
+            keys.sort()
+        rows = [records[key] for key in keys]
+        
+        # Исходный ключ поля -> имя колонки (10 и '10' - разные колонки)
+        fields = {}
+        names = set()
+        for row in rows:
+            for field in (row if isinstance(row, dict) else ('__value__',)):
+                if field not in fields:
+                    name = str(field)
+                    if name in names:
+                        name = f"{field.__class__.__name__}:{field}"
+                    names.add(name)
+                    fields[field] = name
+        
+        columns = []
+        for field, name in fields.items():
+            if name == '__value__':
+                values = [None if isinstance(row, dict) else row for row in rows]
+            else:
+                values = [row.get(field) if isinstance(row, dict) else None for row in rows]
+            spec = self.column(name, values)
+            if field.__class__ is not str or field != name:
+                spec['field'] = field
+            columns.append(spec)
+        
+        key_spec = self.column(KEY_COLUMN, keys)
+        heap_offset = self._array(np.frombuffer(bytes(self.heap), dtype='|u1'))
+        
+        header = json.dumps({
+            'version': SNAPSHOT_VERSION,
+            'rows': len(rows),
+            'sorted_keys': all(key.__class__ is int for key in keys),
+            'key': key_spec,
+            'columns': columns,
+            'heap': heap_offset,
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        header_offset = self.file.tell()
+        self.file.write(header)
+        self.file.write(_FOOTER.pack(header_offset, len(header), SNAPSHOT_MAGIC))
+    
+    def close(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+    
+    def abort(self):
+        """Бросить запись - битый снимок не остается на диске"""
+        self.file.close()
+        if self.tmp_path.exists():
+            os.remove(self.tmp_path)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def write_snapshot(path, records: Dict[Any, Any]):
+    """Снимок таблицы {ключ: запись} в файл"""
+    with SnapshotWriter(path) as writer:
+        writer.write_table(records)
+
+
+class Column:
+    """Колонка снимка: values - массив NumPy поверх mmap (числа) или None (строки/JSON)
+    
+    col[i] - значение ячейки (None, если поле в записи отсутствует),
+    field - ключ поля в записи (name или исходный нестроковый ключ).
+    """
+    __slots__ = ('name', 'field', 'kind', 'values', 'mask', 'offsets', 'heap')
+    
+    def __init__(self, reader: 'SnapshotReader', spec: Dict[str, Any]):
+        self.name = spec['name']
+        self.field = spec.get('field', self.name)
+        self.kind = spec['kind']
+        self.values = reader._array(spec['data'], spec['dtype']) if 'data' in spec else None
+        self.offsets = reader._array(spec['offsets'], '<i8') if 'offsets' in spec else None
+        self.mask = reader._array(spec['mask'], '|u1') if 'mask' in spec else None
+        self.heap = reader.heap
+    
+    def __len__(self):
+        if self.values is not None:
+            return len(self.values)
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, row: int) -> Any:
+        if self.mask is not None and not self.mask[row]:
+            return None
+        if self.values is not None:
+            value = self.values[row].item()
+            # Целые значения в колонке float - int, как в lua_data
+            if self.kind == 'float' and value.is_integer():
+                return int(value)
+            return value
+        start, end = self.offsets[row], self.offsets[row + 1]
+        text = str(self.heap[start:end], 'utf-8')
+        return text if self.kind == 'str' else json.loads(text, object_hook=_from_pairs)
+
+
+class SnapshotReader:
+    """Чтение снимка через mmap без десериализации
+    
+    columns - {имя: Column}, row(i) - запись как dict, find(key) - номер
+    строки по ключу. Массивы колонок ссылаются на отображенный файл:
+    пока они живы, mmap не закрывается (close() их не трогает).
+    """
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self.file = open(self.path, 'rb')
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # пустой файл
+            self.file.close()
+            raise ValueError(f"Not a snapshot file: {self.path}")
+        
+        size = len(self.mm)
+        if size < len(SNAPSHOT_MAGIC) + _FOOTER.size or self.mm[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError(f"Not a snapshot file: {self.path}")
+        
+        header_offset, header_size, magic = _FOOTER.unpack_from(self.mm, size - _FOOTER.size)
+        if magic != SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError(f"Broken snapshot footer: {self.path}")
+        
+        header = json.loads(self.mm[header_offset:header_offset + header_size].decode('utf-8'))
+        self.rows = header['rows']
+        self.sorted_keys = header['sorted_keys']
+        offset, count = header['heap']
+        self.heap = memoryview(self.mm)[offset:offset + count]
+        self.keys = Column(self, header['key'])
+        self.columns = {spec['name']: Column(self, spec) for spec in header['columns']}
+        self.key_index = None
+    
+    def _array(self, location: List[int], dtype: str) -> np.ndarray:
+        """Массив NumPy поверх mmap без копирования"""
+        offset, count = location
+        return np.frombuffer(self.mm, dtype=dtype, count=count, offset=offset)
+    
+    def __len__(self):
+        return self.rows
+    
+    def column(self, name: str) -> Column:
+        return self.columns[name]
+    
+    def row(self, index: int) -> Dict[str, Any]:
+        """Запись по номеру строки (без отсутствующих полей)"""
+        record = {}
+        for column in self.columns.values():
+            value = column[index]
+            if value is not None:
+                record[column.field] = value
+        if list(record) == ['__value__']:
+            return record['__value__']
+        return record
+    
+    def find(self, key: Any) -> Optional[int]:
+        """Номер строки по ключу записи (None - нет такого ключа)"""
+        if self.sorted_keys and self.keys.values is not None:
+            keys = self.keys.values
+            index = int(np.searchsorted(keys, key))
+            if index < len(keys) and keys[index] == key:
+                return index
+            return None
+        if self.key_index is None:
+            self.key_index = {self.keys[i]: i for i in range(self.rows)}
+        return self.key_index.get(key)
+    
+    def get(self, key: Any) -> Optional[Dict[str, Any]]:
+        """Запись по ключу"""
+        index = self.find(key)
+        return None if index is None else self.row(index)
+    
+    def close(self):
+        self.keys = None
+        self.columns = {}
+        if getattr(self, 'heap', None) is not None:
+            self.heap.release()
+            self.heap = None
+        try:
+            self.mm.close()
+        except BufferError:  # снаружи еще живы массивы колонок - закроется вместе с ними
+            pass
+        self.file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
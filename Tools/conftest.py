@@ -0,0 +1,114 @@
+"""
+Общие фикстуры тестов Tools
+Байткод собирается настоящим Lua 5.1 (lupa) и переводится в формат клиента:
+size_t 4 байта, номера опкодов - по карте LuaOpcode, номер прототипа
+в CLOSURE - с единицы.
+"""
+
+import struct
+
+import pytest
+
+from improved_lua_decompiler import LuaOpcode
+
+# Порядок опкодов в стандартном Lua 5.1 (lopcodes.h)
+STANDARD_OPCODES = (
+    'MOVE', 'LOADK', 'LOADBOOL', 'LOADNIL', 'GETUPVAL', 'GETGLOBAL', 'GETTABLE',
+    'SETGLOBAL', 'SETUPVAL', 'SETTABLE', 'NEWTABLE', 'SELF', 'ADD', 'SUB', 'MUL',
+    'DIV', 'MOD', 'POW', 'UNM', 'NOT', 'LEN', 'CONCAT', 'JMP', 'EQ', 'LT', 'LE',
+    'TEST', 'TESTSET', 'CALL', 'TAILCALL', 'RETURN', 'FORLOOP', 'FORPREP',
+    'TFORLOOP', 'SETLIST', 'CLOSE', 'CLOSURE', 'VARARG',
+)
+
+CLIENT_HEADER = b'\x1bLuaQ\x00\x01\x04\x04\x04\x08\x00'
+
+
+class _Converter:
+    """Перевод чанка стандартного Lua 5.1 (любой size_t) в формат клиента"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 12
+        self.size_t = struct.Struct('<Q' if data[8] == 8 else '<I')
+        self.out = bytearray(CLIENT_HEADER)
+
+    def u32(self) -> int:
+        value, = struct.unpack_from('<I', self.data, self.pos)
+        self.pos += 4
+        return value
+
+    def copy(self, size: int) -> bytes:
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += size
+        self.out += chunk
+        return chunk
+
+    def string(self):
+        size, = self.size_t.unpack_from(self.data, self.pos)
+        self.pos += self.size_t.size
+        self.out += struct.pack('<I', size)
+        self.copy(size)
+
+    def counted(self, read_item):
+        count = self.u32()
+        self.out += struct.pack('<I', count)
+        for _ in range(count):
+            read_item()
+
+    def instruction(self):
+        ins = self.u32()
+        name = STANDARD_OPCODES[ins & 0x3F]
+        op = LuaOpcode.__members__.get(name)
+        if op is None or op > 0x3F:
+            raise ValueError(f"опкода {name} нет в карте клиента")
+        if name == 'CLOSURE':
+            # Номер прототипа у клиента - с единицы
+            ins += 1 << 14
+        self.out += struct.pack('<I', (ins & ~0x3F) | op)
+
+    def constant(self):
+        kind = self.copy(1)[0]
+        if kind == 1:
+            self.copy(1)
+        elif kind == 3:
+            self.copy(8)
+        elif kind == 4:
+            self.string()
+
+    def local(self):
+        self.string()
+        self.copy(8)
+
+    def function(self):
+        self.string()
+        self.copy(8 + 4)
+        self.counted(self.instruction)
+        self.counted(self.constant)
+        self.counted(self.function)
+        self.counted(lambda: self.copy(4))
+        self.counted(self.local)
+        self.counted(self.string)
+
+
+def convert_chunk(data: bytes) -> bytes:
+    """Байткод стандартного Lua 5.1 -> байткод с опкодами клиента"""
+    converter = _Converter(bytes(data))
+    converter.function()
+    return bytes(converter.out)
+
+
+@pytest.fixture(scope='session')
+def lua51():
+    lupa = pytest.importorskip('lupa.lua51')
+    return lupa.LuaRuntime(encoding=None)
+
+
+@pytest.fixture
+def compile_lua(lua51):
+    """compile_lua(source) -> байткод клиента (глобальные имена недоступны:
+    GETGLOBAL в карте опкодов клиента нет)"""
+    dump = lua51.eval('function(source) return string.dump(assert(loadstring(source))) end')
+
+    def compile_source(source: str) -> bytes:
+        return convert_chunk(dump(source.encode()))
+    return compile_source
@@ -1,65 +1,340 @@
 #!/usr/bin/env python3
 """
-Массовая декомпиляция всех файлов продвинутым декомпилятором
+Массовая декомпиляция всех файлов в пуле процессов
+Вход и выход - папка или пак-файл .pack (см. lua_pack.py)
+- Декомпилятор на выбор: improved (ImprovedLuaDecompiler) или advanced (старый LuaDecompiler)
+- Файлы по убыванию размера: тяжелые запускаются первыми и идут отдельными задачами
+- Свободный процесс сам берет следующую пачку из общей очереди (мелкие пачки - ровный хвост)
+- Гигантские файлы (от --split-size, от двух функций в главной) - по одному, их
+  вложенные функции делят все процессы
+- --compress: код сжимается (gzip, xz, bz2) в тех же воркерах, что декомпилируют
+- В конце - скорость каждого процесса и самые долгие файлы
 """
 
+import os
+import sys
+import time
+import heapq
+import argparse
 from pathlib import Path
-from advanced_decompiler import decompile_file
+import advanced_decompiler
+import improved_lua_decompiler
+from improved_lua_decompiler import BUDGET_STATUS
+from lua_chunk import main_protos
+from lua_pack import (PackWriter, is_pack_path, lua_exists, list_tree, read_lua,
+                      COMPRESSIONS, compressed_name, open_compressed, compress_bytes,
+                      remove_other_formats)
+from batch_runner import default_jobs, plan_chunks, run_chunks, peak_rss_mb, Progress
+from async_pipeline import IO_THREADS, make_parent_dirs, run_pipeline
 
-def main():
+# Декомпиляторы: имя → decompile_data(data) -> (code, status)
+ENGINES = {
+    'improved': improved_lua_decompiler.decompile_data,
+    'advanced': advanced_decompiler.decompile_data,
+}
+
+# Пачек на процесс: больше, чем в batch_runner - хвост из мелких пачек
+# разбирают освободившиеся процессы, пока идут тяжелые файлы
+CHUNKS_PER_JOB = 32
+
+# Сколько самых долгих файлов показать в конце
+SLOWEST_FILES = 10
+
+def _decompile_chunk(chunk):
+    """Пачка файлов в процессе-воркере: [(rel_path, status, ok, data, seconds, pid, size)]
+    
+    Если output_file is None (запись в пак), код возвращается в data (UTF-8),
+    иначе пишется в файл прямо в воркере и data = None. improved пишет в
+    файл потоково (write_decompiled); jobs > 1 - вложенные функции файла
+    выводятся в своем пуле процессов (только из основного процесса).
+    budget - Budget для improved, compression - сжатие кода (None - без сжатия),
+    и в файл, и в data.
+    """
+    pid = os.getpid()
+    results = []
+    for filepath, output_file, rel_path, engine, jobs, budget, compression in chunk:
+        improved_lua_decompiler.set_budget(budget)
+        started = time.perf_counter()
+        try:
+            data = read_lua(filepath)
+        except Exception as e:
+            results.append((rel_path, str(e), False, None, 0.0, pid, 0))
+            continue
+        size = len(data)
+        
+        if output_file is not None and engine == 'improved':
+            ok, status = improved_lua_decompiler.write_decompiled(data, output_file, jobs=jobs,
+                                                                  compression=compression)
+            results.append((rel_path, status, ok, None, time.perf_counter() - started, pid, size))
+            continue
+        
+        if engine == 'improved':
+            code, status = improved_lua_decompiler.decompile_data(data, jobs=jobs)
+        else:
+            code, status = ENGINES[engine](data)
+        del data
+        payload = None
+        if code:
+            if output_file is None:
+                payload = compress_bytes(code.encode('utf-8'), compression)
+            else:
+                remove_other_formats(output_file, compression)
+                with open_compressed(compressed_name(output_file, compression), compression) as f:
+                    f.write(code)
+        results.append((rel_path, status, bool(code), payload, time.perf_counter() - started, pid, size))
+    
+    return results
+
+def _splittable(filepath) -> bool:
+    """Делить ли гигантский файл: у главной функции хотя бы два прототипа
+    
+    Иначе render_nested ничего не делает, и файл, идущий по одному, только
+    держал бы остальные процессы без работы. Нечитаемый файл - в общий пул,
+    ошибку покажет обычная обработка.
+    """
+    try:
+        return len(main_protos(read_lua(filepath))) >= 2
+    except Exception:
+        return False
+
+def _async_read(task):
+    """Асинхронный режим, поток ввода-вывода: байткод (data, ошибка)
+    
+    bytes, а не срез пака из read_lua: данные уходят в процесс-воркер.
+    """
+    try:
+        return bytes(read_lua(task[0])), None
+    except Exception as e:
+        return None, str(e)
+
+def _async_decompile(task, data):
+    """Асинхронный режим, процесс-воркер: (code, status, seconds, pid, size)
+    
+    code - уже байты UTF-8, сжатые по task[4]: потокам записи остается
+    только положить их на диск или в пак. seconds - только декомпиляция
+    (чтение идет в потоках ввода-вывода), как в _decompile_chunk.
+    """
+    pid = os.getpid()
+    data, error = data
+    if data is None:
+        return None, error, 0.0, pid, 0
+    improved_lua_decompiler.set_budget(task[3])
+    started = time.perf_counter()
+    code, status = ENGINES[task[2]](data)
+    if code:
+        code = compress_bytes(code.encode('utf-8'), task[4])
+    return code, status, time.perf_counter() - started, pid, len(data)
+
+def parse_args(argv=None):
+    """Аргументы командной строки"""
+    parser = argparse.ArgumentParser(description="Массовая декомпиляция Lua байткода")
+    parser.add_argument("input", nargs="?", default="decrypted_lua_FINAL",
+                        help="папка или .pack с байткодом (по умолчанию decrypted_lua_FINAL)")
+    parser.add_argument("output", nargs="?", default="decompiled_lua_READABLE",
+                        help="папка или файл .pack для результата (по умолчанию decompiled_lua_READABLE)")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="improved",
+                        help="декомпилятор: improved (по умолчанию) или advanced (старый)")
+    parser.add_argument("--async-io", action="store_true",
+                        help="асинхронный конвейер: чтение и запись в потоках, декомпиляция в процессах")
+    parser.add_argument("-j", "--jobs", type=int, default=default_jobs(),
+                        help="число процессов (по умолчанию - по числу ядер)")
+    parser.add_argument("--io-threads", type=int, default=IO_THREADS,
+                        help=f"потоков чтения/записи для --async-io (по умолчанию {IO_THREADS})")
+    parser.add_argument("--split-size", type=float,
+                        default=improved_lua_decompiler.PARALLEL_MIN_SIZE / 1024 / 1024,
+                        help="файлы от этого размера (MB) делятся по вложенным функциям между "
+                             "всеми процессами, если их больше одной (только improved, 0 - не делить)")
+    parser.add_argument("--compress", choices=['none'] + sorted(COMPRESSIONS), default='none',
+                        help="сжатие кода в воркерах: none (по умолчанию), gzip, xz или bz2 "
+                             "(x.lua.gz и т.д., утилиты читают через lua_pack.read_lua)")
+    improved_lua_decompiler.add_budget_arguments(parser)
+    return parser.parse_args(argv)
+
+def print_worker_stats(workers, slowest, wall_time):
+    """Скорость каждого процесса и самые долгие файлы
+    
+    workers - {pid: [файлов, байт, секунд]}, slowest - [(секунд, rel_path, байт)].
+    Файл дольше половины всего прогона - узкое место: пока он идет,
+    остальные процессы уже простаивают.
+    """
+    print()
+    print("⚙️  Процессы:")
+    for number, (pid, (files, size, seconds)) in enumerate(
+            sorted(workers.items(), key=lambda item: item[1][2], reverse=True), 1):
+        rate = size / 1024 / 1024 / seconds if seconds else 0.0
+        print(f"   #{number} (pid {pid}): {files} файлов, {size / 1024 / 1024:.1f} MB "
+              f"за {seconds:.1f} с ({rate:.2f} MB/s)")
+    
+    if slowest:
+        print()
+        print("🐢 Самые долгие файлы:")
+        for seconds, rel_path, size in slowest:
+            share = seconds * 100 / wall_time if wall_time else 0.0
+            print(f"   {seconds:7.2f} с  {share:5.1f}% прогона  {size / 1024:9.0f} KB  {rel_path}")
+        seconds, rel_path, _ = slowest[0]
+        if wall_time and seconds > wall_time / 2:
+            print(f"   ⚠️ {rel_path} держит прогон: больше половины всего времени в одном файле")
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.perf_counter()
+    
     print("=" * 80)
     print("🔥 МАССОВАЯ ДЕКОМПИЛЯЦИЯ - ПРОДВИНУТЫЙ ДЕКОМПИЛЯТОР")
     print("=" * 80)
     print()
     
-    input_dir = Path("decrypted_lua_FINAL")
-    output_dir = Path("decompiled_lua_READABLE")
+    input_dir = Path(args.input)
+    output_dir = Path(args.output)
     
-    if not input_dir.exists():
+    if not lua_exists(input_dir):
         print(f"❌ Папка не найдена: {input_dir}")
-        return
+        return 1
     
-    output_dir.mkdir(exist_ok=True)
+    pack = PackWriter(output_dir) if is_pack_path(output_dir) else None
+    if pack is None:
+        output_dir.mkdir(exist_ok=True)
     
-    lua_files = list(input_dir.rglob("*.lua"))
+    tree = list_tree(input_dir)
+    lua_files = [rel_path for rel_path, _ in tree]
     print(f"📁 Найдено файлов: {len(lua_files)}")
+    print(f"🔧 Декомпилятор: {args.engine}")
+    print(f"⚙️  Процессов: {args.jobs}")
+    print(f"🗜️  Сжатие: {args.compress}")
     print()
     
-    success = 0
-    failed = 0
+    if pack is None:
+        make_parent_dirs(output_dir / rel_path for rel_path in lua_files)
     
-    for i, lua_file in enumerate(lua_files, 1):
-        rel_path = lua_file.relative_to(input_dir)
-        output_file = output_dir / rel_path
-        
-        output_file.parent.mkdir(parents=True, exist_ok=True)
-        
-        code, status = decompile_file(lua_file)
+    progress = Progress(len(lua_files))
+    workers = {}
+    slowest = []
+    downgraded = []
+    budget = improved_lua_decompiler.budget_from_args(args)
+    compression = None if args.compress == 'none' else args.compress
+    
+    def update(rel_path, status, ok):
+        """Прогресс; файлы, упрощенные по Budget, - отдельной категорией"""
+        over_budget = ok and status.startswith(BUDGET_STATUS)
+        if over_budget:
+            downgraded.append((rel_path, status))
+        progress.update(rel_path, status, ok, BUDGET_STATUS if over_budget else None)
+    
+    def account(rel_path, seconds, pid, size):
+        """Статистика процессов и самые долгие файлы"""
+        stats = workers.setdefault(pid, [0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += size
+        stats[2] += seconds
+        entry = (seconds, rel_path, size)
+        if len(slowest) < SLOWEST_FILES:
+            heapq.heappush(slowest, entry)
+        else:
+            heapq.heappushpop(slowest, entry)
+    
+    def record(results):
+        """Результаты _decompile_chunk: прогресс, пак, статистика процессов"""
+        for rel_path, status, ok, data, seconds, pid, size in results:
+            update(rel_path, status, ok)
+            if data is not None:
+                pack.add(compressed_name(rel_path, compression), data)
+            account(rel_path, seconds, pid, size)
+    
+    def task(rel_path, jobs=1):
+        return (input_dir / rel_path, output_dir / rel_path if pack is None else None,
+                rel_path, args.engine, jobs, budget, compression)
+    
+    # Гигантские файлы - первыми и по одному: иначе один файл задает время всего прогона
+    giant = []
+    if args.engine == 'improved' and args.jobs > 1 and args.split_size > 0:
+        limit = args.split_size * 1024 * 1024
+        giant = sorted(((size, rel_path) for rel_path, size in tree
+                        if size >= limit and _splittable(input_dir / rel_path)), reverse=True)
+        split = {rel_path for _, rel_path in giant}
+        tree = [(rel_path, size) for rel_path, size in tree if rel_path not in split]
+    
+    try:
+        for _, rel_path in giant:
+            record(_decompile_chunk([task(rel_path, args.jobs)]))
         
-        if code:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(code)
+        if args.async_io:
+            def save(rel_path, code):
+                """Запись результата (байты из воркера) в пак или в файл (папки уже созданы)"""
+                if pack is not None:
+                    pack.add(compressed_name(rel_path, compression), code)
+                else:
+                    remove_other_formats(output_dir / rel_path, compression)
+                    with open(compressed_name(output_dir / rel_path, compression), 'wb') as f:
+                        f.write(code)
+            
+            def write(task, result):
+                code = result[0]
+                if code:
+                    try:
+                        save(task[1], code)
+                    except Exception as e:
+                        return (None, str(e)) + result[2:]
+                return result
+            
+            def done(task, result):
+                """Результат _async_decompile после записи: прогресс и статистика"""
+                code, status, seconds, pid, size = result
+                update(task[1], status, bool(code))
+                account(task[1], seconds, pid, size)
             
-            print(f"[{i}/{len(lua_files)}] ✅ {rel_path}")
-            success += 1
+            # Крупные файлы первыми; в пак пишет один писатель
+            tasks = [(input_dir / rel_path, rel_path, args.engine, budget, compression)
+                     for rel_path, _ in sorted(tree, key=lambda t: t[1], reverse=True)]
+            run_pipeline(tasks, _async_read, _async_decompile, write, done, args.jobs, io_threads=args.io_threads, writers=1 if pack is not None else None)
         else:
-            print(f"[{i}/{len(lua_files)}] ❌ {rel_path} - {status[:50]}")
-            failed += 1
+            tasks = [(size, task(rel_path)) for rel_path, size in tree]
+            chunks = plan_chunks(tasks, args.jobs, CHUNKS_PER_JOB)
+            record(run_chunks(_decompile_chunk, chunks, args.jobs))
+    except BaseException:
+        if pack is not None:
+            pack.abort()
+        raise
+    if pack is not None:
+        pack.close()
+    
+    wall_time = time.perf_counter() - started
+    
+    if progress.errors:
+        print()
+        for rel_path, status in progress.errors:
+            # От traceback - последняя строка
+            lines = status.strip().splitlines() or [status]
+            print(f"❌ {rel_path}: {lines[-1][:100]}")
+    if downgraded:
+        print()
+        for rel_path, status in downgraded[:10]:
+            print(f"⏳ {rel_path}: {status[:100]}")
+    
+    if workers:
+        print_worker_stats(workers, sorted(slowest, reverse=True), wall_time)
     
     print()
     print("=" * 80)
-    print(f"✅ Успешно: {success}")
-    print(f"❌ Ошибок: {failed}")
+    print(f"✅ Успешно: {progress.count('OK')}")
+    if downgraded:
+        print(f"⏳ Упрощено по бюджету: {len(downgraded)} (функции - дампом констант)")
+    print(f"❌ Ошибок: {progress.count('ERROR')}")
     print(f"📁 Результат: {output_dir}")
+    print(f"⏱️  Время: {wall_time:.1f} с")
+    own_rss, worker_rss = peak_rss_mb()
+    if own_rss is not None:
+        print(f"💾 Пик памяти: {own_rss:.0f} MB (основной процесс), {worker_rss:.0f} MB (воркер)")
     print("=" * 80)
     
-    if success > 0:
+    if progress.count('OK') + len(downgraded) > 0:
         print("\n🎉 ДЕКОМПИЛЯЦИЯ ЗАВЕРШЕНА!")
         print("\nТеперь у вас есть читаемые Lua файлы с:")
         print("  - Всеми константами (строки, числа)")
         print("  - Структурой кода")
         print("  - Данными героев, предметов, навыков и т.д.")
         print("\nМожно анализировать и модифицировать игру!")
+    
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
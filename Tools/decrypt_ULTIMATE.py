@@ -8,8 +8,24 @@ import sys
 import zlib
 import struct
 import os
+import argparse
+import calendar
+import zipfile
+from io import BytesIO
+from collections import namedtuple
 from pathlib import Path
 
+from batch_runner import default_jobs, plan_chunks, run_chunks, Progress
+from file_manifest import (manifest_path, load_manifest, save_manifest, make_entry,
+                           stat_matches, bytes_hash, new_hasher, verify_entry)
+from lua_pack import PackWriter, is_pack_path
+from async_pipeline import IO_THREADS, make_parent_dirs, run_pipeline
+
+try:
+    import numpy as np
+except ImportError:  # NumPy не обязателен - есть медленный запасной путь
+    np = None
+
 # XOR таблица для данных (DAT_00fe7458)
 XOR_DATA_TABLE = bytes([
     0x3c, 0xb5, 0x3c, 0x7f, 0x83, 0x94, 0xba, 0x3b,
@@ -31,20 +47,91 @@ BASE_KEY = bytes([
     0x1a, 0xfb, 0xbd, 0xbb, 0x93, 0xb5, 0x83, 0xe7
 ])
 
+# Развернутое расписание индексов XOR_DATA_TABLE.
+# Логика из Ghidra: if (idx == 0x1c) idx = 7; else idx++;
+# То есть сначала идут байты 0..28, а дальше по кругу 7..28
+XOR_STREAM_HEAD = XOR_DATA_TABLE[:0x1d]
+XOR_STREAM_CYCLE = XOR_DATA_TABLE[7:0x1d]
+
+# Потолок кэша ключевого потока. После заголовка поток периодичен (цикл 7..28),
+# поэтому файлы длиннее XOR-ятся кусками по тому же кэшу (xor_keystream_blocks),
+# а воркер не держит до конца жизни поток по размеру самого большого файла
+XOR_KEYSTREAM_MAX = 4 << 20
+
+# Кэш ключевого потока - разворачивается один раз и растет до XOR_KEYSTREAM_MAX
+_xor_keystream = b''
+
+def xor_keystream(length):
+    """Ключевой поток XOR длиной length байт (не длиннее XOR_KEYSTREAM_MAX, кэш между файлами)"""
+    global _xor_keystream
+    
+    if length > XOR_KEYSTREAM_MAX:
+        raise ValueError(f"keystream longer than {XOR_KEYSTREAM_MAX} bytes, use xor_keystream_blocks")
+    if len(_xor_keystream) < length:
+        # Растем с запасом, чтобы не разворачивать поток заново на каждом файле
+        target = min(max(length, 2 * len(_xor_keystream)), XOR_KEYSTREAM_MAX)
+        cycles = -(-max(target - len(XOR_STREAM_HEAD), 0) // len(XOR_STREAM_CYCLE))
+        _xor_keystream = XOR_STREAM_HEAD + XOR_STREAM_CYCLE * cycles
+    
+    return memoryview(_xor_keystream)[:length]
+
+def xor_keystream_blocks(length):
+    """Ключевой поток для length байт кусками: пары (позиция, поток)
+    
+    Первый кусок - начало кэша, следующие - срезы того же кэша с фазы
+    цикла, на которую приходится их позиция.
+    """
+    keystream = xor_keystream(min(length, XOR_KEYSTREAM_MAX))
+    head = len(XOR_STREAM_HEAD)
+    period = len(XOR_STREAM_CYCLE)
+    pos = 0
+    while pos < length:
+        start = 0 if pos == 0 else head + (pos - head) % period
+        block = keystream[start:start + length - pos]
+        yield pos, block
+        pos += len(block)
+
 def xor_data(data):
-    """XOR данных с таблицей (индекс 0-27, потом 7-27, 7-27...)"""
-    result = bytearray(data)
-    idx = 0
-    for i in range(len(result)):
-        result[i] ^= XOR_DATA_TABLE[idx]
-        
-        # Логика из Ghidra: if (idx == 0x1c) idx = 7; else idx++;
-        if idx == 0x1c:  # 28
-            idx = 7
-        else:
-            idx += 1
+    """XOR данных с таблицей (индекс 0-28, потом 7-28, 7-28...)"""
+    length = len(data)
+    if length == 0:
+        return b''
+    
+    if np is None:
+        return bytes(xor_data_inplace(bytearray(data)))
     
-    return bytes(result)
+    result = np.empty(length, dtype=np.uint8)
+    source = np.frombuffer(data, dtype=np.uint8)
+    for pos, keystream in xor_keystream_blocks(length):
+        end = pos + len(keystream)
+        np.bitwise_xor(source[pos:end], np.frombuffer(keystream, dtype=np.uint8), out=result[pos:end])
+    return result.tobytes()
+
+# Размер блока для XOR на месте без NumPy
+XOR_INPLACE_BLOCK = 1 << 20
+
+def xor_data_inplace(buf, start=0):
+    """XOR на месте: buf[start:] ^= ключевой поток (без копий буфера)"""
+    length = len(buf) - start
+    if length <= 0:
+        return buf
+    
+    if np is not None:
+        view = np.frombuffer(buf, dtype=np.uint8, offset=start)
+        for pos, keystream in xor_keystream_blocks(length):
+            view[pos:pos + len(keystream)] ^= np.frombuffer(keystream, dtype=np.uint8)
+        return buf
+    
+    # Без NumPy: блоками, лишняя память - не больше одного блока
+    mv = memoryview(buf)
+    for pos, keystream in xor_keystream_blocks(length):
+        for offset in range(0, len(keystream), XOR_INPLACE_BLOCK):
+            block = mv[start + pos + offset:start + pos + offset + XOR_INPLACE_BLOCK]
+            size = len(block)
+            value = int.from_bytes(block, 'little') ^ int.from_bytes(keystream[offset:offset + size], 'little')
+            block[:] = value.to_bytes(size, 'little')
+    mv.release()
+    return buf
 
 def generate_key():
     """Генерация ключа (XOR базового ключа с таблицей)"""
@@ -64,63 +151,240 @@ def generate_key():
     
     return bytes(key)
 
-def xxtea_decrypt(data, key):
-    """XXTEA расшифровка"""
-    if len(data) < 8:
-        return data
-    
-    # Паддинг до кратности 4
+XXTEA_DELTA = 0x9E3779B9
+
+# Блоки от этого числа слов идут ровно 6 раундов (6 + 52 // n) с одинаковыми
+# суммами - их можно считать вместе, даже если длины разные
+XXTEA_LANE_MIN_WORDS = 53
+
+# Длины блоков одной группы различаются не больше чем во столько раз
+# (короткий блок простаивает, пока идут шаги длинного)
+XXTEA_LANE_SPREAD = 2
+
+# Группы меньше этого числа блоков выгоднее считать обычным циклом:
+# шаг NumPy дороже шага цикла Python, окупается только на многих блоках
+XXTEA_MIN_BATCH = 32
+
+def _xxtea_pad(data):
+    """Паддинг до кратности 4"""
     padding = (4 - (len(data) % 4)) % 4
     if padding > 0:
-        data = data + b'\x00' * padding
-    
-    # Конвертируем в uint32 массив
-    n = len(data) // 4
-    v = list(struct.unpack('<' + 'I' * n, data))
-    
-    # Ключ в uint32
-    k = list(struct.unpack('<4I', key[:16]))
-    
-    def MX(sum_val, y, z, p, e, k):
-        return ((z >> 5 ^ y << 2) + (y >> 3 ^ z << 4)) ^ ((sum_val ^ y) + (k[(p & 3) ^ e] ^ z))
-    
-    delta = 0x9E3779B9
+        data = bytes(data) + b'\x00' * padding
+    return data
+
+def _xxtea_decrypt_words(v, k):
+    """XXTEA расшифровка массива uint32 на месте (v - список или memoryview)"""
+    n = len(v)
     rounds = 6 + 52 // n
-    sum_val = (rounds * delta) & 0xFFFFFFFF
+    sum_val = (rounds * XXTEA_DELTA) & 0xFFFFFFFF
     
     y = v[0]
     while rounds > 0:
         e = (sum_val >> 2) & 3
+        # Ключ для каждого p & 3 считается один раз на раунд, MX развернут в цикл
+        kp = [k[i ^ e] for i in range(4)]
         for p in range(n - 1, 0, -1):
             z = v[p - 1]
-            v[p] = (v[p] - MX(sum_val, y, z, p, e, k)) & 0xFFFFFFFF
-            y = v[p]
+            mx = (((z >> 5) ^ (y << 2)) + ((y >> 3) ^ (z << 4))) ^ ((sum_val ^ y) + (kp[p & 3] ^ z))
+            y = v[p] = (v[p] - mx) & 0xFFFFFFFF
         
         z = v[n - 1]
-        v[0] = (v[0] - MX(sum_val, y, z, 0, e, k)) & 0xFFFFFFFF
-        y = v[0]
+        mx = (((z >> 5) ^ (y << 2)) + ((y >> 3) ^ (z << 4))) ^ ((sum_val ^ y) + (kp[0] ^ z))
+        y = v[0] = (v[0] - mx) & 0xFFFFFFFF
         
-        sum_val = (sum_val - delta) & 0xFFFFFFFF
+        sum_val = (sum_val - XXTEA_DELTA) & 0xFFFFFFFF
         rounds -= 1
     
-    # Конвертируем обратно
-    result = struct.pack('<' + 'I' * n, *v)
+    return v
+
+def _xxtea_lane_step(target, y, z, s, key, mx, t1, t2):
+    """Один шаг XXTEA по всем блокам сразу: target -= MX, y = target (буферы mx, t1, t2)"""
+    np.right_shift(z, 5, out=mx)
+    np.left_shift(y, 2, out=t1)
+    mx ^= t1
+    np.right_shift(y, 3, out=t1)
+    np.left_shift(z, 4, out=t2)
+    t1 ^= t2
+    mx += t1
+    np.bitwise_xor(y, s, out=t1)
+    np.bitwise_xor(key, z, out=t2)
+    t1 += t2
+    mx ^= t1
+    target -= mx
+    y[:] = target
+
+def _xxtea_decrypt_lanes(lanes, k):
+    """XXTEA расшифровка группы блоков разной длины, векторно по блокам
+    
+    lanes - массивы uint32 (n >= XXTEA_LANE_MIN_WORDS), расшифровываются на месте.
+    Блоки выровнены по концу в матрице (слово, блок): на шаге t все блоки
+    обрабатывают одну и ту же строку, у каждого это свое слово p = n - 1 - t.
+    Блок с n <= t уже прошел раунд и в шаге не участвует; блоки отсортированы
+    по убыванию длины, так что участвующие - всегда начало строки.
+    """
+    order = sorted(range(len(lanes)), key=lambda i: len(lanes[i]), reverse=True)
+    sizes = np.array([len(lanes[i]) for i in order])
+    count = len(order)
+    width = int(sizes[0])
     
-    # Последний uint32 содержит реальную длину
-    if n > 0:
-        real_len = v[-1]
-        if 0 < real_len < len(result):
-            result = result[:real_len]
+    v = np.zeros((width, count), dtype=np.uint32)
+    for column, i in enumerate(order):
+        v[width - sizes[column]:, column] = lanes[i]
+    
+    # active[t] - сколько блоков длиннее t (участвуют в шаге t)
+    active = np.searchsorted(-sizes, -np.arange(width + 1), side='left')
+    columns = np.arange(count)
+    y = v[width - sizes, columns]
+    last = v[width - 1]
     
+    rounds = 6
+    sum_val = (rounds * XXTEA_DELTA) & 0xFFFFFFFF
+    mx = np.empty(count, dtype=np.uint32)
+    tmp = np.empty(count, dtype=np.uint32)
+    tmp2 = np.empty(count, dtype=np.uint32)
+    while rounds > 0:
+        e = (sum_val >> 2) & 3
+        s = np.uint32(sum_val)
+        # Ключ k[p & 3 ^ e] по блокам для каждой фазы t & 3 (p = n - 1 - t)
+        keys = [np.array([k[((n - 1 - phase) & 3) ^ e] for n in sizes], dtype=np.uint32)
+                for phase in range(4)]
+        k0 = np.uint32(k[e])
+        for t in range(width):
+            row = width - 1 - t
+            done = active[t + 1]
+            # [0, done) - обычный шаг (z = v[p - 1]), [done, active[t]) - p == 0 (z = v[n - 1])
+            if done:
+                _xxtea_lane_step(v[row, :done], y[:done], v[row - 1, :done], s,
+                                 keys[t & 3][:done], mx[:done], tmp[:done], tmp2[:done])
+            if active[t] > done:
+                lo, hi = done, active[t]
+                _xxtea_lane_step(v[row, lo:hi], y[lo:hi], last[lo:hi], s,
+                                 k0, mx[lo:hi], tmp[lo:hi], tmp2[lo:hi])
+        
+        sum_val = (sum_val - XXTEA_DELTA) & 0xFFFFFFFF
+        rounds -= 1
+    
+    for column, i in enumerate(order):
+        lanes[i][:] = v[width - sizes[column]:, column]
+    return lanes
+
+def _xxtea_unpad(result, real_len):
+    """Последний uint32 содержит реальную длину"""
+    if 0 < real_len < len(result):
+        result = result[:real_len]
     return result
 
+def _lane_groups(sizes):
+    """Группы индексов блоков для _xxtea_decrypt_lanes (остальные - по одному)
+    
+    sizes - число слов блоков. Блоки идут по убыванию длины, в группу
+    попадают блоки не короче длинного / XXTEA_LANE_SPREAD. Возвращает
+    (группы, одиночные).
+    """
+    order = sorted((i for i, n in enumerate(sizes) if n >= XXTEA_LANE_MIN_WORDS),
+                   key=lambda i: sizes[i], reverse=True)
+    single = [i for i, n in enumerate(sizes) if n < XXTEA_LANE_MIN_WORDS]
+    groups = []
+    start = 0
+    while start < len(order):
+        end = start + 1
+        while end < len(order) and sizes[order[end]] * XXTEA_LANE_SPREAD >= sizes[order[start]]:
+            end += 1
+        if np is not None and end - start >= XXTEA_MIN_BATCH:
+            groups.append(order[start:end])
+        else:
+            single.extend(order[start:end])
+        start = end
+    return groups, single
+
+def xxtea_decrypt_batch(blocks, key):
+    """XXTEA расшифровка многих блоков за один вызов
+    
+    Блоки близкой длины (см. _lane_groups) считаются вместе в
+    _xxtea_decrypt_lanes, остальные - обычным циклом. Результаты - в порядке blocks.
+    """
+    k = list(struct.unpack('<4I', key[:16]))
+    results = list(blocks)
+    words = {}
+    for i, data in enumerate(blocks):
+        if len(data) >= 8:
+            data = _xxtea_pad(data)
+            words[i] = data
+    
+    indices = list(words)
+    groups, single = _lane_groups([len(words[i]) // 4 for i in indices])
+    for group in groups:
+        lanes = [np.frombuffer(words[indices[j]], dtype='<u4').copy() for j in group]
+        _xxtea_decrypt_lanes(lanes, k)
+        for j, lane in zip(group, lanes):
+            results[indices[j]] = _xxtea_unpad(lane.astype('<u4', copy=False).tobytes(), int(lane[-1]))
+    for j in single:
+        data = words[indices[j]]
+        n = len(data) // 4
+        v = _xxtea_decrypt_words(list(struct.unpack('<%dI' % n, data)), k)
+        results[indices[j]] = _xxtea_unpad(struct.pack('<%dI' % n, *v), v[-1])
+    
+    return results
+
+def xxtea_decrypt(data, key):
+    """XXTEA расшифровка"""
+    return xxtea_decrypt_batch([data], key)[0]
+
+def _xxtea_encrypt_words(v, k):
+    """XXTEA шифрование массива uint32 на месте (обратное к _xxtea_decrypt_words)"""
+    n = len(v)
+    rounds = 6 + 52 // n
+    sum_val = 0
+    
+    z = v[n - 1]
+    while rounds > 0:
+        sum_val = (sum_val + XXTEA_DELTA) & 0xFFFFFFFF
+        e = (sum_val >> 2) & 3
+        kp = [k[i ^ e] for i in range(4)]
+        for p in range(n - 1):
+            y = v[p + 1]
+            mx = (((z >> 5) ^ (y << 2)) + ((y >> 3) ^ (z << 4))) ^ ((sum_val ^ y) + (kp[p & 3] ^ z))
+            z = v[p] = (v[p] + mx) & 0xFFFFFFFF
+        
+        y = v[0]
+        mx = (((z >> 5) ^ (y << 2)) + ((y >> 3) ^ (z << 4))) ^ ((sum_val ^ y) + (kp[(n - 1) & 3] ^ z))
+        z = v[n - 1] = (v[n - 1] + mx) & 0xFFFFFFFF
+        
+        rounds -= 1
+    
+    return v
+
+def xxtea_encrypt(data, key):
+    """XXTEA шифрование (длина данных дописывается последним uint32, как ждет xxtea_decrypt)"""
+    length = len(data)
+    data = _xxtea_pad(data) + struct.pack('<I', length)
+    
+    n = len(data) // 4
+    k = list(struct.unpack('<4I', key[:16]))
+    v = _xxtea_encrypt_words(list(struct.unpack('<%dI' % n, data)), k)
+    return struct.pack('<%dI' % n, *v)
+
+def encrypt_data(lua, level=-1):
+    """Обратная цепочка: Lua → ZLIB → DHZAMES → XXTEA → XOR → DHGAMES"""
+    payload = b"DHZAMES" + zlib.compress(lua, level)
+    encrypted = xxtea_encrypt(payload, generate_key())
+    return b"DHGAMES" + xor_data(encrypted)
+
 def decrypt_file(filepath):
     """Расшифровка файла"""
     
     try:
         with open(filepath, 'rb') as f:
             data = f.read()
-        
+    except Exception as e:
+        return None, str(e)
+    
+    return decrypt_data(data)
+
+def decrypt_data(data):
+    """Расшифровка содержимого файла (уже прочитанного в память)"""
+    
+    try:
         # 1. Удаляем DHGAMES
         if not data.startswith(b"DHGAMES"):
             return None, "No DHGAMES header"
@@ -152,7 +416,471 @@ def decrypt_file(filepath):
     except Exception as e:
         return None, str(e)
 
-def main():
+# Размеры блоков потоковой распаковки ZLIB (вход/выход)
+ZLIB_STREAM_IN = 1 << 16
+ZLIB_STREAM_OUT = 1 << 18
+
+def _xxtea_decrypt_inplace(buf, start, key):
+    """XXTEA расшифровка buf[start:] на месте, возвращает реальную длину данных"""
+    length = len(buf) - start
+    if length < 8:
+        return length
+    
+    # Паддинг до кратности 4 (после XOR, как в xxtea_decrypt)
+    padding = (4 - (length % 4)) % 4
+    if padding > 0:
+        buf.extend(b'\x00' * padding)
+        length += padding
+    
+    k = list(struct.unpack('<4I', key[:16]))
+    
+    if sys.byteorder == 'little':
+        # Слова uint32 прямо поверх буфера - без списка из миллионов int
+        words = memoryview(buf)[start:].cast('I')
+        _xxtea_decrypt_words(words, k)
+        real_len = words[-1]
+        words.release()
+    else:
+        n = length // 4
+        v = _xxtea_decrypt_words(list(struct.unpack_from('<%dI' % n, buf, start)), k)
+        struct.pack_into('<%dI' % n, buf, start, *v)
+        real_len = v[-1]
+    
+    if 0 < real_len < length:
+        return real_len
+    return length
+
+def decrypt_buffers_inplace(bufs):
+    """XOR и XXTEA для пачки прочитанных файлов, на месте: [(длина данных или None, статус)]
+    
+    bufs - bytearray с содержимым файлов, данные после расшифровки -
+    buf[7:7 + длина]. XXTEA блоков близкой длины считается вместе
+    (_lane_groups, _xxtea_decrypt_lanes), остальных - по одному на месте.
+    """
+    key = generate_key()
+    k = list(struct.unpack('<4I', key[:16]))
+    results = [None] * len(bufs)
+    pending = []
+    for i, buf in enumerate(bufs):
+        # 1. Удаляем DHGAMES (просто смещение, без копии)
+        if not buf.startswith(b"DHGAMES"):
+            results[i] = (None, "No DHGAMES header")
+            continue
+        
+        # 2. XOR данных на месте
+        xor_data_inplace(buf, 7)
+        pending.append(i)
+    
+    # 3-4. XXTEA на месте
+    sizes = [(len(bufs[i]) - 7 + 3) // 4 if len(bufs[i]) - 7 >= 8 else 0 for i in pending]
+    groups, single = _lane_groups(sizes)
+    for group in groups:
+        lanes = []
+        for j in group:
+            buf = bufs[pending[j]]
+            buf.extend(b'\x00' * (-(len(buf) - 7) % 4))
+            lanes.append(np.frombuffer(buf, dtype='<u4', offset=7))
+        _xxtea_decrypt_lanes(lanes, k)
+        for j, lane in zip(group, lanes):
+            length = 4 * len(lane)
+            real_len = int(lane[-1])
+            results[pending[j]] = (real_len if 0 < real_len < length else length, "OK")
+        del lanes, lane
+    for j in single:
+        results[pending[j]] = (_xxtea_decrypt_inplace(bufs[pending[j]], 7, key), "OK")
+    
+    return results
+
+def decrypt_buffer_to(buf, output, hasher=None, real_len=None):
+    """Потоковая расшифровка прочитанного файла в открытый бинарный поток
+    
+    buf - bytearray с содержимым файла, расшифровывается на месте (XOR и XXTEA
+    без промежуточных копий), ZLIB распаковывается блоками прямо в output.
+    real_len - buf уже прошел decrypt_buffers_inplace (длина данных), остались
+    DHZAMES и ZLIB. hasher (hashlib) получает каждый записанный блок.
+    Возвращает (размер, статус).
+    """
+    try:
+        if real_len is None:
+            (real_len, status), = decrypt_buffers_inplace([buf])
+            if real_len is None:
+                return None, status
+        payload = memoryview(buf)[7:7 + real_len]
+        
+        # 5. Проверяем DHZAMES
+        if not payload[:7] == b"DHZAMES":
+            return None, f"No DHZAMES (got: {bytes(payload[:10]).hex()})"
+        
+        # 6. ZLIB потоком
+        decompressor = zlib.decompressobj()
+        written = 0
+        try:
+            for pos in range(7, len(payload), ZLIB_STREAM_IN):
+                chunk = payload[pos:pos + ZLIB_STREAM_IN]
+                while chunk and not decompressor.eof:
+                    out = decompressor.decompress(chunk, ZLIB_STREAM_OUT)
+                    output.write(out)
+                    if hasher is not None:
+                        hasher.update(out)
+                    written += len(out)
+                    chunk = decompressor.unconsumed_tail
+                if decompressor.eof:
+                    break
+            
+            out = decompressor.flush()
+            output.write(out)
+            if hasher is not None:
+                hasher.update(out)
+            written += len(out)
+            
+            if not decompressor.eof:
+                return None, "ZLIB error"
+        except zlib.error:
+            return None, "ZLIB error"
+        finally:
+            payload.release()
+        
+        return written, "OK"
+    
+    except Exception as e:
+        return None, str(e)
+
+def read_buffer(filepath):
+    """Чтение файла в bytearray (для расшифровки на месте)"""
+    with open(filepath, 'rb') as f:
+        buf = bytearray(os.fstat(f.fileno()).st_size)
+        size = f.readinto(buf)
+    del buf[size:]
+    return buf
+
+def decrypt_file_to(filepath, output_file, hasher=None, buf=None, real_len=None):
+    """Потоковая расшифровка файла в output_file (пиковая память ~ размер файла)
+    
+    Пишет во временный файл и переименовывает только при успехе, так что
+    битый результат не остается на диске. real_len - как в decrypt_buffer_to.
+    Возвращает (размер, статус).
+    """
+    try:
+        if buf is None:
+            buf = read_buffer(filepath)
+    except Exception as e:
+        return None, str(e)
+    
+    output_file = Path(output_file)
+    tmp_file = output_file.with_name(output_file.name + '.tmp')
+    try:
+        with open(tmp_file, 'wb') as output:
+            written, status = decrypt_buffer_to(buf, output, hasher, real_len)
+        if written is None:
+            os.remove(tmp_file)
+        else:
+            os.replace(tmp_file, output_file)
+    except Exception as e:
+        if tmp_file.exists():
+            os.remove(tmp_file)
+        return None, str(e)
+    
+    return written, status
+
+# Дата/время члена архива вместо mtime и его CRC32 из центрального каталога
+ZipStat = namedtuple('ZipStat', ['st_size', 'st_mtime_ns', 'crc'])
+
+# Открытые архивы в процессе-воркере (открываются один раз на процесс)
+_open_zips = {}
+
+def _zip_file(zip_path):
+    """ZipFile из кэша процесса"""
+    zf = _open_zips.get(zip_path)
+    if zf is None:
+        zf = _open_zips[zip_path] = zipfile.ZipFile(zip_path)
+    return zf
+
+def _zip_stat(info):
+    """Аналог os.stat для члена архива"""
+    mtime = calendar.timegm(info.date_time + (0, 0, 0))
+    return ZipStat(info.file_size, mtime * 1_000_000_000, info.CRC)
+
+# Папки скриптов cocos2d-x в APK: берется первая, в которой лежат все .lua
+# (иначе корень архива). Пути получаются те же, что у папки lua_backup
+ZIP_SCRIPT_ROOTS = ('assets/src', 'assets')
+
+def list_zip_lua(zip_path, root=None):
+    """Члены .lua в APK/zip: [(ZipInfo, rel_path)]
+    
+    root - префикс внутри архива (например assets/src), который отрезается
+    от путей. По умолчанию - папка скриптов APK (ZIP_SCRIPT_ROOTS) или корень
+    архива; общая папка самих .lua (например app/) не отрезается.
+    """
+    with zipfile.ZipFile(zip_path) as zf:
+        infos = [info for info in zf.infolist()
+                 if not info.is_dir() and info.filename.endswith('.lua')]
+    
+    if root is None:
+        root = ''
+        for candidate in ZIP_SCRIPT_ROOTS:
+            if infos and all(info.filename.startswith(candidate + '/') for info in infos):
+                root = candidate
+                break
+    
+    prefix = root.strip('/') + '/' if root.strip('/') else ''
+    return [(info, info.filename[len(prefix):]) for info in infos
+            if info.filename.startswith(prefix)]
+
+def read_zip_member(zip_path, name):
+    """Чтение члена архива потоком в bytearray (без распаковки на диск)"""
+    zf = _zip_file(zip_path)
+    info = zf.getinfo(name)
+    buf = bytearray(info.file_size)
+    with zf.open(info) as f:
+        view = memoryview(buf)
+        pos = 0
+        while pos < len(buf):
+            size = f.readinto(view[pos:])
+            if not size:
+                break
+            pos += size
+        view.release()
+    del buf[pos:]
+    return buf
+
+def _read_source(source):
+    """Вход - путь к файлу или пара (архив, имя члена)"""
+    if isinstance(source, tuple):
+        return read_zip_member(*source)
+    return read_buffer(source)
+
+def _decrypt_chunk(chunk):
+    """Расшифровка пачки файлов в процессе-воркере: [(rel_path, status, ok, key, entry)]
+    
+    Файлы пачки читаются все сразу: XOR и XXTEA идут одним
+    decrypt_buffers_inplace (блоки близкой длины - вместе), затем каждый
+    файл распаковывается потоком в свой output_file. Память - сумма пачки
+    (plan_chunks: тяжелые файлы идут по одному).
+    """
+    results = []
+    pending = []
+    for source, stat, output_file, rel_path, entry in chunk:
+        try:
+            buf = _read_source(source)
+        except Exception as e:
+            results.append((rel_path, str(e), False, None, None))
+            continue
+        
+        # Содержимое не изменилось (поменялся только mtime) - результат уже на диске
+        input_hash = bytes_hash(buf)
+        if entry is not None and entry.get('hash') == input_hash and output_file.exists():
+            new_entry = make_entry(stat, input_hash, entry.get('out_hash'))
+            results.append((rel_path, "Unchanged", True, 'SKIPPED', new_entry))
+            continue
+        pending.append((stat, output_file, rel_path, input_hash, buf))
+    
+    decrypted = decrypt_buffers_inplace([item[4] for item in pending])
+    for (stat, output_file, rel_path, input_hash, buf), (real_len, status) in zip(pending, decrypted):
+        if real_len is None:
+            results.append((rel_path, status, False, None, None))
+            continue
+        
+        # Потоковый режим: ZLIB пишется сразу в файл
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        hasher = new_hasher()
+        written, status = decrypt_file_to(None, output_file, hasher, buf, real_len)
+        
+        if written is None:
+            results.append((rel_path, status, False, None, None))
+            continue
+        
+        results.append((rel_path, status, True, None, make_entry(stat, input_hash, hasher.hexdigest())))
+    
+    return results
+
+def _decrypt_pack_chunk(chunk):
+    """Расшифровка пачки для записи в один архив: [(rel_path, status, ok, data)]
+    
+    XOR и XXTEA - одним decrypt_buffers_inplace на пачку, как в _decrypt_chunk.
+    """
+    results = []
+    pending = []
+    for source, rel_path in chunk:
+        try:
+            pending.append((rel_path, _read_source(source)))
+        except Exception as e:
+            results.append((rel_path, str(e), False, None))
+    
+    decrypted = decrypt_buffers_inplace([buf for _, buf in pending])
+    for (rel_path, buf), (real_len, status) in zip(pending, decrypted):
+        output = BytesIO()
+        if real_len is not None:
+            real_len, status = decrypt_buffer_to(buf, output, real_len=real_len)
+        result = output.getvalue() if real_len is not None else None
+        results.append((rel_path, status, result is not None, result))
+    
+    return results
+
+def _async_read(task):
+    """Асинхронный режим, поток ввода-вывода: чтение входа (buf, ошибка)"""
+    try:
+        return _read_source(task[0]), None
+    except Exception as e:
+        return None, str(e)
+
+def _async_decrypt(task, data):
+    """Асинхронный режим, процесс-воркер: расшифровка в память (status, ok, key, output, entry)"""
+    source, stat, output_file, rel_path, entry = task
+    buf, error = data
+    if buf is None:
+        return error, False, None, None, None
+    
+    # Содержимое не изменилось (поменялся только mtime) - результат уже на диске
+    input_hash = bytes_hash(buf)
+    if entry is not None and entry.get('hash') == input_hash and output_file.exists():
+        return "Unchanged", True, 'SKIPPED', None, make_entry(stat, input_hash, entry.get('out_hash'))
+    
+    output = BytesIO()
+    hasher = new_hasher()
+    written, status = decrypt_buffer_to(buf, output, hasher)
+    del buf
+    
+    if written is None:
+        return status, False, None, None, None
+    return status, True, None, output.getvalue(), make_entry(stat, input_hash, hasher.hexdigest())
+
+def _async_write(task, result):
+    """Асинхронный режим, поток ввода-вывода: запись результата (временный файл + переименование)"""
+    status, ok, key, output, entry = result
+    if output is None:
+        return result
+    
+    output_file = task[2]
+    tmp_file = output_file.with_name(output_file.name + '.tmp')
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(output)
+        os.replace(tmp_file, output_file)
+    except Exception as e:
+        if tmp_file.exists():
+            os.remove(tmp_file)
+        return str(e), False, None, None, None
+    
+    return status, ok, key, None, entry
+
+def _verify_chunk(chunk):
+    """Проверка пачки записей манифеста (ничего не пишет): [(rel_path, reason, ok)]"""
+    results = []
+    for source, output_file, rel_path, entry in chunk:
+        try:
+            input_hash = bytes_hash(_read_source(source)) if source is not None else None
+            reason = verify_entry(input_hash, output_file, entry)
+        except Exception as e:
+            reason = str(e)
+        results.append((rel_path, reason or "OK", reason is None))
+    return results
+
+def collect_sources(base_path, zip_root=None):
+    """Все входные .lua: [(rel_path, source, stat)] из папки или APK/zip архива"""
+    if base_path.is_file():
+        return [(rel_path, (str(base_path), info.filename), _zip_stat(info))
+                for info, rel_path in list_zip_lua(base_path, zip_root)]
+    
+    sources = []
+    for filepath in base_path.rglob("*.lua"):
+        sources.append((filepath.relative_to(base_path).as_posix(), filepath, filepath.stat()))
+    return sources
+
+def verify(sources, output_dir, jobs):
+    """Параллельная проверка манифеста: входы и результаты совпадают с записанными хешами"""
+    files = load_manifest(manifest_path(output_dir))
+    if not files:
+        print(f"❌ Манифест не найден: {manifest_path(output_dir)}")
+        return 1
+    
+    print(f"🔍 Проверка манифеста: {len(files)} файлов")
+    print()
+    
+    by_rel = {rel_path: source for rel_path, source, _ in sources}
+    tasks = []
+    for rel_path, entry in files.items():
+        tasks.append((entry.get('size', 0), (by_rel.get(rel_path), output_dir / rel_path, rel_path, entry)))
+    
+    progress = Progress(len(tasks))
+    for rel_path, reason, ok in run_chunks(_verify_chunk, plan_chunks(tasks, jobs), jobs):
+        progress.update(rel_path, reason, ok, None if ok else 'MISMATCH')
+    
+    # Файлы, которых еще нет в манифесте
+    new_files = [rel_path for rel_path in by_rel if rel_path not in files]
+    
+    if progress.errors:
+        print()
+        for rel_path, reason in progress.errors:
+            print(f"❌ {rel_path}: {reason}")
+    
+    print()
+    print("=" * 80)
+    print(f"✅ Совпадает: {progress.count('OK')}")
+    print(f"❌ Расхождений: {progress.count('MISMATCH')}")
+    print(f"🆕 Новых файлов (нет в манифесте): {len(new_files)}")
+    print("=" * 80)
+    
+    return 1 if progress.count('MISMATCH') else 0
+
+def _decrypt_collect(sources, jobs, add):
+    """Расшифровка в воркерах, add(rel_path, data) для каждого успешного файла"""
+    tasks = [(stat.st_size, (source, rel_path)) for rel_path, source, stat in sources]
+    progress = Progress(len(tasks))
+    for rel_path, status, ok, data in run_chunks(_decrypt_pack_chunk, plan_chunks(tasks, jobs), jobs):
+        progress.update(rel_path, status, ok)
+        if ok:
+            add(rel_path, data)
+    return progress
+
+def decrypt_to_zip(sources, output_file, jobs):
+    """Расшифровка в один архив (ZIP_DEFLATED) вместо дерева файлов"""
+    tmp_file = output_file.with_name(output_file.name + '.tmp')
+    try:
+        with zipfile.ZipFile(tmp_file, 'w', zipfile.ZIP_DEFLATED) as out:
+            progress = _decrypt_collect(sources, jobs, out.writestr)
+    except BaseException:
+        # Как PackWriter.abort: битый архив не остается на диске
+        if tmp_file.exists():
+            os.remove(tmp_file)
+        raise
+    os.replace(tmp_file, output_file)
+    
+    return progress
+
+def decrypt_to_pack(sources, output_file, jobs):
+    """Расшифровка в один пак-файл с индексом (см. lua_pack.py)"""
+    with PackWriter(output_file) as out:
+        progress = _decrypt_collect(sources, jobs, out.add)
+    
+    return progress
+
+def parse_args(argv=None):
+    """Аргументы командной строки"""
+    parser = argparse.ArgumentParser(
+        description="Расшифровка Lua файлов Idle Heroes (DHGAMES → XOR → XXTEA → DHZAMES → ZLIB)")
+    parser.add_argument("input", nargs="?", default="lua_backup",
+                        help="папка с зашифрованными .lua или APK/zip архив (по умолчанию lua_backup)")
+    parser.add_argument("output", nargs="?", default="decrypted_lua_FINAL",
+                        help="папка для результата, файл .zip или .pack (по умолчанию decrypted_lua_FINAL)")
+    parser.add_argument("--zip-root", default=None,
+                        help="папка с .lua внутри APK/zip (по умолчанию assets/src или assets, "
+                             "если все .lua там, иначе корень архива)")
+    parser.add_argument("-j", "--jobs", type=int, default=default_jobs(),
+                        help="число процессов (по умолчанию - по числу ядер)")
+    parser.add_argument("--force", action="store_true",
+                        help="игнорировать манифест и расшифровать все заново")
+    parser.add_argument("--verify", action="store_true",
+                        help="только проверить манифест (параллельно, без записи)")
+    parser.add_argument("--async-io", action="store_true",
+                        help="асинхронный конвейер: чтение и запись в потоках параллельно с расшифровкой "
+                             "(для сетевых и медленных дисков)")
+    parser.add_argument("--io-threads", type=int, default=IO_THREADS,
+                        help=f"потоков чтения/записи для --async-io (по умолчанию {IO_THREADS})")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    
     print("=" * 80)
     print("🎉 ФИНАЛЬНЫЙ ДЕКОДЕР - ОСНОВАН НА РЕВЕРС-ИНЖИНИРИНГЕ")
     print("=" * 80)
@@ -164,47 +892,101 @@ def main():
     print("=" * 80)
     print()
     
-    # Ищем все .lua файлы
-    base_path = Path(r"D:\idleheroes\idle-heroes-1-34-4\lua_files_from_device\lua_backup")
+    # Ищем все .lua файлы (в папке или прямо внутри APK/zip)
+    base_path = Path(args.input)
     
     if not base_path.exists():
         print(f"❌ Папка не найдена: {base_path}")
         return
     
-    lua_files = list(base_path.rglob("*.lua"))
-    print(f"📁 Найдено файлов: {len(lua_files)}")
-    print()
+    if base_path.is_file() and not zipfile.is_zipfile(base_path):
+        print(f"❌ Не папка и не APK/zip архив: {base_path}")
+        return
+    
+    output_dir = Path(args.output)
+    sources = collect_sources(base_path, args.zip_root)
     
-    success = 0
-    failed = 0
+    if args.verify:
+        return verify(sources, output_dir, args.jobs)
     
-    output_dir = Path(r"D:\idleheroes\idle-heroes-1-34-4\decrypted_lua_FINAL")
-    output_dir.mkdir(exist_ok=True)
+    print(f"📁 Найдено файлов: {len(sources)}")
+    print(f"⚙️  Процессов: {args.jobs}")
     
-    for filepath in lua_files:
-        result, status = decrypt_file(filepath)
+    # Один архив или пак на выходе: без манифеста, собирается целиком
+    if output_dir.suffix.lower() == '.zip' or is_pack_path(output_dir):
+        print()
+        if is_pack_path(output_dir):
+            progress = decrypt_to_pack(sources, output_dir, args.jobs)
+        else:
+            progress = decrypt_to_zip(sources, output_dir, args.jobs)
+        manifest_file = None
+        unchanged = 0
+    else:
+        output_dir.mkdir(parents=True, exist_ok=True)
         
-        if result:
-            # Сохраняем
-            rel_path = filepath.relative_to(base_path)
+        # Манифест прошлого запуска: нетронутые файлы пропускаем не читая
+        manifest_file = manifest_path(output_dir)
+        old_files = {} if args.force else load_manifest(manifest_file)
+        files = {}
+        
+        # Крупные файлы (monster.lua и т.п.) планируются первыми
+        tasks = []
+        for rel_path, source, stat in sources:
             output_file = output_dir / rel_path
-            output_file.parent.mkdir(parents=True, exist_ok=True)
+            entry = old_files.get(rel_path)
             
-            with open(output_file, 'wb') as f:
-                f.write(result)
+            if (stat_matches(entry, stat) and output_file.exists()
+                    and entry.get('crc') == getattr(stat, 'crc', None)):
+                files[rel_path] = entry
+                continue
             
-            print(f"✅ {rel_path}")
-            success += 1
-        else:
-            if failed < 10:  # Показываем только первые 10 ошибок
-                print(f"❌ {filepath.name}: {status}")
-            failed += 1
+            tasks.append((stat.st_size, (source, stat, output_file, rel_path, entry)))
+        
+        unchanged = len(sources) - len(tasks)
+        print(f"♻️  Без изменений (пропущено): {unchanged}")
+        print()
+        
+        progress = Progress(len(tasks))
+        
+        def on_result(task, result):
+            status, ok, key, _, entry = result
+            progress.update(task[3], status, ok, key)
+            if entry is not None:
+                files[task[3]] = entry
+        
+        try:
+            if args.async_io:
+                # Папки создаются заранее одним проходом, дальше только чтение/запись файлов
+                make_parent_dirs(task[2] for _, task in tasks)
+                ordered = [task for _, task in sorted(tasks, key=lambda t: t[0], reverse=True)]
+                run_pipeline(ordered, _async_read, _async_decrypt, _async_write, on_result,
+                             args.jobs, io_threads=args.io_threads)
+            else:
+                for rel_path, status, ok, key, entry in run_chunks(_decrypt_chunk, plan_chunks(tasks, args.jobs), args.jobs):
+                    progress.update(rel_path, status, ok, key)
+                    if entry is not None:
+                        files[rel_path] = entry
+        finally:
+            # Сохраняем даже при прерывании - уже сделанное не придется повторять
+            save_manifest(manifest_file, files)
+    
+    success = progress.count('OK')
+    failed = progress.count('ERROR')
+    unchanged += progress.count('SKIPPED')
+    
+    if progress.errors:
+        print()
+        for rel_path, status in progress.errors:  # Показываем только первые 10 ошибок
+            print(f"❌ {rel_path}: {status}")
     
     print()
     print("=" * 80)
     print(f"✅ Успешно: {success}")
+    print(f"♻️  Без изменений: {unchanged}")
     print(f"❌ Ошибок: {failed}")
     print(f"📁 Результат: {output_dir}")
+    if manifest_file:
+        print(f"📋 Манифест: {manifest_file}")
     print("=" * 80)
     
     if success > 0:
@@ -212,4 +994,4 @@ def main():
         print("\nТеперь у вас есть все конфиги игры в читаемом виде!")
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
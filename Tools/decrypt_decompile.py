@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Сквозная обработка: расшифровка + декомпиляция в одном процессе
+Байткод после decrypt_ULTIMATE сразу передается в ImprovedLuaDecompiler,
+без промежуточной папки decrypted_lua_FINAL (ее запись - по желанию).
+С --compress код сжимается в тех же воркерах, на лету (x.lua → x.lua.gz).
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+from batch_runner import default_jobs, plan_chunks, run_chunks, peak_rss_mb, Progress
+from decrypt_ULTIMATE import decrypt_data
+from improved_lua_decompiler import (decompile_data, write_decompiled, write_errors_log, add_timings,
+                                     set_gc_policy, GC_POLICIES, set_budget, add_budget_arguments,
+                                     budget_from_args, BUDGET_STATUS)
+from lua_pack import PackWriter, is_pack_path, COMPRESSIONS, compressed_name, compress_bytes
+
+
+def _pipeline_chunk(chunk):
+    """Пачка файлов в процессе-воркере: [(rel_path, status, ok, data, timings)]
+    
+    Если output_file is None (запись в пак), код возвращается в data (UTF-8,
+    сжатый при compression), иначе пишется в файл прямо в воркере и data = None.
+    timings - время декомпиляции файла по стадиям (None, если до нее не дошло).
+    """
+    results = []
+    for filepath, output_file, bytecode_file, rel_path, gc_policy, budget, compression in chunk:
+        set_gc_policy(gc_policy)
+        set_budget(budget)
+        try:
+            with open(filepath, 'rb') as f:
+                data = f.read()
+        except Exception as e:
+            results.append((rel_path, str(e), False, None, None))
+            continue
+        
+        # 1. Расшифровка в памяти
+        bytecode, status = decrypt_data(data)
+        del data
+        if bytecode is None:
+            results.append((rel_path, f"Decrypt: {status}", False, None, None))
+            continue
+        
+        # Промежуточный байткод - только если попросили
+        if bytecode_file is not None:
+            bytecode_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(bytecode_file, 'wb') as f:
+                f.write(bytecode)
+        
+        # 2. Декомпиляция тех же байтов
+        timings = {}
+        if output_file is None:
+            code, status = decompile_data(bytecode, timings)
+            del bytecode
+            if code is None:
+                results.append((rel_path, status, False, None, timings))
+            else:
+                results.append((rel_path, status, True,
+                                compress_bytes(code.encode('utf-8'), compression), timings))
+            continue
+        
+        # В файл - потоковой записью, без текста всего файла в памяти
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        ok, status = write_decompiled(bytecode, output_file, timings, compression=compression)
+        del bytecode
+        results.append((rel_path, status, ok, None, timings))
+    
+    return results
+
+
+def parse_args(argv=None):
+    """Аргументы командной строки"""
+    parser = argparse.ArgumentParser(
+        description="Расшифровка и декомпиляция Lua файлов Idle Heroes за один проход")
+    parser.add_argument("input", nargs="?", default="lua_backup",
+                        help="папка с зашифрованными .lua (по умолчанию lua_backup)")
+    parser.add_argument("output", nargs="?", default="decompiled_lua_IMPROVED",
+                        help="папка или файл .pack для декомпилированного кода (по умолчанию decompiled_lua_IMPROVED)")
+    parser.add_argument("--bytecode-out", default=None,
+                        help="дополнительно сохранить расшифрованный байткод в эту папку")
+    parser.add_argument("-j", "--jobs", type=int, default=default_jobs(),
+                        help="число процессов (по умолчанию - по числу ядер)")
+    parser.add_argument("--gc-policy", choices=GC_POLICIES, default='none',
+                        help="принудительная сборка мусора в декомпиляторе: none (по умолчанию), "
+                             "file - после файла, legacy - после каждой функции (для сравнения)")
+    parser.add_argument("--compress", choices=['none'] + sorted(COMPRESSIONS), default='none',
+                        help="сжатие кода в воркерах: none (по умолчанию), gzip, xz или bz2 "
+                             "(x.lua.gz и т.д., утилиты читают через lua_pack.read_lua)")
+    add_budget_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.perf_counter()
+    
+    print("=" * 80)
+    print("🔥 РАСШИФРОВКА + ДЕКОМПИЛЯЦИЯ ЗА ОДИН ПРОХОД")
+    print("=" * 80)
+    print()
+    
+    base_path = Path(args.input)
+    if not base_path.exists():
+        print(f"❌ Папка не найдена: {base_path}")
+        return 1
+    
+    output_dir = Path(args.output)
+    pack = None
+    if is_pack_path(output_dir):
+        pack = PackWriter(output_dir)
+        log_file = output_dir.with_name(output_dir.stem + "_errors.log")
+    else:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        log_file = output_dir / "decompilation_errors.log"
+    bytecode_dir = Path(args.bytecode_out) if args.bytecode_out else None
+    budget = budget_from_args(args)
+    compression = None if args.compress == 'none' else args.compress
+    
+    lua_files = list(base_path.rglob("*.lua"))
+    print(f"📁 Найдено файлов: {len(lua_files)}")
+    print(f"⚙️  Процессов: {args.jobs}")
+    print(f"🧹 Сборка мусора: {args.gc_policy}")
+    print(f"🗜️  Сжатие: {args.compress}")
+    print()
+    
+    tasks = []
+    for filepath in lua_files:
+        rel_path = filepath.relative_to(base_path)
+        output_file = output_dir / rel_path if pack is None else None
+        bytecode_file = bytecode_dir / rel_path if bytecode_dir else None
+        tasks.append((filepath.stat().st_size,
+                      (filepath, output_file, bytecode_file, rel_path, args.gc_policy, budget, compression)))
+    
+    progress = Progress(len(tasks))
+    errors = []
+    downgraded = []
+    stage_times = {}
+    try:
+        for rel_path, status, ok, data, timings in run_chunks(_pipeline_chunk, plan_chunks(tasks, args.jobs), args.jobs):
+            # Часть функций не уложилась в Budget - файл есть, но упрощен
+            over_budget = ok and status.startswith(BUDGET_STATUS)
+            progress.update(rel_path, status, ok, BUDGET_STATUS if over_budget else None)
+            if timings:
+                add_timings(stage_times, timings)
+            if over_budget:
+                downgraded.append((str(rel_path), status))
+            if not ok:
+                errors.append((str(rel_path), status))
+            elif data is not None:
+                pack.add(compressed_name(rel_path, compression), data)
+    except BaseException:
+        if pack is not None:
+            pack.abort()
+        raise
+    if pack is not None:
+        pack.close()
+    
+    if errors or downgraded:
+        write_errors_log(log_file, errors + downgraded)
+        print()
+        for rel_path, status in progress.errors:
+            print(f"❌ {rel_path}: {status[:100]}")
+        for rel_path, status in downgraded[:10]:
+            print(f"⏳ {rel_path}: {status[:100]}")
+    
+    print()
+    print("=" * 80)
+    print(f"✅ Успешно: {progress.count('OK')}")
+    if downgraded:
+        print(f"⏳ Упрощено по бюджету: {len(downgraded)} (функции - дампом констант, см. {log_file.name})")
+    print(f"❌ Ошибок: {progress.count('ERROR')}")
+    print(f"📁 Результат: {output_dir}")
+    if bytecode_dir:
+        print(f"📁 Байткод: {bytecode_dir}")
+    print(f"⏱️  Время: {time.perf_counter() - started:.1f} с")
+    if stage_times:
+        print(f"🧩 Декомпиляция (сумма по процессам): разбор {stage_times['parse']:.1f} с, "
+              f"CFG {stage_times['cfg']:.1f} с, вывод кода {stage_times['emit']:.1f} с")
+    own_rss, worker_rss = peak_rss_mb()
+    if own_rss is not None:
+        print(f"💾 Пик памяти: {own_rss:.0f} MB (основной процесс), {worker_rss:.0f} MB (воркер)")
+    print("=" * 80)
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
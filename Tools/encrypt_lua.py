@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Обратная упаковка Lua файлов для клиента
+Lua/байткод → ZLIB → DHZAMES → XXTEA → XOR → DHGAMES
+Зеркало decrypt_ULTIMATE.py: те же таблицы XOR и ключ generate_key().
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+from batch_runner import default_jobs, plan_chunks, run_chunks, Progress
+from decrypt_ULTIMATE import encrypt_data, decrypt_data
+
+
+def _encrypt_chunk(chunk):
+    """Шифрование пачки файлов в процессе-воркере: [(rel_path, status, ok)]"""
+    results = []
+    for filepath, output_file, rel_path, level, check in chunk:
+        try:
+            with open(filepath, 'rb') as f:
+                data = f.read()
+            
+            encrypted = encrypt_data(data, level)
+            
+            # Самопроверка: расшифровка должна вернуть исходные байты
+            if check:
+                decrypted, status = decrypt_data(encrypted)
+                if decrypted != data:
+                    results.append((rel_path, f"Round-trip mismatch ({status})", False))
+                    continue
+            
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(output_file, 'wb') as f:
+                f.write(encrypted)
+        except Exception as e:
+            results.append((rel_path, str(e), False))
+            continue
+        
+        results.append((rel_path, "OK", True))
+    
+    return results
+
+
+def parse_args(argv=None):
+    """Аргументы командной строки"""
+    parser = argparse.ArgumentParser(
+        description="Шифрование Lua файлов для клиента Idle Heroes (ZLIB → DHZAMES → XXTEA → XOR → DHGAMES)")
+    parser.add_argument("input", nargs="?", default="decrypted_lua_FINAL",
+                        help="папка с Lua/байткодом (по умолчанию decrypted_lua_FINAL)")
+    parser.add_argument("output", nargs="?", default="lua_encrypted",
+                        help="папка для зашифрованных файлов (по умолчанию lua_encrypted)")
+    parser.add_argument("-j", "--jobs", type=int, default=default_jobs(),
+                        help="число процессов (по умолчанию - по числу ядер)")
+    parser.add_argument("--level", type=int, default=-1,
+                        help="уровень сжатия ZLIB 0-9 (по умолчанию - стандартный)")
+    parser.add_argument("--no-check", action="store_true",
+                        help="не проверять результат обратной расшифровкой")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    print("=" * 80)
+    print("🔒 ШИФРОВАНИЕ LUA ДЛЯ КЛИЕНТА")
+    print("📋 Алгоритм: ZLIB → DHZAMES → XXTEA → XOR → DHGAMES")
+    print("=" * 80)
+    print()
+    
+    base_path = Path(args.input)
+    if not base_path.exists():
+        print(f"❌ Папка не найдена: {base_path}")
+        return 1
+    
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    lua_files = list(base_path.rglob("*.lua"))
+    print(f"📁 Найдено файлов: {len(lua_files)}")
+    print(f"⚙️  Процессов: {args.jobs}")
+    print(f"🔁 Самопроверка: {'нет' if args.no_check else 'да'}")
+    print()
+    
+    tasks = []
+    for filepath in lua_files:
+        rel_path = filepath.relative_to(base_path)
+        tasks.append((filepath.stat().st_size,
+                      (filepath, output_dir / rel_path, rel_path, args.level, not args.no_check)))
+    
+    progress = Progress(len(tasks))
+    for rel_path, status, ok in run_chunks(_encrypt_chunk, plan_chunks(tasks, args.jobs), args.jobs):
+        progress.update(rel_path, status, ok)
+    
+    if progress.errors:
+        print()
+        for rel_path, status in progress.errors:
+            print(f"❌ {rel_path}: {status}")
+    
+    print()
+    print("=" * 80)
+    print(f"✅ Успешно: {progress.count('OK')}")
+    print(f"❌ Ошибок: {progress.count('ERROR')}")
+    print(f"📁 Результат: {output_dir}")
+    print("=" * 80)
+    
+    return 1 if progress.count('ERROR') else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
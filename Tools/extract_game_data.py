@@ -3,40 +3,45 @@
 Извлечение игровых данных из декомпилированных Lua файлов
 """
 
+import sys
 import json
+import time
+import argparse
 from pathlib import Path
-from extract_protobuf_schema import extract_constants_from_lua
+from lua_pack import lua_exists, list_tree
+from lua_data import load_config, config_records, DataChunkError
 
 def extract_config_data(config_file):
-    """Извлечь данные из конфиг файла"""
+    """Извлечь данные из конфиг файла: {id: запись}
     
-    constants = extract_constants_from_lua(config_file)
+    Таблица конфига вычисляется прямо по байткоду (lua_data), записи и
+    поля - точно как в Lua, без угадывания границ по константам.
+    """
     
-    # Группируем данные
-    data = {}
-    current_id = None
-    current_obj = {}
-    
-    for i, const in enumerate(constants):
-        if isinstance(const, (int, float)) and const > 1000:
-            # Возможно это ID
-            if current_id and current_obj:
-                data[current_id] = current_obj
-            current_id = int(const)
-            current_obj = {'id': current_id}
-        elif isinstance(const, str) and const:
-            # Это может быть имя поля
-            if i + 1 < len(constants):
-                next_val = constants[i + 1]
-                if isinstance(next_val, (str, int, float)):
-                    current_obj[const] = next_val
-    
-    if current_id and current_obj:
-        data[current_id] = current_obj
-    
-    return data
+    return config_records(load_config(config_file))
+
+# Важные конфиги (по умолчанию)
+IMPORTANT_CONFIGS = [
+    'hero.lua',
+    'item.lua',
+    'skill.lua',
+    'buff.lua',
+    'activity.lua',
+    'shop.lua',
+]
+
+def parse_args(argv=None):
+    """Аргументы командной строки"""
+    parser = argparse.ArgumentParser(description="Извлечение конфигов игры в JSON")
+    parser.add_argument("--all", action="store_true",
+                        help="все конфиги app/config, а не только основные")
+    parser.add_argument("--format", choices=("json", "snapshot"), default="json",
+                        help="json - как раньше, snapshot - колоночный .snap для mmap (нужен NumPy)")
+    return parser.parse_args(argv)
 
-def main():
+def main(argv=None):
+    args = parse_args(argv)
+    
     print("=" * 80)
     print("🎮 ИЗВЛЕЧЕНИЕ ИГРОВЫХ ДАННЫХ")
     print("=" * 80)
@@ -46,34 +51,46 @@ def main():
     output_dir = Path("private-server/data/game_configs")
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Важные конфиги
-    important_configs = [
-        'hero.lua',
-        'item.lua',
-        'skill.lua',
-        'buff.lua',
-        'activity.lua',
-        'shop.lua',
-    ]
+    if args.format == "snapshot":
+        # NumPy нужен только для снимков
+        from config_snapshot import write_snapshot, SNAPSHOT_SUFFIX
+    
+    if args.all:
+        config_names = sorted(rel_path for rel_path, _ in list_tree(config_dir))
+    else:
+        config_names = IMPORTANT_CONFIGS
     
     total_extracted = 0
+    started = time.perf_counter()
     
-    for config_name in important_configs:
+    for config_name in config_names:
         config_file = config_dir / config_name
         
-        if not config_file.exists():
+        if not lua_exists(config_file):
             print(f"❌ Не найден: {config_name}")
             continue
         
         print(f"📁 Обработка: {config_name}")
         
-        data = extract_config_data(config_file)
+        try:
+            data = extract_config_data(config_file)
+        except DataChunkError as e:
+            # Не таблица данных (в конфиге есть код)
+            print(f"   ⚠️ Не data-чанк: {e}")
+            print()
+            continue
         
         if data:
-            output_file = output_dir / config_name.replace('.lua', '.json')
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            if args.format == "snapshot":
+                output_file = output_dir / config_name.replace('.lua', SNAPSHOT_SUFFIX)
+                output_file.parent.mkdir(parents=True, exist_ok=True)
+                write_snapshot(output_file, data)
+            else:
+                output_file = output_dir / config_name.replace('.lua', '.json')
+                output_file.parent.mkdir(parents=True, exist_ok=True)
+                
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2, ensure_ascii=False)
             
             print(f"   ✅ Извлечено записей: {len(data)}")
             print(f"   ✅ Сохранено: {output_file.name}")
@@ -85,10 +102,13 @@ def main():
     
     print("=" * 80)
     print(f"✅ Всего извлечено: {total_extracted} записей")
+    print(f"⏱️  Время: {time.perf_counter() - started:.1f} с")
     print(f"✅ Сохранено в: {output_dir}")
     print("=" * 80)
     print()
     print("💡 Теперь можно использовать эти данные в сервере!")
+    
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
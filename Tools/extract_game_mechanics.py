@@ -5,7 +5,8 @@
 
 import json
 from pathlib import Path
-from extract_protobuf_schema import extract_constants_from_lua
+from lua_pack import lua_exists
+from extract_protobuf_schema import extract_all_constants
 
 
 def analyze_damage_formulas(lua_dir: Path):
@@ -25,13 +26,13 @@ def analyze_damage_formulas(lua_dir: Path):
     damage_data = {}
     
     for fight_file in fight_files:
-        if not fight_file.exists():
+        if not lua_exists(fight_file):
             continue
         
         print(f"\n📁 Анализ: {fight_file.name}")
         print("-" * 80)
         
-        constants = extract_constants_from_lua(fight_file)
+        constants = extract_all_constants(fight_file)
         
         # Ищем ключевые слова для урона
         damage_keywords = ['damage', 'atk', 'attack', 'hurt', 'dmg', 'crit', 'armor', 'def']
@@ -77,13 +78,13 @@ def analyze_summon_rates(lua_dir: Path):
     summon_data = {}
     
     for summon_file in summon_files:
-        if not summon_file.exists():
+        if not lua_exists(summon_file):
             continue
         
         print(f"\n📁 Анализ: {summon_file.name}")
         print("-" * 80)
         
-        constants = extract_constants_from_lua(summon_file)
+        constants = extract_all_constants(summon_file)
         
         # Ищем проценты и вероятности
         rates = []
@@ -130,11 +131,11 @@ def analyze_hero_stats(lua_dir: Path):
     
     hero_file = lua_dir / "app" / "config" / "hero.lua"
     
-    if not hero_file.exists():
+    if not lua_exists(hero_file):
         print("❌ Файл hero.lua не найден")
         return {}
     
-    constants = extract_constants_from_lua(hero_file)
+    constants = extract_all_constants(hero_file)
     
     # Ищем характеристики
     stat_keywords = ['baseAtk', 'baseHp', 'baseArm', 'baseSpd', 'growAtk', 'growHp', 'growArm', 'growSpd']
@@ -185,11 +186,11 @@ def analyze_skill_mechanics(lua_dir: Path):
     
     skill_file = lua_dir / "app" / "config" / "skill.lua"
     
-    if not skill_file.exists():
+    if not lua_exists(skill_file):
         print("❌ Файл skill.lua не найден")
         return {}
     
-    constants = extract_constants_from_lua(skill_file)
+    constants = extract_all_constants(skill_file)
     
     # Ищем типы навыков и эффекты
     skill_keywords = ['damage', 'heal', 'buff', 'debuff', 'stun', 'silence', 'dot', 'shield']
@@ -236,7 +237,7 @@ def main():
     
     lua_dir = Path("decrypted_lua_FINAL")
     
-    if not lua_dir.exists():
+    if not lua_exists(lua_dir):
         print("❌ Директория decrypted_lua_FINAL не найдена")
         return
     
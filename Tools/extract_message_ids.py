@@ -4,6 +4,7 @@
 """
 
 from pathlib import Path
+from lua_pack import lua_exists
 from extract_protobuf_schema import extract_constants_from_lua
 
 def extract_message_mapping():
@@ -25,7 +26,7 @@ def extract_message_mapping():
     message_ids = {}
     
     for proto_file in protocol_files:
-        if not proto_file.exists():
+        if not lua_exists(proto_file):
             continue
         
         print(f"📁 Анализ: {proto_file.name}")
@@ -3,80 +3,32 @@
 Извлечение Protobuf схем из Lua байткода
 """
 
-import struct
 from pathlib import Path
+from lua_pack import read_lua, lua_exists
+from lua_chunk import is_lua_chunk, iter_constants
 
 def extract_constants_from_lua(filepath):
-    """Извлечь все константы из Lua файла"""
+    """Извлечь все константы из Lua файла (только главная функция)"""
     
-    with open(filepath, 'rb') as f:
-        data = f.read()
+    data = read_lua(filepath)
     
-    if not data.startswith(b'\x1bLua'):
+    if not is_lua_chunk(data):
         return []
     
-    pos = 12  # Пропускаем заголовок
-    
-    def read_int():
-        nonlocal pos
-        val = struct.unpack('<I', data[pos:pos+4])[0]
-        pos += 4
-        return val
-    
-    def read_byte():
-        nonlocal pos
-        b = data[pos]
-        pos += 1
-        return b
-    
-    def read_string():
-        nonlocal pos
-        size = read_int()
-        if size == 0:
-            return ""
-        s = data[pos:pos+size-1].decode('utf-8', errors='replace')
-        pos += size
-        return s
-    
-    # Source
-    read_string()
-    
-    # Line info
-    read_int()  # line defined
-    read_int()  # last line
-    
-    # Function info
-    read_byte()  # upvalues
-    read_byte()  # params
-    read_byte()  # vararg
-    read_byte()  # stack
-    
-    # Code
-    num_inst = read_int()
-    for i in range(num_inst):
-        read_int()
-    
-    # Constants
-    num_const = read_int()
-    constants = []
-    
-    for i in range(num_const):
-        const_type = read_byte()
-        
-        if const_type == 0:  # nil
-            constants.append(None)
-        elif const_type == 1:  # boolean
-            val = read_byte()
-            constants.append(bool(val))
-        elif const_type == 3:  # number
-            val = struct.unpack('<d', data[pos:pos+8])[0]
-            pos += 8
-            constants.append(val)
-        elif const_type == 4:  # string
-            val = read_string()
-            constants.append(val)
-    
-    return constants
+    return [value for _, _, value in iter_constants(data, nested=False)]
+
+def extract_all_constants(filepath):
+    """Константы всех прототипов файла подряд (главная функция, затем вложенные)
+    
+    В конфигах и боевой логике основные данные лежат во вложенных функциях.
+    """
+    
+    data = read_lua(filepath)
+    
+    if not is_lua_chunk(data):
+        return []
+    
+    return [value for _, _, value in iter_constants(data)]
 
 def analyze_protobuf_file(filepath):
     """Анализ Protobuf Lua файла"""
@@ -103,7 +55,7 @@ def main():
     all_messages = {}
     
     for proto_file in proto_files:
-        if not proto_file.exists():
+        if not lua_exists(proto_file):
             print(f"❌ Файл не найден: {proto_file}")
             continue
         
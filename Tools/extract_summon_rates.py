@@ -5,7 +5,8 @@
 
 import json
 from pathlib import Path
-from extract_protobuf_schema import extract_constants_from_lua
+from lua_pack import lua_exists
+from extract_protobuf_schema import extract_all_constants
 
 
 def analyze_gacha_file(filepath: Path):
@@ -14,7 +15,7 @@ def analyze_gacha_file(filepath: Path):
     print(f"\n📁 Анализ: {filepath.name}")
     print("-" * 80)
     
-    constants = extract_constants_from_lua(filepath)
+    constants = extract_all_constants(filepath)
     
     rates = []
     pools = {}
@@ -87,7 +88,7 @@ def main():
     all_pools = {}
     
     for gacha_file in gacha_files:
-        if not gacha_file.exists():
+        if not lua_exists(gacha_file):
             print(f"⚠️ Файл не найден: {gacha_file.name}")
             continue
         
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Манифест обработанных файлов для инкрементальной пересборки
+Хранит для каждого входного файла размер, mtime, хеш содержимого и хеш результата,
+чтобы повторный запуск обрабатывал только изменившиеся файлы.
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+
+# Размер блока при хешировании файлов
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def manifest_path(output_dir):
+    """Манифест лежит рядом с папкой результата: decrypted_lua_FINAL.manifest.json"""
+    output_dir = Path(output_dir)
+    return output_dir.parent / f"{output_dir.name}.manifest.json"
+
+
+def new_hasher():
+    """Хешер для потокового подсчета (тот же алгоритм, что bytes_hash)"""
+    return hashlib.blake2b(digest_size=16)
+
+
+def bytes_hash(data):
+    """Быстрый хеш содержимого (BLAKE2b, 128 бит)"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_hash(filepath):
+    """Хеш файла, читается блоками"""
+    h = new_hasher()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def make_entry(stat, input_hash, output_hash):
+    """Запись манифеста для одного файла (для члена архива - еще и его CRC32)"""
+    entry = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': input_hash,
+        'out_hash': output_hash,
+    }
+    crc = getattr(stat, 'crc', None)
+    if crc is not None:
+        entry['crc'] = crc
+    return entry
+
+
+def stat_matches(entry, stat):
+    """Файл не трогали с прошлого запуска (размер и mtime совпадают)"""
+    return (entry is not None
+            and entry.get('size') == stat.st_size
+            and entry.get('mtime_ns') == stat.st_mtime_ns)
+
+
+def load_manifest(path):
+    """Загрузка манифеста: {rel_path: entry}; пустой словарь если манифеста нет"""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    
+    if data.get('version') != MANIFEST_VERSION:
+        return {}
+    return data.get('files', {})
+
+
+def save_manifest(path, files):
+    """Сохранение манифеста (через временный файл, чтобы не оставить битый)"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'files': files}, f,
+                  indent=1, sort_keys=True, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def verify_entry(input_hash, output_file, entry):
+    """Проверка одной записи без записи на диск: None если все совпадает, иначе причина
+    
+    input_hash - хеш текущего входа (None если вход пропал).
+    """
+    if input_hash is None:
+        return "input missing"
+    if not Path(output_file).exists():
+        return "output missing"
+    if input_hash != entry.get('hash'):
+        return "input changed"
+    if file_hash(output_file) != entry.get('out_hash'):
+        return "output changed"
+    return None
@@ -8,15 +8,85 @@
 - Правильной областью видимости
 """
 
-import struct
 import gc
+import io
+import sys
+import time
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, TextIO
 from dataclasses import dataclass
 from enum import IntEnum
 
+from lua_pack import read_lua, lua_exists, compressed_name, open_compressed, remove_other_formats
+from batch_runner import plan_chunks, run_chunks, current_rss_mb
+from lua_chunk import ChunkReader, CodeArrays, is_lua_chunk, main_protos
+from lua_cfg import (ControlFlow, flow_kinds, FLOW_JMP, FLOW_COND, FLOW_FORPREP,
+                     FLOW_FORLOOP, FLOW_RETURN)
+
 # Оптимизация памяти: используем __slots__ для всех классов
 
+# Принудительная сборка мусора (для A/B сравнения, см. --gc-policy):
+#   none   - не вызывать gc.collect() (по умолчанию): декомпилятор не создает
+#            циклических ссылок, все состояние прототипа освобождается сразу
+#            по счетчику ссылок при выходе из read_function
+#   file   - одна полная сборка после каждого файла
+#   legacy - как раньше: после каждой функции, каждые 5000 инструкций и после файла
+GC_POLICIES = ('none', 'file', 'legacy')
+gc_policy = 'none'
+
+
+def set_gc_policy(policy: str):
+    """Выбор политики сборки мусора для текущего процесса"""
+    global gc_policy
+    if policy not in GC_POLICIES:
+        raise ValueError(f"Unknown gc policy: {policy}")
+    gc_policy = policy
+
+
+@dataclass
+class Budget:
+    """Ограничения на вывод кода (None - без ограничения, см. --time-budget и др.)
+    
+    file_seconds - на весь файл, proto_seconds - на одну функцию (без
+    времени вложенных), memory_mb - рост памяти процесса за файл.
+    Функция, которая не уложилась, дописывается дампом констант.
+    """
+    file_seconds: Optional[float] = None
+    proto_seconds: Optional[float] = None
+    memory_mb: Optional[float] = None
+
+
+budget = Budget()
+
+
+def set_budget(new_budget: Budget):
+    """Выбор ограничений для текущего процесса"""
+    global budget
+    budget = new_budget
+
+
+# Начало статуса файла, у которого часть функций выведена дампом констант
+BUDGET_STATUS = "BUDGET"
+
+
+def add_budget_arguments(parser):
+    """Флаги Budget для утилит массовой декомпиляции (argparse)"""
+    parser.add_argument("--time-budget", type=float, default=None, metavar="SEC",
+                        help="не больше SEC секунд на вывод файла, остаток - дамп констант")
+    parser.add_argument("--proto-time-budget", type=float, default=None, metavar="SEC",
+                        help="не больше SEC секунд на одну функцию (без вложенных)")
+    parser.add_argument("--memory-budget", type=float, default=None, metavar="MB",
+                        help="не больше MB роста памяти процесса на файл")
+
+
+def budget_from_args(args) -> Budget:
+    """Budget из флагов add_budget_arguments"""
+    return Budget(args.time_budget, args.proto_time_budget, args.memory_budget)
+
+
+class BudgetExceeded(Exception):
+    """Вывод функции вышел за Budget (прерывает только эту функцию)"""
+
 class LuaOpcode(IntEnum):
     """Опкоды Lua 5.1 (ПЕРЕМЕШАННЫЕ в Idle Heroes - из libcocos2dlua.so)"""
     SUB = 0          # case 0: вычитание
@@ -59,18 +129,6 @@ class LuaOpcode(IntEnum):
     VARARG = 37      # case 0x25: vararg
     GETGLOBAL = 255  # Не найден в switch - возможно удален
 
-@dataclass
-class Instruction:
-    """Декодированная инструкция"""
-    __slots__ = ('pc', 'opcode', 'a', 'b', 'c', 'bx', 'sbx')
-    pc: int
-    opcode: LuaOpcode
-    a: int
-    b: int
-    c: int
-    bx: int
-    sbx: int
-    
 @dataclass
 class LocalVar:
     """Локальная переменная"""
@@ -80,148 +138,329 @@ class LocalVar:
     endpc: int
     reg: int
 
-class ImprovedLuaDecompiler:
-    """Улучшенный декомпилятор с полной поддержкой Lua 5.1"""
-    __slots__ = ('data', 'pos')
-    
-    def __init__(self, data: bytes):
-        self.data = data
-        self.pos = 0
-    
-    def read_byte(self) -> int:
-        b = self.data[self.pos]
-        self.pos += 1
-        return b
-    
-    def read_int(self) -> int:
-        val = struct.unpack('<I', self.data[self.pos:self.pos+4])[0]
-        self.pos += 4
-        return val
-    
-    def read_number(self) -> float:
-        val = struct.unpack('<d', self.data[self.pos:self.pos+8])[0]
-        self.pos += 8
-        return val
-    
-    def read_string(self) -> str:
-        size = self.read_int()
-        if size == 0:
-            return ""
-        s = self.data[self.pos:self.pos+size-1].decode('utf-8', errors='replace')
-        self.pos += size
-        return s
+# Сравнения для условий структур управления
+COMPARE_SYMBOLS = {'EQ': '==', 'LT': '<', 'LE': '<='}
+
+# Глубже - структуры не восстанавливаются (длинные цепочки elseif не упираются в стек Python)
+MAX_NESTING = 100
+
+# Результат обработчика опкода: вывести комментарий с именем и полями инструкции
+UNHANDLED = object()
+
+class RegisterNames:
+    """Имена регистров по ходу pc из областей видимости локальных переменных
+    
+    Регистр локальной - число активных локальных в ее startpc (правило
+    Lua 5.1), считается одним проходом по интервалам со стеком. Имя
+    действует с конца предыдущей локальной на том же регистре (там стоят
+    инструкции, инициализирующие новую) до endpc, так что переиспользованный
+    регистр в разных местах функции получает разные имена. Служебные
+    локальные ("(for index)" и т.п.) занимают регистр, но имени не дают.
+    
+    names - словарь регистр -> имя для текущего pc, advance(pc) при
+    возрастающем pc применяет события до pc включительно (O(1) амортизированно).
+    """
+    __slots__ = ('names', 'events', 'index')
+    
+    def __init__(self, locals_info: List[LocalVar], fixed: Dict[int, str]):
+        self.names = dict(fixed)
+        self.index = 0
+        
+        # Регистры: стек активных локальных (области вложены)
+        active = []
+        for local_var in locals_info:
+            while active and active[-1].endpc <= local_var.startpc:
+                active.pop()
+            local_var.reg = len(active)
+            active.append(local_var)
+        
+        # События (pc, регистр, имя или None): имя ставится с конца предыдущей
+        # локальной на регистре, снимается в endpc последней
+        events = []
+        last_end = {}
+        for local_var in locals_info:
+            reg = local_var.reg
+            name = None if local_var.name.startswith('(') else local_var.name
+            events.append((last_end.get(reg, 0), reg, name))
+            last_end[reg] = local_var.endpc
+        for reg, endpc in last_end.items():
+            events.append((endpc, reg, None))
+        
+        # Снятие имени раньше установки при одинаковом pc
+        events.sort(key=lambda e: (e[0], e[2] is not None))
+        self.events = events
+    
+    def advance(self, pc: int) -> int:
+        """Применить события до pc включительно, вернуть pc следующего события"""
+        events = self.events
+        names = self.names
+        index = self.index
+        while index < len(events) and events[index][0] <= pc:
+            _, reg, name = events[index]
+            if name is None:
+                names.pop(reg, None)
+            else:
+                names[reg] = name
+            index += 1
+        self.index = index
+        return events[index][0] if index < len(events) else sys.maxsize
+
+class FunctionState:
+    """Состояние генерации одной функции (живет, только пока она выводится)
+    
+    registers - значения в регистрах (выражения), reg_to_var - имена для
+    текущего pc (scope.advance по мере вывода), flow - граф потока управления,
+    loop_exits - pc выхода из текущего цикла и, если там JMP, его цель
+    (Lua 5.1 сразу переводит break на цель следующего перехода) - переход
+    туда - break, open_loops - заголовки repeat и while true, чье тело сейчас
+    выводится, back_jumps - pc последнего отдельного JMP назад на каждую цель
+    (конец while; заполняется при первом обращении), closers - строки,
+    закрывающие открытые блоки (по ним блоки закрываются, если Budget прервал
+    вывод).
+    """
+    __slots__ = ('code', 'constants', 'protos', 'scope', 'reg_to_var', 'next_pc',
+                 'registers', 'flow', 'loop_exits', 'open_loops', 'back_jumps',
+                 'closers', 'depth')
+    
+    def __init__(self, code: CodeArrays, constants: List[Any], protos: List['Proto'],
+                 scope: RegisterNames):
+        self.code = code
+        self.constants = constants
+        self.protos = protos
+        self.scope = scope
+        self.reg_to_var = scope.names
+        self.next_pc = scope.advance(0)
+        self.registers = {}
+        self.flow = None
+        self.loop_exits = ()
+        self.open_loops = []
+        self.back_jumps = None
+        self.closers = []
+        self.depth = 0
+
+@dataclass
+class Proto:
+    """Разобранный прототип функции (код генерируется потом, прямо в поток вывода)"""
+    __slots__ = ('code', 'constants', 'protos', 'locals_info',
+                 'num_params', 'is_vararg', 'upvalue_names', 'level', 'line_defined')
+    code: CodeArrays
+    constants: List[Any]
+    protos: List['Proto']
+    locals_info: List[LocalVar]
+    num_params: int
+    is_vararg: int
+    upvalue_names: List[str]
+    level: int
+    line_defined: int
+
+class RenderedProto:
+    """Вложенный прототип, уже выведенный в другом процессе (см. render_nested)
+    
+    text - код от "function(...)" до "end" (заголовок - у места вызова),
+    end - позиция в чанке сразу после прототипа.
+    """
+    __slots__ = ('text', 'end', 'level')
+    
+    def __init__(self, text: str, end: int, level: int):
+        self.text = text
+        self.end = end
+        self.level = level
+
+# Меньше - файл выводится целиком в одном процессе (пул не окупается)
+PARALLEL_MIN_SIZE = 1024 * 1024
+
+class ImprovedLuaDecompiler(ChunkReader):
+    """Улучшенный декомпилятор с полной поддержкой Lua 5.1
+    
+    Сначала весь чанк разбирается в дерево Proto (ошибка формата - ошибка
+    всего файла, до записи первой строки), затем код пишется построчно в
+    текстовый поток: вложенные функции выводятся прямо на месте CLOSURE,
+    без промежуточных строк на каждом уровне вложенности.
+    """
+    __slots__ = ('write', 'sep', 'count', 'timings', 'rendered', 'limits', 'budgeted',
+                 'deadline', 'rss_limit', 'proto_clock', 'ticks', 'exhausted', 'downgrades')
+    
+    # Карта опкодов клиента и построенные по ней таблицы обработчиков и
+    # видов переходов. Другая версия клиента с другой перестановкой - подкласс:
+    #   OPCODES = OtherOpcode; DISPATCH, OPCODE_NAMES = build_dispatch(OtherOpcode)
+    #   FLOW = flow_kinds(OPCODE_NAMES)
+    OPCODES = LuaOpcode
+    
+    def __init__(self, data, pos: int = 0):
+        super().__init__(data, pos)
+        # Время по стадиям, секунды: разбор, графы потока управления, вывод кода
+        self.timings = {'parse': 0.0, 'cfg': 0.0, 'emit': 0.0}
+        # Прототипы главной функции, выведенные заранее: позиция в чанке -> RenderedProto
+        self.rendered = None
+        
+        # Budget процесса: отсчет времени и памяти файла - с создания декомпилятора
+        limits = budget
+        self.limits = limits
+        self.budgeted = (limits.file_seconds is not None or limits.proto_seconds is not None
+                         or limits.memory_mb is not None)
+        now = time.perf_counter()
+        self.deadline = now + limits.file_seconds if limits.file_seconds is not None else None
+        rss = current_rss_mb() if limits.memory_mb is not None else None
+        self.rss_limit = rss + limits.memory_mb if rss is not None else None
+        self.proto_clock = []
+        self.ticks = 0
+        # Причина, по которой весь остаток файла выводится дампом констант
+        self.exhausted = None
+        # Функции, выведенные дампом констант: [(строка определения, причина)]
+        self.downgrades = []
     
     def decompile(self) -> str:
-        """Главная функция декомпиляции"""
-        # Проверяем заголовок
-        if not self.data.startswith(b'\x1bLua'):
-            raise ValueError("Not a Lua bytecode file")
-        
-        # Пропускаем заголовок Lua 5.1
-        self.pos = 12
+        """Главная функция декомпиляции: весь код одной строкой"""
+        out = io.StringIO()
+        self.decompile_to(out)
+        return out.getvalue()
+    
+    def decompile_to(self, out: TextIO):
+        """Декомпиляция с записью прямо в текстовый поток (файл или io.StringIO)"""
+        timings = self.timings
+        started = time.perf_counter()
+        main = self.read_chunk()
+        parsed = time.perf_counter()
+        timings['parse'] += parsed - started
+        cfg = timings['cfg']
+        self.emit(main, out)
+        timings['emit'] += time.perf_counter() - parsed - (timings['cfg'] - cfg)
+    
+    def read_chunk(self) -> Proto:
+        """Разбор всего чанка: главная функция со всеми вложенными"""
+        # Проверяем заголовок и пропускаем заголовок Lua 5.1
+        self.skip_header()
         
         # Читаем главную функцию
         return self.read_function(0)
     
-    def read_function(self, level: int) -> str:
-        """Чтение и декомпиляция функции"""
-        indent = "  " * level
-        
-        # Метаинформация
-        source = self.read_string()
-        line_defined = self.read_int()
-        last_line_defined = self.read_int()
-        
-        # Параметры функции
-        num_upvalues = self.read_byte()
-        num_params = self.read_byte()
-        is_vararg = self.read_byte()
-        max_stack_size = self.read_byte()
+    def render_nested(self, jobs: int):
+        """Прототипы главной функции - параллельно в jobs процессах (до decompile_to)
+        
+        Границы прототипов находятся одним проходом по размерам полей, каждый
+        выводится в своем процессе из своего куска байткода, а decompile_to
+        вставляет готовый текст на место CLOSURE - вывод совпадает с
+        последовательным байт в байт. Меньше двух прототипов - ничего не делает.
+        """
+        started = time.perf_counter()
+        bounds = main_protos(self.view)
+        self.timings['parse'] += time.perf_counter() - started
+        if len(bounds) < 2:
+            return
+        
+        # Крупные прототипы - первыми, мелкие - пачками (batch_runner)
+        view = self.view
+        cls = type(self)
+        # Срок файла - по часам системы: в воркерах свои perf_counter
+        deadline = None
+        if self.deadline is not None:
+            deadline = time.time() + (self.deadline - time.perf_counter())
+        tasks = [(end - start, (cls, start, end, bytes(view[start:end]), self.limits, deadline))
+                 for start, end in bounds]
+        rendered = {}
+        for start, end, text, timings, downgrades in run_chunks(_render_protos, plan_chunks(tasks, jobs), jobs):
+            add_timings(self.timings, timings)
+            self.downgrades.extend(downgrades)
+            rendered[start] = RenderedProto(text, end, 1)
+        self.rendered = rendered
+    
+    def render_function(self, level: int) -> str:
+        """Прототип с позиции pos в строку: от "function(...)" до "end" (level > 0)"""
+        timings = self.timings
+        started = time.perf_counter()
+        proto = self.read_function(level)
+        parsed = time.perf_counter()
+        timings['parse'] += parsed - started
+        cfg = timings['cfg']
+        out = io.StringIO()
+        self.write = out.write
+        self.sep = ''
+        self.count = 0
+        self.generate_code(proto, "")
+        timings['emit'] += time.perf_counter() - parsed - (timings['cfg'] - cfg)
+        return out.getvalue()
+    
+    def emit(self, main: Proto, out: TextIO):
+        """Запись кода разобранного чанка в поток"""
+        self.write = out.write
+        self.sep = ''
+        self.count = 0
+        self.generate_code(main)
+    
+    def read_function(self, level: int) -> Proto:
+        """Чтение функции"""
+        # Метаинформация и параметры функции
+        (source, line_defined, last_line_defined,
+         num_upvalues, num_params, is_vararg, max_stack_size) = self.read_function_info()
         
-        # Инструкции
-        num_instructions = self.read_int()
-        instructions = []
-        for i in range(num_instructions):
-            inst_raw = self.read_int()
-            instructions.append(self.decode_instruction(i, inst_raw))
+        # Инструкции: параллельные массивы полей, декодированные разом
+        code = self.read_code()
+        self._check_opcodes(code)
         
         # Константы
-        num_constants = self.read_int()
-        constants = []
-        for i in range(num_constants):
-            const_type = self.read_byte()
-            
-            if const_type == 0:  # nil
-                constants.append(None)
-            elif const_type == 1:  # boolean
-                val = self.read_byte()
-                constants.append(bool(val))
-            elif const_type == 3:  # number
-                val = self.read_number()
-                constants.append(val)
-            elif const_type == 4:  # string
-                val = self.read_string()
-                constants.append(val)
+        constants = self.read_constants()
         
         # Вложенные функции (прототипы)
         num_protos = self.read_int()
         protos = []
+        rendered = self.rendered if level == 0 else None
         for i in range(num_protos):
+            done = rendered.get(self.pos) if rendered else None
+            if done is not None:
+                # Уже выведен в другом процессе - пропускаем байткод
+                protos.append(done)
+                self.pos = done.end
+                continue
             protos.append(self.read_function(level + 1))
         
-        # Отладочная информация - номера строк
-        num_lines = self.read_int()
-        line_info = []
-        for i in range(num_lines):
-            line_info.append(self.read_int())
+        # Отладочная информация - номера строк (для генерации не нужны)
+        self.skip_ints(self.read_int())
         
         # Отладочная информация - локальные переменные
-        num_locals = self.read_int()
-        locals_info = []
-        for i in range(num_locals):
-            name = self.read_string()
-            startpc = self.read_int()
-            endpc = self.read_int()
-            locals_info.append(LocalVar(name, startpc, endpc, -1))
+        locals_info = [LocalVar(name, startpc, endpc, -1) for name, startpc, endpc in self.read_locals()]
         
         # Отладочная информация - имена upvalues
-        num_upvalue_names = self.read_int()
-        upvalue_names = []
-        for i in range(num_upvalue_names):
-            upvalue_names.append(self.read_string())
-        
-        # Генерируем код
-        return self.generate_code(
-            instructions, constants, protos, locals_info, 
-            num_params, is_vararg, upvalue_names, indent, level
-        )
-    
-    def decode_instruction(self, pc: int, inst: int) -> Instruction:
-        """Декодирование инструкции"""
-        opcode = inst & 0x3F
-        a = (inst >> 6) & 0xFF
-        c = (inst >> 14) & 0x1FF
-        b = (inst >> 23) & 0x1FF
-        bx = (inst >> 14) & 0x3FFFF
-        sbx = bx - 131071
-        
-        return Instruction(pc, LuaOpcode(opcode), a, b, c, bx, sbx)
-    
-    def generate_code(self, instructions: List[Instruction], constants: List[Any],
-                     protos: List[str], locals_info: List[LocalVar], 
-                     num_params: int, is_vararg: int, upvalue_names: List[str],
-                     indent: str, level: int) -> str:
-        """Генерация читаемого Lua кода"""
+        upvalue_names = self.read_strings()
         
-        lines = []
+        return Proto(code, constants, protos, locals_info,
+                     num_params, is_vararg, upvalue_names, level, line_defined)
+    
+    def _check_opcodes(self, code: CodeArrays):
+        """Неизвестный опкод - ошибка всего файла (как при декодировании в LuaOpcode)"""
+        dispatch = self.DISPATCH
+        for op in set(code.op):
+            if dispatch[op] is None:
+                self.OPCODES(op)
+    
+    def _emit(self, line: str):
+        """Одна строка вывода (строки разделяются \n, без перевода строки в конце)"""
+        self.write(self.sep)
+        self.write(line)
+        self.sep = '\n'
+        self.count += 1
+    
+    def generate_code(self, proto: Proto, header: Optional[str] = None):
+        """Генерация читаемого Lua кода прямо в поток
+        
+        header - начало строки заголовка вложенной функции
+        (по умолчанию отступ, для CLOSURE - "local var = ").
+        """
+        emit = self._emit
+        if proto.__class__ is RenderedProto:
+            emit(f"{'  ' * proto.level if header is None else header}{proto.text}")
+            return
+
+        code = proto.code
+        num_params = proto.num_params
+        level = proto.level
+        indent = "  " * level
         
         # Убрана специальная обработка - декомпилируем все файлы одинаково
         
-        # Создаем маппинг регистров на имена переменных
-        reg_to_var = self._build_register_mapping(instructions, locals_info, num_params)
-        
-        # Отслеживание значений в регистрах
-        registers = {}
+        # Создаем маппинг регистров на имена переменных (для текущего pc)
+        scope = self._build_register_mapping(code, proto.locals_info, num_params)
+        state = FunctionState(code, proto.constants, proto.protos, scope)
+        reg_to_var = state.reg_to_var
         
         # Заголовок функции
         if level > 0:
@@ -229,410 +468,856 @@ class ImprovedLuaDecompiler:
             for i in range(num_params):
                 var_name = reg_to_var.get(i, f"arg{i}")
                 params.append(var_name)
-            if is_vararg:
+            if proto.is_vararg:
                 params.append("...")
             
-            if params:
-                lines.append(f"{indent}function({', '.join(params)})")
+            if header is None:
+                header = indent
+            emit(f"{header}function({', '.join(params)})")
+        
+        body_start = self.count
+        reason = None
+        if len(code):
+            if self.budgeted:
+                reason = self._emit_body_within_budget(state, indent)
             else:
-                lines.append(f"{indent}function()")
+                self._emit_body(state, indent)
         
-        # Обрабатываем ВСЕ инструкции полностью
-        pc = 0
+        body_empty = self.count == body_start
         
-        while pc < len(instructions):
-            inst = instructions[pc]
-            
-            try:
-                line = self._process_instruction(
-                    inst, instructions, constants, protos, 
-                    reg_to_var, registers, indent + "  "
-                )
-                
-                if line:
-                    if isinstance(line, list):
-                        lines.extend(line)
-                    else:
-                        lines.append(line)
-            except Exception as e:
-                lines.append(f"{indent}  -- Error processing instruction {pc}: {str(e)[:100]}")
-            
-            pc += 1
-            
-            # Очистка памяти каждые 5000 инструкций (не влияет на результат)
-            if pc % 5000 == 0:
-                gc.collect()
+        if reason is not None:
+            # Начало тела уже выведено: открытые блоки закрываются, дальше только константы
+            closers = state.closers
+            inner = closers[-1][:-len(closers[-1].lstrip())] if closers else indent
+            emit(f"{inner}  -- ⚠️ Вывод прерван ({reason}), константы функции - ниже")
+            for line in reversed(closers):
+                emit(line)
+            self.downgrades.append((proto.line_defined, reason))
         
         if level > 0:
-            lines.append(f"{indent}end")
+            emit(f"{indent}end")
         
-        # Если код пустой или слишком много странных операций, показываем константы
-        if not lines or (level > 0 and len(lines) <= 2):
-            lines.extend(self._generate_constants_dump(constants, protos, indent))
+        # Если код пустой или не уложился в Budget, показываем константы
+        if body_empty or reason is not None:
+            self._generate_constants_dump(proto.constants, proto.protos, indent)
         
         # Убрана проверка - она мешает нормальной декомпиляции
         
-        # Объединяем строки и сразу освобождаем память
-        result = '\n'.join(lines)
-        del lines
-        gc.collect()
-        return result
+        if gc_policy == 'legacy':
+            gc.collect()
     
-    def _build_register_mapping(self, instructions: List[Instruction], 
-                                locals_info: List[LocalVar], 
-                                num_params: int) -> Dict[int, str]:
-        """Создание маппинга регистр -> имя переменной из debug info"""
-        reg_to_var = {}
-        
-        # Параметры функции
-        for i in range(num_params):
-            if i < len(locals_info):
-                reg_to_var[i] = locals_info[i].name
+    def _emit_body(self, state: 'FunctionState', indent: str):
+        """Тело функции: граф потока управления (блоки, доминаторы, циклы) и код по структурам"""
+        started = time.perf_counter()
+        state.flow = ControlFlow(state.code, self.FLOW)
+        self.timings['cfg'] += time.perf_counter() - started
+        
+        # Обрабатываем ВСЕ инструкции полностью, по структурам управления
+        self._emit_range(state, 0, len(state.code), indent + "  ")
+    
+    def _emit_body_within_budget(self, state: 'FunctionState', indent: str) -> Optional[str]:
+        """_emit_body под Budget: причина, если функция не уложилась (None - уложилась)
+        
+        Время вложенных функций не входит во время функции: когда вложенная
+        заканчивается, срок внешней сдвигается на ее длительность.
+        """
+        if self.exhausted is not None:
+            return self.exhausted
+        proto_seconds = self.limits.proto_seconds
+        clock = self.proto_clock
+        started = time.perf_counter()
+        if proto_seconds is not None:
+            clock.append([started + proto_seconds])
+        try:
+            self._emit_body(state, indent)
+            return None
+        except BudgetExceeded as e:
+            return str(e)
+        finally:
+            if proto_seconds is not None:
+                clock.pop()
+                if clock:
+                    clock[-1][0] += time.perf_counter() - started
+    
+    def _check_budget(self):
+        """Проверка Budget по ходу вывода (время - раз в 64 вызова, память - раз в 1024)"""
+        if self.exhausted is None:
+            self.ticks += 1
+            if self.ticks & 63:
+                return
+            now = time.perf_counter()
+            limits = self.limits
+            if self.deadline is not None and now > self.deadline:
+                self.exhausted = f"файл дольше {limits.file_seconds:g} с"
+            elif (self.rss_limit is not None and not self.ticks & 1023
+                  and current_rss_mb() > self.rss_limit):
+                self.exhausted = f"память файла больше {limits.memory_mb:g} MB"
+            elif self.proto_clock and now > self.proto_clock[-1][0]:
+                raise BudgetExceeded(f"функция дольше {limits.proto_seconds:g} с")
             else:
-                reg_to_var[i] = f"arg{i}"
-        
-        # Локальные переменные из debug info
-        reg_counter = num_params
-        for local_var in locals_info[num_params:]:
-            # Находим первое присваивание этой переменной
-            for inst in instructions:
-                if inst.pc >= local_var.startpc and inst.pc < local_var.endpc:
-                    if inst.opcode in [LuaOpcode.LOADK, LuaOpcode.LOADBOOL, 
-                                      LuaOpcode.LOADNIL, LuaOpcode.GETGLOBAL,
-                                      LuaOpcode.GETTABLE, LuaOpcode.CALL]:
-                        if inst.a not in reg_to_var:
-                            reg_to_var[inst.a] = local_var.name
-                            break
-        
-        return reg_to_var
-    
-    def _process_instruction(self, inst: Instruction, instructions: List[Instruction],
-                            constants: List[Any], protos: List[str],
-                            reg_to_var: Dict[int, str], registers: Dict[int, str],
-                            indent: str) -> Optional[str]:
-        """Обработка одной инструкции"""
-        
-        op = inst.opcode
-        a, b, c = inst.a, inst.b, inst.c
-        bx, sbx = inst.bx, inst.sbx
-        
-        var_a = reg_to_var.get(a, f"var{a}")
-        
-        # SUB (0) - вычитание
-        if op == LuaOpcode.SUB:
-            left = self._get_rk_value(b, registers, constants, reg_to_var)
-            right = self._get_rk_value(c, registers, constants, reg_to_var)
-            registers[a] = var_a
-            return f"{indent}local {var_a} = ({left} - {right})"
-        
-        # LOADK (1) - загрузка константы
-        elif op == LuaOpcode.LOADK:
-            if bx < len(constants):
-                const = constants[bx]
-                const_str = self._format_constant(const)
-                registers[a] = var_a
-                return f"{indent}local {var_a} = {const_str}"
-        
-        # TEST (2) - условие
-        elif op == LuaOpcode.TEST:
-            val = registers.get(a, var_a)
-            cond = val if c != 0 else f"not {val}"
-            return f"{indent}if {cond} then"
-        
-        # SETTABLE (3) - установка в таблицу
-        elif op == LuaOpcode.SETTABLE:
-            table = registers.get(a, var_a)
-            key = self._get_rk_value(b, registers, constants, reg_to_var)
-            value = self._get_rk_value(c, registers, constants, reg_to_var)
-            return f"{indent}{table}[{key}] = {value}"
-        
-        # LOADK_BX (4) - загрузка константы (Bx)
-        elif op == LuaOpcode.LOADK_BX:
-            if bx < len(constants):
-                const = constants[bx]
-                const_str = self._format_constant(const)
-                registers[a] = var_a
-                return f"{indent}local {var_a} = {const_str}"
+                return
+        raise BudgetExceeded(self.exhausted)
+    
+    def _emit_range(self, state: 'FunctionState', start: int, end: int, indent: str):
+        """Инструкции [start, end) с восстановлением структур управления"""
+        flow = state.flow
+        budgeted = self.budgeted
+        pc = start
+        while pc < end:
+            if budgeted:
+                self._check_budget()
+            block = flow.block_at.get(pc)
+            if block is None:
+                self._emit_instructions(state, pc, pc + 1, indent)
+                pc += 1
+                continue
+            
+            block_end = flow.end(block)
+            if block_end > end:
+                # Диапазон кончается внутри блока (тело repeat до условия)
+                self._emit_instructions(state, pc, end, indent)
+                return
+            
+            state.depth += 1
+            after = self._emit_structure(state, block, end, indent)
+            state.depth -= 1
+            if after is None:
+                # Не распознано - построчно, как есть (с комментариями goto)
+                self._emit_instructions(state, pc, block_end, indent)
+                after = block_end
+            pc = after
+    
+    def _emit_structure(self, state: 'FunctionState', block: int, end: int,
+                        indent: str) -> Optional[int]:
+        """Цикл или ветвление, начинающееся с блока; pc после него или None"""
+        if state.depth >= MAX_NESTING:
+            return None
+        flow = state.flow
+        
+        latch = flow.loops.get(block)
+        if latch is not None and block in state.open_loops:
+            # Заголовок открытого цикла: вложенный while с тем же заголовком
+            # или repeat по самому дальнему условному переходу назад в теле.
+            # Тело while true кончается переходом на заголовок: там переход
+            # назад - к концу тела (if), repeat - только до самого конца
+            latch = -1
+            whole = self._jump_target(state, end) == flow.starts[block]
+            inner = block
+            while inner < len(flow.starts) and flow.end(inner) <= end:
+                if (flow.branch[inner] >= 0 and flow.succ[inner][1] == block
+                        and (not whole or flow.end(inner) == end)):
+                    latch = inner
+                inner += 1
+        if latch is not None:
+            after = self._emit_loop(state, block, latch, end, indent)
+            if after is not None:
+                return after
+        
+        if self.FLOW[state.code.op[flow.end(block) - 1]] == FLOW_FORPREP:
+            return self._emit_for(state, block, end, indent)
+        
+        if flow.branch[block] >= 0:
+            return self._emit_if(state, block, end, indent)
+        
+        return None
+    
+    def _emit_for(self, state: 'FunctionState', block: int, end: int,
+                  indent: str) -> Optional[int]:
+        """for: FORPREP -> тело -> FORLOOP с переходом назад к телу"""
+        flow = state.flow
+        code = state.code
+        prep = flow.end(block) - 1
+        loop = prep + 1 + code.sbx[prep]
+        if not (prep < loop < end and self.FLOW[code.op[loop]] == FLOW_FORLOOP
+                and loop + 1 + code.sbx[loop] == prep + 1):
+            return None
+        # Тело достижимо только через проверку FORLOOP
+        if loop > prep + 1 and not flow.dominates(flow.block_at[loop], flow.block_at[prep + 1]):
+            return None
         
-        # LOADNIL (5) - загрузка nil
-        elif op == LuaOpcode.LOADNIL:
-            registers[a] = var_a
-            return f"{indent}local {var_a} = nil"
-        
-        # CALL (6) - вызов функции
-        elif op == LuaOpcode.CALL:
-            func = registers.get(a, var_a)
-            args = []
-            if b > 1:
-                for i in range(1, b):
-                    arg_reg = a + i
-                    args.append(registers.get(arg_reg, reg_to_var.get(arg_reg, f"var{arg_reg}")))
-            elif b == 0:
-                args.append("...")
-            call_str = f"{func}({', '.join(args)})"
-            if c > 1:
-                if c == 2:
-                    registers[a] = var_a
-                    return f"{indent}local {var_a} = {call_str}"
-                else:
-                    results = [reg_to_var.get(a + i, f"var{a + i}") for i in range(c - 1)]
-                    for i in range(c - 1):
-                        registers[a + i] = reg_to_var.get(a + i, f"var{a + i}")
-                    return f"{indent}local {', '.join(results)} = {call_str}"
-            else:
-                return f"{indent}{call_str}"
-        
-        # JMP (7) - переход
-        elif op == LuaOpcode.JMP:
-            return f"{indent}-- goto PC+{sbx + 1}"
-        
-        # SELF (8) - метод объекта
-        elif op == LuaOpcode.SELF:
-            obj = registers.get(b, reg_to_var.get(b, f"var{b}"))
-            key = self._get_rk_value(c, registers, constants, reg_to_var)
-            registers[a] = obj
-            registers[a + 1] = f"{obj}:{key}"
+        # Заголовок "for ... do" выводит сам FORPREP
+        self._emit_instructions(state, flow.starts[block], prep + 1, indent)
+        state.closers.append(f"{indent}end")
+        self._emit_loop_body(state, prep + 1, loop, loop + 1, indent + "  ")
+        self._emit(state.closers.pop())
+        return loop + 1
+    
+    def _emit_loop(self, state: 'FunctionState', header: int, latch: int, end: int,
+                   indent: str) -> Optional[int]:
+        """while или repeat по обратному ребру latch -> header"""
+        flow = state.flow
+        start = flow.starts[header]
+        
+        # while: условие в заголовке (истинно - тело, ложно - выход), тело
+        # кончается безусловным переходом к заголовку. Проверяется первым:
+        # последний if тела Lua 5.1 переводит прямо на заголовок, и такой
+        # latch с условием похож на repeat
+        def loop_end(body_pc, exit_pc):
+            """pc выхода из while по переходу заголовка на выход (None - не while)"""
+            if not body_pc < exit_pc <= end and exit_pc == self._jump_target(state, end):
+                exit_pc = end
+            jump = exit_pc - 1
+            if body_pc <= jump and exit_pc <= end and self._jump_target(state, jump) == start:
+                return exit_pc
             return None
         
-        # LOADBOOL (9) - загрузка boolean
-        elif op == LuaOpcode.LOADBOOL:
-            val = "true" if b != 0 else "false"
-            registers[a] = var_a
-            return f"{indent}local {var_a} = {val}"
+        loop = None
+        if flow.branch[header] >= 0 and latch != header:
+            chain = self._condition_chain(state, header, end, loop_end)
+            if chain is not None:
+                tree, body_pc, exit_pc = chain
+                loop = tree, body_pc, loop_end(body_pc, exit_pc)
+        
+        # while true: тело кончается безусловным переходом к заголовку.
+        # Lua 5.1 переводит на заголовок и обход break в конце тела, и break
+        # внутреннего цикла в конце тела - latch похож на repeat, а сам
+        # переход в конце, бывает, недостижим (его нет в графе)
+        if (latch >= 0 and header not in state.open_loops
+                and (loop is None or loop[2] < flow.end(latch))):
+            if state.back_jumps is None:
+                state.back_jumps = self._back_jumps(state)
+            jump = state.back_jumps.get(start, -1)
+            if flow.end(latch) - 1 <= jump < end:
+                return self._emit_while_true(state, header, jump, indent)
+        
+        # while кончается раньше дальнего latch - это while в начале тела
+        # repeat с тем же заголовком (latch -1 - только while)
+        if latch >= 0 and (loop is None or loop[2] < flow.end(latch)):
+            after = self._emit_repeat(state, header, latch, end, indent)
+            if after is not None:
+                return after
+        return loop and self._emit_while(state, header, loop, indent)
+    
+    def _emit_while(self, state: 'FunctionState', header: int, loop: tuple,
+                    indent: str) -> int:
+        """while по условию заголовка; loop - (условие, начало тела, выход)"""
+        flow = state.flow
+        start = flow.starts[header]
+        tree, body_pc, exit_pc = loop
+        cond = flow.branch[header]
+        if cond == start:
+            self._emit(f"{indent}while {self._condition_text(state, tree)} do")
+        else:
+            # Условие вычисляется инструкциями заголовка - каждый проход
+            self._emit(f"{indent}while true do")
+            self._emit_instructions(state, start, cond, indent + "  ")
+            self._emit(f"{indent}  if {self._condition_text(state, tree, True)} then break end")
+        state.closers.append(f"{indent}end")
+        self._emit_loop_body(state, body_pc, exit_pc - 1, exit_pc, indent + "  ")
+        self._emit(state.closers.pop())
+        return exit_pc
+    
+    def _emit_while_true(self, state: 'FunctionState', header: int, jump: int,
+                         indent: str) -> int:
+        """while true: тело до перехода jump на заголовок, выход - только break"""
+        # Переход назад к заголовку в теле - продолжение, а не вложенный repeat
+        state.open_loops.append(header)
+        self._emit(f"{indent}while true do")
+        state.closers.append(f"{indent}end")
+        self._emit_loop_body(state, state.flow.starts[header], jump, jump + 1, indent + "  ")
+        self._emit(state.closers.pop())
+        state.open_loops.pop()
+        return jump + 1
+    
+    def _emit_repeat(self, state: 'FunctionState', header: int, latch: int, end: int,
+                     indent: str) -> Optional[int]:
+        """repeat ... until: условие в конце тела, переход назад - продолжение"""
+        flow = state.flow
+        exit_pc = flow.end(latch)
+        if exit_pc > end or latch < header:
+            return None
+        if flow.branch[latch] < 0 or flow.succ[latch] != [flow.block_at.get(exit_pc), header]:
+            return None
         
-        # LEN (10) - длина
-        elif op == LuaOpcode.LEN:
-            val = registers.get(b, reg_to_var.get(b, f"var{b}"))
-            registers[a] = var_a
-            return f"{indent}local {var_a} = (#{val})"
+        tree, cond = self._until_chain(state, header, latch)
+        # Список, а не множество: вложенные repeat могут делить заголовок
+        state.open_loops.append(header)
+        self._emit(f"{indent}repeat")
+        # Условие зависит от кода тела: при прерванном выводе - until true
+        state.closers.append(f"{indent}until true")
+        self._emit_loop_body(state, flow.starts[header], cond, exit_pc, indent + "  ")
+        state.closers.pop()
+        state.open_loops.pop()
+        self._emit(f"{indent}until {self._condition_text(state, tree)}")
+        return exit_pc
+    
+    def _emit_loop_body(self, state: 'FunctionState', start: int, end: int,
+                        exit_pc: int, indent: str):
+        """Тело цикла: переход на exit_pc внутри - break"""
+        exits = (exit_pc, self._jump_target(state, exit_pc))
+        saved = state.loop_exits
+        state.loop_exits = exits
+        self._emit_range(state, start, end, indent)
+        state.loop_exits = saved
+    
+    def _emit_if(self, state: 'FunctionState', block: int, end: int,
+                 indent: str) -> Optional[int]:
+        """if/else по условию блока (с цепочкой and/or), слияние - цель
+        отдельного JMP в конце then"""
+        chain = self._condition_chain(state, block, end)
+        if chain is None:
+            return None
+        tree, then_pc, else_pc = chain
+        flow = state.flow
+        start = flow.starts[block]
+        cond = flow.branch[block]
+        
+        # if not cond then break end
+        if else_pc in state.loop_exits:
+            self._emit_instructions(state, start, cond, indent)
+            self._emit(f"{indent}if {self._condition_text(state, tree, True)} then break end")
+            return then_pc
+        
+        # Переход на цель JMP, которым кончается диапазон, - переход в его конец
+        to_end = not then_pc < else_pc <= end and else_pc == self._jump_target(state, end)
+        if to_end:
+            else_pc = end
+        if not then_pc < else_pc <= end:
+            return None
         
-        # NEWTABLE (11) - создание таблицы
-        elif op == LuaOpcode.NEWTABLE:
-            registers[a] = var_a
-            return f"{indent}local {var_a} = {{}}"
-        
-        # LE (12) - <=
-        elif op == LuaOpcode.LE:
-            left = self._get_rk_value(b, registers, constants, reg_to_var)
-            right = self._get_rk_value(c, registers, constants, reg_to_var)
-            cond = f"{left} <= {right}"
-            if a == 0:
-                cond = f"not ({cond})"
-            return f"{indent}if {cond} then"
-        
-        # CLOSURE_ALT (13) - closure альтернативный
-        elif op == LuaOpcode.CLOSURE_ALT:
-            registers[a] = var_a
-            proto_idx = ((bx) & 0x1FF) - 1
-            if 0 <= proto_idx < len(protos):
-                func_body = protos[proto_idx]
-                if func_body and isinstance(func_body, str):
-                    func_lines = func_body.split('\n')
-                    if func_lines and func_lines[0].strip().startswith('function'):
-                        func_lines[0] = f"{indent}local {var_a} = {func_lines[0].strip()}"
-                        return func_lines
+        merge_block = flow.ipdom[block]
+        merge = flow.starts[merge_block] if merge_block is not None else None
+        jump = else_pc - 1
+        code = state.code
+        
+        exit_jump = self._jump_target(state, jump)
+        if (exit_jump is not None and not else_pc < exit_jump <= end
+                and exit_jump == self._jump_target(state, end)):
+            exit_jump = end
+        if (to_end or merge == else_pc or exit_jump is None or exit_jump <= jump
+                or exit_jump in state.loop_exits):
+            # if ... then ... end: then доходит до else_pc (в том числе из
+            # цикла в конце then) или кончается return/break (переход пары
+            # условие+JMP - не выход из then)
+            then_end, else_end = else_pc, None
+        else:
+            # if ... then ... else ... end: then кончается переходом на слияние.
+            # Слияние - цель этого перехода, а не постдоминатор: break в ветках
+            # уводит постдоминатор за цикл
+            else_end = exit_jump
+            if not else_pc < else_end <= end:
+                return None
+            then_end = jump
+        
+        self._emit_instructions(state, start, cond, indent)
+        self._emit(f"{indent}if {self._condition_text(state, tree)} then")
+        state.closers.append(f"{indent}end")
+        self._emit_range(state, then_pc, then_end, indent + "  ")
+        if else_end is not None:
+            self._emit(f"{indent}else")
+            self._emit_range(state, else_pc, else_end, indent + "  ")
+        self._emit(state.closers.pop())
+        return else_pc if else_end is None else else_end
+    
+    def _jump_target(self, state: 'FunctionState', pc: int) -> Optional[int]:
+        """Цель JMP в pc, если это отдельный JMP (None - другая инструкция)
+        
+        Lua 5.1 переводит переходы, ждущие следующую инструкцию, сразу на
+        цель такого JMP: конец тела while - на заголовок, конец ветки then -
+        на слияние, break - за внешний цикл.
+        """
+        if pc < state.flow.size and self._is_plain_jump(state, pc):
+            return pc + 1 + state.code.sbx[pc]
+        return None
+    
+    def _back_jumps(self, state: 'FunctionState') -> Dict[int, int]:
+        """Цель → pc последнего отдельного JMP назад на нее"""
+        code = state.code
+        ops, code_sbx = code.op, code.sbx
+        kinds = self.FLOW
+        result = {}
+        for pc in range(state.flow.size):
+            if code_sbx[pc] < 0 and kinds[ops[pc]] == FLOW_JMP and self._is_plain_jump(state, pc):
+                result[pc + 1 + code_sbx[pc]] = pc
+        return result
+    
+    def _is_plain_jump(self, state: 'FunctionState', pc: int) -> bool:
+        """JMP сам по себе, а не переход пары условие+JMP"""
+        code = state.code
+        kinds = self.FLOW
+        if kinds[code.op[pc]] != FLOW_JMP:
+            return False
+        return pc == 0 or kinds[code.op[pc - 1]] != FLOW_COND
+    
+    def _condition_chain(self, state: 'FunctionState', block: int, end: int,
+                         accept=None) -> Optional[Tuple[tuple, int, int]]:
+        """Условие ветвления блока вместе с идущими следом парами условие+JMP
+        
+        Lua 5.1 компилирует and/or в условии if/while в цепочку пар, каждая
+        переходит на then, на else или на следующую пару. Берется самая
+        длинная цепочка, которая сворачивается в одно условие (_fold_condition)
+        и подходит accept(pc then, pc else), если он задан.
+        Результат - (дерево условия, pc ветки then, pc ветки else) или None.
+        """
+        flow = state.flow
+        code = state.code
+        then_block, else_block = flow.succ[block]
+        block_end = flow.end(block)
+        if flow.starts[then_block] != block_end:
+            return None
+        cond = flow.branch[block]
+        chain = [(cond, flow.starts[else_block])]
+        
+        # Следующие пары - блоки ровно из условия и JMP (TESTSET пишет регистр,
+        # заголовок цикла и блок, достижимый в обход цепочки, - начало
+        # следующего оператора)
+        pc = block_end
+        if cond + 1 == block_end - 1 and self.OPCODE_NAMES[code.op[cond]] != 'TESTSET':
+            while pc + 2 <= end:
+                pair = flow.block_at.get(pc)
+                if (pair is None or flow.branch[pair] != pc or flow.end(pair) != pc + 2
+                        or pair in flow.loops or not block <= flow.idom[pair] < pair
+                        or self.OPCODE_NAMES[code.op[pc]] == 'TESTSET'):
+                    break
+                chain.append((pc, pc + 2 + code.sbx[pc + 1]))
+                pc += 2
+        
+        for count in range(len(chain), 1, -1):
+            then_pc = chain[count - 1][0] + 2
+            else_pc = chain[count - 1][1]
+            if else_pc <= then_pc and else_pc != self._jump_target(state, end):
+                continue
+            if accept is not None and not accept(then_pc, else_pc):
+                continue
+            pairs = chain[:count]
+            alias = self._jump_target(state, then_pc)
+            if alias is not None:
+                # then начинается с JMP (break): переходы на then идут на его цель
+                pairs = [(pc, then_pc if target == alias else target)
+                         for pc, target in pairs[:-1]] + pairs[-1:]
+            tree = self._fold_condition(pairs, 0, count, then_pc, else_pc, False)
+            if tree is not None:
+                return tree, then_pc, else_pc
+        if accept is not None and not accept(block_end, chain[0][1]):
+            return None
+        return ('leaf', cond, False), block_end, chain[0][1]
+    
+    def _until_chain(self, state: 'FunctionState', header: int,
+                     latch: int) -> Tuple[tuple, int]:
+        """Условие until: пары условие+JMP в конце тела repeat
+        
+        Истинно - выход (после latch), ложно - переход на заголовок.
+        Результат - (дерево условия, pc первой пары: конец тела цикла).
+        """
+        flow = state.flow
+        code = state.code
+        start = flow.starts[header]
+        exit_pc = flow.end(latch)
+        cond = flow.branch[latch]
+        chain = [(cond, flow.starts[flow.succ[latch][1]])]
+        
+        # Предыдущие пары - блоки, которые кончаются условием и JMP
+        block = latch
+        while flow.starts[block] == chain[0][0] and block > header:
+            block -= 1
+            pc = flow.branch[block]
+            if pc < 0 or pc + 2 != flow.end(block) or self.OPCODE_NAMES[code.op[pc]] == 'TESTSET':
+                break
+            chain.insert(0, (pc, pc + 2 + code.sbx[pc + 1]))
+        # Цепочка начинается не раньше последней пары, достижимой в обход
+        # предыдущих (например, после break)
+        first = latch - len(chain) + 1
+        for index in range(len(chain) - 1, 0, -1):
+            if not first <= flow.idom[first + index] < first + index:
+                chain = chain[index:]
+                break
+        
+        alias = self._jump_target(state, exit_pc)
+        if alias is not None:
+            # Выходы из until на цель следующего JMP - выходы из цикла
+            chain = [(pc, exit_pc if target == alias else target) for pc, target in chain]
+        for first in range(len(chain) - 1):
+            tree = self._fold_condition(chain[first:], 0, len(chain) - first, exit_pc, start, False)
+            if tree is not None:
+                return tree, chain[first][0]
+        return ('leaf', cond, False), cond
+    
+    def _fold_condition(self, chain: List[Tuple[int, int]], lo: int, hi: int,
+                        fall: int, other: int, negate: bool) -> Optional[tuple]:
+        """Дерево условия для пар chain[lo:hi]: истинно - переход на fall
+        (конец диапазона), negate - на other. Пара (pc условия, цель JMP)
+        выполняет JMP, когда условие ложно. None - не сворачивается.
+        """
+        pc, target = chain[lo]
+        if lo + 1 == hi:
+            return ('leaf', pc, negate) if target == other else None
+        if target == other:
+            rest = self._fold_condition(chain, lo + 1, hi, fall, other, negate)
+            return rest and ('or' if negate else 'and', ('leaf', pc, negate), rest)
+        if target == fall:
+            rest = self._fold_condition(chain, lo + 1, hi, fall, other, negate)
+            return rest and ('and' if negate else 'or', ('leaf', pc, not negate), rest)
+        
+        # Переход на пару внутри: (подусловие) and/or остаток
+        starts = [start for start, _ in chain]
+        if target not in starts[lo + 2:hi]:
+            return None
+        split = starts.index(target, lo + 2, hi)
+        while True:
+            inner = [starts.index(t, split + 1, hi) for _, t in chain[lo:split]
+                     if t in starts[split + 1:hi]]
+            if not inner:
+                break
+            split = max(inner)
+        outer = {t for _, t in chain[lo:split]} - set(starts[lo + 1:split + 1])
+        if outer == {other}:
+            left = self._fold_condition(chain, lo, split, starts[split], other, negate)
+            op = 'or' if negate else 'and'
+        elif outer == {fall}:
+            left = self._fold_condition(chain, lo, split, starts[split], fall, not negate)
+            op = 'and' if negate else 'or'
+        else:
+            return None
+        right = self._fold_condition(chain, split, hi, fall, other, negate)
+        return left and right and (op, left, right)
+    
+    def _condition_text(self, state: 'FunctionState', tree: tuple, negate: bool = False) -> str:
+        """Текст дерева условия (negate - отрицание, по законам де Моргана)"""
+        return self._condition_part(state, tree, negate)[0]
+    
+    def _condition_part(self, state: 'FunctionState', tree: tuple, negate: bool) -> Tuple[str, int]:
+        """(текст, приоритет): 0 - операнд, 1 - and, 2 - or"""
+        if tree[0] == 'leaf':
+            return self._branch_condition(state, tree[1], tree[2] != negate), 0
+        op = tree[0]
+        if negate:
+            op = 'or' if op == 'and' else 'and'
+        parts = []
+        for part in tree[1:]:
+            text, priority = self._condition_part(state, part, negate)
+            if op == 'and' and priority == 2:
+                text = f"({text})"
+            parts.append(text)
+        return f"{parts[0]} {op} {parts[1]}", 1 if op == 'and' else 2
+    
+    def _branch_condition(self, state: 'FunctionState', pc: int, negate: bool = False) -> str:
+        """Условие, при котором инструкция-условие пропускает следующую (ветка then)
+        
+        negate - условие выполнения следующей инструкции (ветка перехода).
+        """
+        if pc >= state.next_pc:
+            state.next_pc = state.scope.advance(pc)
+        code = state.code
+        a, b, c = code.a[pc], code.b[pc], code.c[pc]
+        name = self.OPCODE_NAMES[code.op[pc]]
+        symbol = COMPARE_SYMBOLS.get(name)
+        registers, reg_to_var = state.registers, state.reg_to_var
+        
+        if symbol is not None:
+            # EQ/LT/LE: пропуск, если (RK(B) op RK(C)) ~= A
+            left = self._get_rk_value(b, registers, state.constants, reg_to_var)
+            right = self._get_rk_value(c, registers, state.constants, reg_to_var)
+            if (a == 0) != negate:
+                return f"{left} {symbol} {right}"
+            if name == 'EQ':
+                return f"{left} ~= {right}"
+            return f"not ({left} {symbol} {right})"
+        
+        # TEST (регистр A) / TESTSET (регистр B): пропуск, если истинность ~= C
+        reg = a if name == 'TEST' else b
+        val = registers.get(reg, reg_to_var.get(reg, f"var{reg}"))
+        return val if (c == 0) != negate else f"not {val}"
+    
+    def _emit_instructions(self, state: 'FunctionState', start: int, end: int, indent: str):
+        """Построчный вывод инструкций [start, end)"""
+        emit = self._emit
+        code = state.code
+        ops, code_a, code_b, code_c = code.op, code.a, code.b, code.c
+        code_bx, code_sbx = code.bx, code.sbx
+        constants, protos = state.constants, state.protos
+        reg_to_var, registers = state.reg_to_var, state.registers
+        dispatch = self.DISPATCH
+        names = self.OPCODE_NAMES
+        kinds = self.FLOW
+        loop_exits = state.loop_exits
+        legacy_gc = gc_policy == 'legacy'
+        budgeted = self.budgeted
+        
+        for pc in range(start, end):
+            if budgeted:
+                self._check_budget()
+            if pc >= state.next_pc:
+                state.next_pc = state.scope.advance(pc)
+            try:
+                op = ops[pc]
+                if kinds[op] == FLOW_JMP and pc + 1 + code_sbx[pc] in loop_exits:
+                    emit(f"{indent}break")
+                    continue
+                line = dispatch[op](
+                    self, code_a[pc], code_b[pc], code_c[pc], code_bx[pc], code_sbx[pc],
+                    constants, protos, reg_to_var, registers, indent
+                )
+                
+                if line:
+                    if line.__class__ is str:
+                        emit(line)
+                    elif line is UNHANDLED:
+                        emit(f"{indent}-- {names[op]} A={code_a[pc]} B={code_b[pc]} C={code_c[pc]}")
                     else:
-                        return [f"{indent}local {var_a} = {func_body}"]
-            return f"{indent}local {var_a} = function() end  -- closure_alt idx={proto_idx}"
-        
-        # SETTABLE_ALT (14) - установка в таблицу (альт)
-        elif op == LuaOpcode.SETTABLE_ALT:
-            table = registers.get(a, var_a)
-            key = self._get_rk_value(b, registers, constants, reg_to_var)
-            value = self._get_rk_value(c, registers, constants, reg_to_var)
-            return f"{indent}{table}[{key}] = {value}"
-        
-        # TESTSET (15) - testset
-        elif op == LuaOpcode.TESTSET:
-            var_b = reg_to_var.get(b, f"var{b}")
-            val = registers.get(b, var_b)
-            cond = val if c != 0 else f"not {val}"
-            return f"{indent}if {cond} then\n{indent}  {var_a} = {var_b}"
-        
-        # MOD (16) - %
-        elif op == LuaOpcode.MOD:
-            left = self._get_rk_value(b, registers, constants, reg_to_var)
-            right = self._get_rk_value(c, registers, constants, reg_to_var)
-            registers[a] = var_a
-            return f"{indent}local {var_a} = ({left} % {right})"
-        
-        # GETUPVAL (17) - получение upvalue
-        elif op == LuaOpcode.GETUPVAL:
-            registers[a] = var_a
-            return f"{indent}local {var_a} = upval{b}"
-        
-        # FORPREP (18) - подготовка for
-        elif op == LuaOpcode.FORPREP:
-            var_idx = reg_to_var.get(a, f"var{a}")
-            var_limit = reg_to_var.get(a + 1, f"var{a + 1}")
-            var_step = reg_to_var.get(a + 2, f"var{a + 2}")
-            var_loop = reg_to_var.get(a + 3, f"i")
-            return f"{indent}for {var_loop} = {var_idx}, {var_limit}, {var_step} do"
-        
-        # MUL (19) - умножение
-        elif op == LuaOpcode.MUL:
-            left = self._get_rk_value(b, registers, constants, reg_to_var)
-            right = self._get_rk_value(c, registers, constants, reg_to_var)
-            registers[a] = var_a
-            return f"{indent}local {var_a} = ({left} * {right})"
-        
-        # CONCAT (20) - конкатенация
-        elif op == LuaOpcode.CONCAT:
-            parts = []
-            for i in range(b, c + 1):
-                parts.append(registers.get(i, reg_to_var.get(i, f"var{i}")))
-            expr = " .. ".join(parts)
-            registers[a] = var_a
-            return f"{indent}local {var_a} = ({expr})"
-        
-        # GETTABLE (21) - получение из таблицы
-        elif op == LuaOpcode.GETTABLE:
-            table = registers.get(b, reg_to_var.get(b, f"var{b}"))
-            key = self._get_rk_value(c, registers, constants, reg_to_var)
-            registers[a] = var_a
-            return f"{indent}local {var_a} = {table}[{key}]"
-        
-        # SETLIST (22) - установка списка
-        elif op == LuaOpcode.SETLIST:
-            table = registers.get(a, var_a)
-            lines = []
-            for i in range(1, b + 1):
-                idx = (c - 1) * 50 + i
-                val = registers.get(a + i, reg_to_var.get(a + i, f"var{a + i}"))
-                lines.append(f"{indent}{table}[{idx}] = {val}")
-            return lines
-        
-        # LOADBOOL_ALT (23) - загрузка boolean (альт)
-        elif op == LuaOpcode.LOADBOOL_ALT:
-            val = "true" if b != 0 else "false"
-            registers[a] = var_a
-            return f"{indent}local {var_a} = {val}"
-        
-        # SETLIST_ALT (24) - установка списка (альт)
-        elif op == LuaOpcode.SETLIST_ALT:
-            table = registers.get(a, var_a)
-            lines = []
-            for i in range(1, b + 1):
-                idx = (c - 1) * 50 + i
-                val = registers.get(a + i, reg_to_var.get(a + i, f"var{a + i}"))
-                lines.append(f"{indent}{table}[{idx}] = {val}")
-            return lines
-        
-        # UNM (25) - унарный минус
-        elif op == LuaOpcode.UNM:
-            val = registers.get(b, reg_to_var.get(b, f"var{b}"))
+                        for item in line:
+                            emit(item)
+            except Exception as e:
+                emit(f"{indent}-- Error processing instruction {pc}: {str(e)[:100]}")
+            
+            # Очистка памяти каждые 5000 инструкций (только политика legacy)
+            if legacy_gc and (pc + 1) % 5000 == 0:
+                gc.collect()
+    
+    def _build_register_mapping(self, code: CodeArrays, 
+                                locals_info: List[LocalVar], 
+                                num_params: int) -> 'RegisterNames':
+        """Маппинг регистр -> имя переменной из debug info (меняется по ходу pc)"""
+        # Параметры функции без debug info
+        fixed = {i: f"arg{i}" for i in range(len(locals_info), num_params)}
+        return RegisterNames(locals_info, fixed)
+    
+    # Обработчики опкодов: _op_<имя из карты опкодов в нижнем регистре>.
+    # Общая сигнатура: (a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent),
+    # результат - строка, список строк, None (ничего не выводить) или UNHANDLED
+    # (комментарий с именем опкода и полями).
+    
+    def _binary(self, symbol, a, b, c, constants, reg_to_var, registers, indent):
+        """Арифметика над RK(B) и RK(C) в регистр A"""
+        var_a = reg_to_var.get(a, f"var{a}")
+        left = self._get_rk_value(b, registers, constants, reg_to_var)
+        right = self._get_rk_value(c, registers, constants, reg_to_var)
+        registers[a] = var_a
+        return f"{indent}local {var_a} = ({left} {symbol} {right})"
+    
+    def _compare(self, symbol, a, b, c, constants, reg_to_var, registers, indent):
+        """Сравнение RK(B) и RK(C), A=0 - условие инвертировано"""
+        left = self._get_rk_value(b, registers, constants, reg_to_var)
+        right = self._get_rk_value(c, registers, constants, reg_to_var)
+        cond = f"{left} {symbol} {right}"
+        if a == 0:
+            cond = f"not ({cond})"
+        return f"{indent}if {cond} then"
+    
+    def _op_sub(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        return self._binary('-', a, b, c, constants, reg_to_var, registers, indent)
+    
+    def _op_mod(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        return self._binary('%', a, b, c, constants, reg_to_var, registers, indent)
+    
+    def _op_mul(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        return self._binary('*', a, b, c, constants, reg_to_var, registers, indent)
+    
+    def _op_div(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        return self._binary('/', a, b, c, constants, reg_to_var, registers, indent)
+    
+    def _op_add(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        return self._binary('+', a, b, c, constants, reg_to_var, registers, indent)
+    
+    def _op_pow(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        return self._binary('^', a, b, c, constants, reg_to_var, registers, indent)
+    
+    def _op_le(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        return self._compare('<=', a, b, c, constants, reg_to_var, registers, indent)
+    
+    def _op_eq(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        return self._compare('==', a, b, c, constants, reg_to_var, registers, indent)
+    
+    def _op_lt(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        return self._compare('<', a, b, c, constants, reg_to_var, registers, indent)
+    
+    def _op_loadk(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        if bx < len(constants):
+            var_a = reg_to_var.get(a, f"var{a}")
             registers[a] = var_a
-            return f"{indent}local {var_a} = (-{val})"
-        
-        # RETURN (26) - возврат
-        elif op == LuaOpcode.RETURN:
-            if b == 0:
-                return f"{indent}return ..."
-            elif b == 1:
-                return f"{indent}return"
-            elif b == 2:
-                value = registers.get(a, var_a)
-                return f"{indent}return {value}"
+            return f"{indent}local {var_a} = {self._format_constant(constants[bx])}"
+        return UNHANDLED
+    
+    _op_loadk_bx = _op_loadk
+    
+    def _op_test(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        val = registers.get(a, reg_to_var.get(a, f"var{a}"))
+        cond = val if c != 0 else f"not {val}"
+        return f"{indent}if {cond} then"
+    
+    def _op_settable(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        table = registers.get(a, reg_to_var.get(a, f"var{a}"))
+        key = self._get_rk_value(b, registers, constants, reg_to_var)
+        value = self._get_rk_value(c, registers, constants, reg_to_var)
+        return f"{indent}{table}[{key}] = {value}"
+    
+    _op_settable_alt = _op_settable
+    
+    def _op_loadnil(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_a = reg_to_var.get(a, f"var{a}")
+        registers[a] = var_a
+        return f"{indent}local {var_a} = nil"
+    
+    def _op_call(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_a = reg_to_var.get(a, f"var{a}")
+        func = registers.get(a, var_a)
+        args = []
+        if b > 1:
+            for i in range(1, b):
+                arg_reg = a + i
+                args.append(registers.get(arg_reg, reg_to_var.get(arg_reg, f"var{arg_reg}")))
+        elif b == 0:
+            args.append("...")
+        call_str = f"{func}({', '.join(args)})"
+        if c > 1:
+            if c == 2:
+                registers[a] = var_a
+                return f"{indent}local {var_a} = {call_str}"
             else:
-                values = []
-                for i in range(b - 1):
-                    values.append(registers.get(a + i, reg_to_var.get(a + i, f"var{a + i}")))
-                return f"{indent}return {', '.join(values)}"
-        
-        # DIV (27) - деление
-        elif op == LuaOpcode.DIV:
-            left = self._get_rk_value(b, registers, constants, reg_to_var)
-            right = self._get_rk_value(c, registers, constants, reg_to_var)
-            registers[a] = var_a
-            return f"{indent}local {var_a} = ({left} / {right})"
-        
-        # MOVE (28) - копирование регистра
-        elif op == LuaOpcode.MOVE:
-            var_b = reg_to_var.get(b, f"var{b}")
-            registers[a] = var_a
-            return f"{indent}local {var_a} = {registers.get(b, var_b)}"
-        
-        # SETGLOBAL (29) - установка глобальной
-        elif op == LuaOpcode.SETGLOBAL:
-            if bx < len(constants):
-                name = constants[bx]
-                value = registers.get(a, var_a)
-                return f"{indent}{name} = {value}"
-        
-        # ADD (30) - сложение
-        elif op == LuaOpcode.ADD:
-            left = self._get_rk_value(b, registers, constants, reg_to_var)
-            right = self._get_rk_value(c, registers, constants, reg_to_var)
-            registers[a] = var_a
-            return f"{indent}local {var_a} = ({left} + {right})"
-        
-        # EQ (31) - ==
-        elif op == LuaOpcode.EQ:
-            left = self._get_rk_value(b, registers, constants, reg_to_var)
-            right = self._get_rk_value(c, registers, constants, reg_to_var)
-            cond = f"{left} == {right}"
-            if a == 0:
-                cond = f"not ({cond})"
-            return f"{indent}if {cond} then"
-        
-        # FORLOOP (32) - цикл for
-        elif op == LuaOpcode.FORLOOP:
-            return f"{indent}end -- for loop"
-        
-        # LT (33) - <
-        elif op == LuaOpcode.LT:
-            left = self._get_rk_value(b, registers, constants, reg_to_var)
-            right = self._get_rk_value(c, registers, constants, reg_to_var)
-            cond = f"{left} < {right}"
-            if a == 0:
-                cond = f"not ({cond})"
-            return f"{indent}if {cond} then"
-        
-        # POW (34) - степень
-        elif op == LuaOpcode.POW:
-            left = self._get_rk_value(b, registers, constants, reg_to_var)
-            right = self._get_rk_value(c, registers, constants, reg_to_var)
-            registers[a] = var_a
-            return f"{indent}local {var_a} = ({left} ^ {right})"
-        
-        # SETUPVAL (35) - установка upvalue
-        elif op == LuaOpcode.SETUPVAL:
-            value = registers.get(a, var_a)
-            return f"{indent}upval{b} = {value}"
-        
-        # CLOSURE (36) - создание замыкания
-        elif op == LuaOpcode.CLOSURE:
+                results = [reg_to_var.get(a + i, f"var{a + i}") for i in range(c - 1)]
+                for i in range(c - 1):
+                    registers[a + i] = reg_to_var.get(a + i, f"var{a + i}")
+                return f"{indent}local {', '.join(results)} = {call_str}"
+        else:
+            return f"{indent}{call_str}"
+    
+    def _op_jmp(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        return f"{indent}-- goto PC+{sbx + 1}"
+    
+    def _op_self(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        obj = registers.get(b, reg_to_var.get(b, f"var{b}"))
+        key = self._get_rk_value(c, registers, constants, reg_to_var)
+        registers[a] = obj
+        registers[a + 1] = f"{obj}:{key}"
+        return None
+    
+    def _op_loadbool(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_a = reg_to_var.get(a, f"var{a}")
+        registers[a] = var_a
+        return f"{indent}local {var_a} = {'true' if b != 0 else 'false'}"
+    
+    _op_loadbool_alt = _op_loadbool
+    
+    def _op_len(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_a = reg_to_var.get(a, f"var{a}")
+        val = registers.get(b, reg_to_var.get(b, f"var{b}"))
+        registers[a] = var_a
+        return f"{indent}local {var_a} = (#{val})"
+    
+    def _op_newtable(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_a = reg_to_var.get(a, f"var{a}")
+        registers[a] = var_a
+        return f"{indent}local {var_a} = {{}}"
+    
+    def _op_closure(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_a = reg_to_var.get(a, f"var{a}")
+        registers[a] = var_a
+        proto_idx = ((bx) & 0x1FF) - 1
+        if 0 <= proto_idx < len(protos):
+            # Тело вложенной функции пишется в поток прямо здесь
+            self.generate_code(protos[proto_idx], f"{indent}local {var_a} = ")
+            return None
+        return f"{indent}local {var_a} = function() end  -- closure idx={proto_idx} (protos={len(protos)})"
+    
+    def _op_closure_alt(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_a = reg_to_var.get(a, f"var{a}")
+        registers[a] = var_a
+        proto_idx = ((bx) & 0x1FF) - 1
+        if 0 <= proto_idx < len(protos):
+            self.generate_code(protos[proto_idx], f"{indent}local {var_a} = ")
+            return None
+        return f"{indent}local {var_a} = function() end  -- closure_alt idx={proto_idx}"
+    
+    def _op_testset(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_a = reg_to_var.get(a, f"var{a}")
+        var_b = reg_to_var.get(b, f"var{b}")
+        val = registers.get(b, var_b)
+        cond = val if c != 0 else f"not {val}"
+        # Вне свернутого условия (a and b or c): переход следом - отдельной строкой
+        return f"{indent}if {cond} then\n{indent}  {var_a} = {var_b}\n{indent}end"
+    
+    def _op_getupval(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_a = reg_to_var.get(a, f"var{a}")
+        registers[a] = var_a
+        return f"{indent}local {var_a} = upval{b}"
+    
+    def _op_forprep(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_idx = reg_to_var.get(a, f"var{a}")
+        var_limit = reg_to_var.get(a + 1, f"var{a + 1}")
+        var_step = reg_to_var.get(a + 2, f"var{a + 2}")
+        var_loop = reg_to_var.get(a + 3, f"i")
+        return f"{indent}for {var_loop} = {var_idx}, {var_limit}, {var_step} do"
+    
+    def _op_concat(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_a = reg_to_var.get(a, f"var{a}")
+        parts = []
+        for i in range(b, c + 1):
+            parts.append(registers.get(i, reg_to_var.get(i, f"var{i}")))
+        expr = " .. ".join(parts)
+        registers[a] = var_a
+        return f"{indent}local {var_a} = ({expr})"
+    
+    def _op_gettable(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_a = reg_to_var.get(a, f"var{a}")
+        table = registers.get(b, reg_to_var.get(b, f"var{b}"))
+        key = self._get_rk_value(c, registers, constants, reg_to_var)
+        registers[a] = var_a
+        return f"{indent}local {var_a} = {table}[{key}]"
+    
+    def _op_setlist(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        table = registers.get(a, reg_to_var.get(a, f"var{a}"))
+        lines = []
+        for i in range(1, b + 1):
+            idx = (c - 1) * 50 + i
+            val = registers.get(a + i, reg_to_var.get(a + i, f"var{a + i}"))
+            lines.append(f"{indent}{table}[{idx}] = {val}")
+        return lines
+    
+    _op_setlist_alt = _op_setlist
+    
+    def _op_unm(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_a = reg_to_var.get(a, f"var{a}")
+        val = registers.get(b, reg_to_var.get(b, f"var{b}"))
+        registers[a] = var_a
+        return f"{indent}local {var_a} = (-{val})"
+    
+    def _op_return(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        if b == 0:
+            return f"{indent}return ..."
+        elif b == 1:
+            return f"{indent}return"
+        elif b == 2:
+            value = registers.get(a, reg_to_var.get(a, f"var{a}"))
+            return f"{indent}return {value}"
+        else:
+            values = []
+            for i in range(b - 1):
+                values.append(registers.get(a + i, reg_to_var.get(a + i, f"var{a + i}")))
+            return f"{indent}return {', '.join(values)}"
+    
+    def _op_move(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        var_a = reg_to_var.get(a, f"var{a}")
+        var_b = reg_to_var.get(b, f"var{b}")
+        registers[a] = var_a
+        return f"{indent}local {var_a} = {registers.get(b, var_b)}"
+    
+    def _op_setglobal(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        if bx < len(constants):
+            value = registers.get(a, reg_to_var.get(a, f"var{a}"))
+            return f"{indent}{constants[bx]} = {value}"
+        return UNHANDLED
+    
+    def _op_forloop(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        return f"{indent}end -- for loop"
+    
+    def _op_setupval(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        value = registers.get(a, reg_to_var.get(a, f"var{a}"))
+        return f"{indent}upval{b} = {value}"
+    
+    def _op_vararg(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        if b == 0:
+            return f"{indent}local {reg_to_var.get(a, f'var{a}')} = ..."
+        elif b == 1:
+            return None
+        else:
+            vars_list = [reg_to_var.get(a + i, f"var{a + i}") for i in range(b - 1)]
+            return f"{indent}local {', '.join(vars_list)} = ..."
+    
+    def _op_getglobal(self, a, b, c, bx, sbx, constants, protos, reg_to_var, registers, indent):
+        if bx < len(constants):
+            var_a = reg_to_var.get(a, f"var{a}")
             registers[a] = var_a
-            proto_idx = ((bx) & 0x1FF) - 1
-            if 0 <= proto_idx < len(protos):
-                func_body = protos[proto_idx]
-                if func_body and isinstance(func_body, str):
-                    func_lines = func_body.split('\n')
-                    if func_lines and func_lines[0].strip().startswith('function'):
-                        func_lines[0] = f"{indent}local {var_a} = {func_lines[0].strip()}"
-                        return func_lines
-                    else:
-                        return [f"{indent}local {var_a} = {func_body}"]
-            return f"{indent}local {var_a} = function() end  -- closure idx={proto_idx} (protos={len(protos)})"
-        
-        # VARARG (37) - переменные аргументы
-        elif op == LuaOpcode.VARARG:
-            if b == 0:
-                return f"{indent}local {var_a} = ..."
-            elif b == 1:
-                return None
-            else:
-                vars_list = [reg_to_var.get(a + i, f"var{a + i}") for i in range(b - 1)]
-                return f"{indent}local {', '.join(vars_list)} = ..."
-        
-        # GETGLOBAL (255) - получение глобальной (если есть)
-        elif op == LuaOpcode.GETGLOBAL:
-            if bx < len(constants):
-                name = constants[bx]
-                registers[a] = var_a
-                return f"{indent}local {var_a} = {name}"
-        
-        return f"{indent}-- {op.name} A={a} B={b} C={c}"
+            return f"{indent}local {var_a} = {constants[bx]}"
+        return UNHANDLED
     
     def _get_rk_value(self, rk: int, registers: Dict[int, str], 
                      constants: List[Any], reg_to_var: Dict[int, str]) -> str:
@@ -661,50 +1346,181 @@ class ImprovedLuaDecompiler:
             return str(const)
     
     def _generate_constants_dump(self, constants: List[Any], 
-                                 protos: List[str], indent: str) -> List[str]:
-        """Генерация дампа констант если код не восстановился"""
-        lines = []
-        lines.append(f"{indent}-- Constants:")
+                                 protos: List[Proto], indent: str):
+        """Дамп констант если код не восстановился (только комментарии)
+        
+        Вложенные функции только перечисляются: их код - часть той же
+        работы, на которую не хватило Budget.
+        """
+        emit = self._emit
+        emit(f"{indent}-- Constants:")
         
         # Выводим ВСЕ константы полностью
         for i, const in enumerate(constants):
             const_str = self._format_constant(const)
-            lines.append(f"{indent}-- [{i}] {const_str}")
+            emit(f"{indent}-- [{i}] {const_str}")
         
         if protos:
-            lines.append(f"{indent}-- {len(protos)} nested functions")
-            # Выводим ВСЕ вложенные функции полностью
+            emit(f"{indent}-- {len(protos)} nested functions")
             for i, proto in enumerate(protos):
-                lines.append(f"\n{indent}-- Nested function {i}:")
-                lines.append(proto)
-        
-        return lines
+                if proto.__class__ is RenderedProto:
+                    header = proto.text.split('\n', 1)[0]
+                    emit(f"{indent}-- [{i}] {header}")
+                else:
+                    emit(f"{indent}-- [{i}] function at line {proto.line_defined}, "
+                         f"{proto.num_params} params, {len(proto.code)} instructions")
+
+
+def build_dispatch(opcodes) -> Tuple[list, list]:
+    """Таблица обработчиков по номеру опкода из декларативной карты
+    
+    opcodes - IntEnum (имя семантики = номер в клиенте), обработчик опкода
+    NAME - метод ImprovedLuaDecompiler._op_name. Результат: (обработчики,
+    имена) - списки на 256 элементов, None для номеров вне карты.
+    """
+    dispatch = [None] * 256
+    names = [None] * 256
+    for opcode in opcodes:
+        handler = getattr(ImprovedLuaDecompiler, f"_op_{opcode.name.lower()}", None)
+        if handler is None:
+            raise ValueError(f"No handler for opcode {opcode.name}")
+        dispatch[opcode.value] = handler
+        names[opcode.value] = opcode.name
+    return dispatch, names
+
+
+ImprovedLuaDecompiler.DISPATCH, ImprovedLuaDecompiler.OPCODE_NAMES = build_dispatch(LuaOpcode)
+ImprovedLuaDecompiler.FLOW = flow_kinds(ImprovedLuaDecompiler.OPCODE_NAMES)
+
+
+def _render_protos(chunk) -> List[Tuple[int, int, str, Dict[str, float], list]]:
+    """Процесс-воркер render_nested: [(start, end, текст прототипа, время по стадиям, downgrades)]"""
+    results = []
+    for cls, start, end, data, limits, deadline in chunk:
+        set_budget(limits)
+        decompiler = cls(data)
+        if deadline is not None:
+            # Остаток срока всего файла, а не полный file_seconds
+            decompiler.deadline = time.perf_counter() + (deadline - time.time())
+        text = decompiler.render_function(1)
+        results.append((start, end, text, decompiler.timings, decompiler.downgrades))
+    return results
 
 
-def decompile_file(filepath: Path) -> Tuple[Optional[str], str]:
+def decompile_file(filepath: Path, timings: Optional[Dict[str, float]] = None) -> Tuple[Optional[str], str]:
     """Декомпиляция файла с оптимизацией памяти"""
     try:
-        with open(filepath, 'rb') as f:
-            data = f.read()
-        
-        if not data.startswith(b'\x1bLua'):
-            return None, "Not Lua bytecode"
+        data = read_lua(filepath)
+    except Exception as e:
+        return None, f"Error: {str(e)}"[:500]
+    
+    return decompile_data(data, timings)
+
+
+def decompile_data(data: bytes, timings: Optional[Dict[str, float]] = None,
+                   jobs: int = 1) -> Tuple[Optional[str], str]:
+    """Декомпиляция байткода, уже находящегося в памяти (например, сразу после расшифровки)"""
+    out = io.StringIO()
+    ok, status = decompile_data_to(data, out, timings, jobs)
+    return (out.getvalue() if ok else None), status
+
+
+def decompile_data_to(data: bytes, out: TextIO, timings: Optional[Dict[str, float]] = None,
+                      jobs: int = 1) -> Tuple[bool, str]:
+    """Декомпиляция байткода с записью кода прямо в текстовый поток
+    
+    В памяти держится только разобранный байткод, а не текст: вывод
+    в файл не ограничен размером. При ошибке разбора в out ничего не пишется,
+    при ошибке генерации в out может остаться начало кода.
+    timings - словарь, к которому прибавляется время по стадиям (parse/cfg/emit).
+    jobs > 1 - прототипы главной функции большого файла (от PARALLEL_MIN_SIZE)
+    выводятся параллельно в пуле процессов (render_nested).
+    Статус - "OK" или budget_status(), если часть функций не уложилась в Budget
+    (файл все равно считается успешным). Budget действует на вывод кода, не на разбор.
+    """
+    try:
+        if not is_lua_chunk(data):
+            return False, "Not Lua bytecode"
         
         decompiler = ImprovedLuaDecompiler(data)
-        code = decompiler.decompile()
+        if jobs > 1 and len(data) >= PARALLEL_MIN_SIZE:
+            decompiler.render_nested(jobs)
+        decompiler.decompile_to(out)
+        if timings is not None:
+            add_timings(timings, decompiler.timings)
+        status = budget_status(decompiler.downgrades)
         
         # Освобождаем память
         del decompiler
         del data
-        gc.collect()
+        if gc_policy != 'none':
+            gc.collect()
         
-        return code, "OK"
+        return True, status
     
     except Exception as e:
         import traceback
         error_msg = f"Error: {str(e)}\n{traceback.format_exc()}"
         # Ограничиваем размер ошибки
-        return None, error_msg[:500]
+        return False, error_msg[:500]
+
+
+def budget_status(downgrades: List[Tuple[int, str]]) -> str:
+    """Статус файла: "OK" или BUDGET_STATUS со списком функций, выведенных константами"""
+    if not downgrades:
+        return "OK"
+    lines = ", ".join(str(line) for line, _ in downgrades[:10])
+    more = f" и еще {len(downgrades) - 10}" if len(downgrades) > 10 else ""
+    return (f"{BUDGET_STATUS}: {len(downgrades)} функций - дамп констант "
+            f"(строки {lines}{more}; {downgrades[0][1]})")
+
+
+def decompile_file_to(filepath: Path, output_file: Path) -> Tuple[bool, str]:
+    """Декомпиляция файла сразу в выходной файл (недописанный файл удаляется)"""
+    try:
+        data = read_lua(filepath)
+    except Exception as e:
+        return False, f"Error: {str(e)}"[:500]
+    
+    return write_decompiled(data, output_file)
+
+
+def write_decompiled(data: bytes, output_file: Path, timings: Optional[Dict[str, float]] = None,
+                     jobs: int = 1, compression: Optional[str] = None) -> Tuple[bool, str]:
+    """Байткод → файл с кодом потоковой записью (недописанный файл удаляется)
+    
+    compression - сжатие на лету (gzip, xz, bz2 из lua_pack.COMPRESSIONS):
+    файл получает суффикс сжатия, x.lua → x.lua.gz; тот же файл в другом
+    формате удаляется.
+    """
+    if not is_lua_chunk(data):
+        return False, "Not Lua bytecode"
+    
+    remove_other_formats(output_file, compression)
+    output_file = compressed_name(Path(output_file), compression)
+    with open_compressed(output_file, compression) as f:
+        ok, status = decompile_data_to(data, f, timings, jobs)
+    if not ok:
+        output_file.unlink(missing_ok=True)
+    return ok, status
+
+
+def add_timings(total: Dict[str, float], timings: Dict[str, float]):
+    """Сложение времени по стадиям (сводка по файлам и процессам)"""
+    for stage, seconds in timings.items():
+        total[stage] = total.get(stage, 0.0) + seconds
+
+
+def write_errors_log(log_file: Path, errors: List[Tuple[str, str]]):
+    """Лог ошибок декомпиляции (decompilation_errors.log)"""
+    with open(log_file, 'w', encoding='utf-8') as f:
+        f.write("ОШИБКИ ДЕКОМПИЛЯЦИИ\n")
+        f.write("=" * 80 + "\n\n")
+        for name, error in errors:
+            f.write(f"Файл: {name}\n")
+            f.write("Ошибка:\n")
+            f.write(f"{error}\n")
+            f.write("-" * 80 + "\n\n")
 
 
 def main():
@@ -728,14 +1544,15 @@ def main():
     ]
     
     for filepath in test_files:
-        if not filepath.exists():
+        if not lua_exists(filepath):
             print(f"⚠️  Файл не найден: {filepath}")
             continue
         
         print(f"📁 Декомпиляция: {filepath}")
         print("-" * 80)
         
-        code, status = decompile_file(filepath)
+        timings = {}
+        code, status = decompile_file(filepath, timings)
         
         if code:
             # Показываем первые 30 строк
@@ -746,6 +1563,8 @@ def main():
                 print(f"\n... ({len(lines) - 30} строк скрыто)")
             print("-" * 80)
             print(f"✅ Успешно! Всего строк: {len(lines)}")
+            print(f"⏱️  Разбор {timings['parse'] * 1000:.1f} мс, CFG {timings['cfg'] * 1000:.1f} мс, "
+                  f"вывод кода {timings['emit'] * 1000:.1f} мс")
         else:
             print(f"❌ Ошибка: {status[:300]}")
         
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Граф потока управления прототипа Lua 5.1
+- Базовые блоки и ребра за один проход по коду
+- Доминаторы и постдоминаторы (итеративный алгоритм Cooper-Harvey-Kennedy
+  по обратному порядку обхода - для кода Lua сходится за 2-3 прохода)
+- Циклы по обратным ребрам (заголовок доминирует над источником ребра)
+Опкоды задаются видами (flow_kinds по именам карты опкодов), поэтому граф
+не зависит от перестановки номеров в клиенте.
+"""
+
+# Виды инструкций для потока управления
+FLOW_NONE = 0      # обычная инструкция
+FLOW_JMP = 1       # безусловный переход pc+1+sBx
+FLOW_COND = 2      # условие: выполнить или пропустить следующую инструкцию
+FLOW_FORPREP = 3   # переход к FORLOOP
+FLOW_FORLOOP = 4   # переход назад к телу цикла или выход
+FLOW_RETURN = 5    # выход из функции
+FLOW_SKIP = 6      # LOADBOOL с C != 0 - пропуск следующей инструкции
+
+FLOW_BY_NAME = {
+    'JMP': FLOW_JMP,
+    'EQ': FLOW_COND,
+    'LT': FLOW_COND,
+    'LE': FLOW_COND,
+    'TEST': FLOW_COND,
+    'TESTSET': FLOW_COND,
+    'FORPREP': FLOW_FORPREP,
+    'FORLOOP': FLOW_FORLOOP,
+    'RETURN': FLOW_RETURN,
+    'LOADBOOL': FLOW_SKIP,
+    'LOADBOOL_ALT': FLOW_SKIP,
+}
+
+
+def flow_kinds(names) -> list:
+    """Виды инструкций по номеру опкода (names - имена по номеру, None - нет опкода)"""
+    return [FLOW_BY_NAME.get(name, FLOW_NONE) for name in names]
+
+
+class ControlFlow:
+    """Базовые блоки, ребра, доминаторы и циклы одного прототипа
+
+    Блок i - инструкции [starts[i], starts[i + 1]). succ[i] - преемники;
+    у ветвления ровно два: [ветка "условие истинно" (пропуск перехода),
+    ветка перехода]. branch[i] - pc инструкции-условия или -1.
+    loops - заголовок цикла -> самый дальний блок с обратным ребром в него.
+    """
+    __slots__ = ('size', 'starts', 'block_at', 'succ', 'branch', 'idom', 'ipdom',
+                 'dom_pre', 'dom_post', 'loops')
+
+    def __init__(self, code, kinds):
+        ops, c_field, sbx = code.op, code.c, code.sbx
+        n = len(ops)
+        self.size = n
+
+        # 1. Начала блоков
+        leader = bytearray(n + 1)
+        leader[0] = 1
+        for pc in range(n):
+            kind = kinds[ops[pc]]
+            if kind == FLOW_NONE:
+                continue
+            if kind == FLOW_COND:
+                # Условие + JMP - одно ветвление, блок заканчивается на JMP
+                if pc + 1 < n and kinds[ops[pc + 1]] == FLOW_JMP:
+                    continue
+                leader[pc + 1] = 1
+                if pc + 2 <= n:
+                    leader[pc + 2] = 1
+            elif kind == FLOW_SKIP:
+                if c_field[pc] != 0:
+                    leader[pc + 1] = 1
+                    if pc + 2 <= n:
+                        leader[pc + 2] = 1
+            else:
+                leader[pc + 1] = 1
+                if kind != FLOW_RETURN:
+                    target = pc + 1 + sbx[pc]
+                    if 0 <= target < n:
+                        leader[target] = 1
+
+        starts = [pc for pc in range(n) if leader[pc]]
+        block_at = {pc: i for i, pc in enumerate(starts)}
+        num_blocks = len(starts)
+        self.starts = starts
+        self.block_at = block_at
+        if not num_blocks:
+            self.succ = self.branch = self.idom = self.ipdom = []
+            self.dom_pre = self.dom_post = []
+            self.loops = {}
+            return
+
+        # 2. Ребра по последней инструкции блока
+        succ = []
+        branch = []
+        for i in range(num_blocks):
+            last = (starts[i + 1] if i + 1 < num_blocks else n) - 1
+            kind = kinds[ops[last]]
+            targets = []
+            cond = -1
+            if kind == FLOW_JMP:
+                jump = block_at.get(last + 1 + sbx[last])
+                if last > starts[i] and kinds[ops[last - 1]] == FLOW_COND:
+                    cond = last - 1
+                    targets.append(block_at.get(last + 1))
+                targets.append(jump)
+            elif kind == FLOW_COND:
+                cond = last
+                targets = [block_at.get(last + 2), block_at.get(last + 1)]
+            elif kind == FLOW_FORPREP:
+                targets = [block_at.get(last + 1 + sbx[last])]
+            elif kind == FLOW_FORLOOP:
+                targets = [block_at.get(last + 1 + sbx[last]), block_at.get(last + 1)]
+            elif kind == FLOW_SKIP and c_field[last] != 0:
+                targets = [block_at.get(last + 2)]
+            elif kind != FLOW_RETURN:
+                targets = [block_at.get(last + 1)]
+            if None in targets:
+                # Переход за пределы кода - ветвлением не считаем
+                targets = [t for t in targets if t is not None]
+                cond = -1
+            succ.append(targets)
+            branch.append(cond)
+        self.succ = succ
+        self.branch = branch
+
+        # 3. Доминаторы от входа, постдоминаторы от виртуального выхода
+        pred = [[] for _ in range(num_blocks + 1)]
+        for i, targets in enumerate(succ):
+            for t in targets:
+                pred[t].append(i)
+        self.idom = _dominators(num_blocks, 0, succ, pred)
+
+        exit_node = num_blocks
+        rsucc = pred[:num_blocks] + [[]]
+        rpred = [list(targets) for targets in succ] + [[]]
+        for i, targets in enumerate(succ):
+            if not targets:
+                rpred[i].append(exit_node)
+                rsucc[exit_node].append(i)
+        ipdom = _dominators(num_blocks + 1, exit_node, rsucc, rpred)
+        self.ipdom = [d if d != exit_node else None for d in ipdom[:num_blocks]]
+
+        # 4. Нумерация дерева доминаторов: dominates() за O(1)
+        self.dom_pre, self.dom_post = _tree_intervals(self.idom, num_blocks)
+
+        # 5. Циклы: обратные ребра u -> h, где h доминирует над u
+        loops = {}
+        for u, targets in enumerate(succ):
+            for h in targets:
+                if self.dominates(h, u) and loops.get(h, -1) < u:
+                    loops[h] = u
+        self.loops = loops
+
+    def dominates(self, a: int, b: int) -> bool:
+        """Блок a доминирует над блоком b (оба достижимы от входа)"""
+        pre = self.dom_pre
+        if pre[a] < 0 or pre[b] < 0:
+            return False
+        return pre[a] <= pre[b] and self.dom_post[b] <= self.dom_post[a]
+
+    def end(self, block: int) -> int:
+        """pc после последней инструкции блока"""
+        return self.starts[block + 1] if block + 1 < len(self.starts) else self.size
+
+
+def _dominators(num_nodes, entry, succ, pred):
+    """Непосредственные доминаторы (None - узел недостижим)"""
+    # Обратный постпорядок итеративным DFS
+    order = []
+    visited = bytearray(num_nodes)
+    visited[entry] = 1
+    stack = [(entry, iter(succ[entry]))]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            if not visited[child]:
+                visited[child] = 1
+                stack.append((child, iter(succ[child])))
+                break
+        else:
+            stack.pop()
+            order.append(node)
+    order.reverse()
+    rpo = [-1] * num_nodes
+    for index, node in enumerate(order):
+        rpo[node] = index
+
+    idom = [None] * num_nodes
+    idom[entry] = entry
+    changed = True
+    while changed:
+        changed = False
+        for node in order[1:]:
+            new_idom = None
+            for p in pred[node]:
+                if idom[p] is None:
+                    continue
+                if new_idom is None:
+                    new_idom = p
+                    continue
+                # Пересечение путей к входу по номерам RPO
+                a, b = p, new_idom
+                while a != b:
+                    while rpo[a] > rpo[b]:
+                        a = idom[a]
+                    while rpo[b] > rpo[a]:
+                        b = idom[b]
+                new_idom = a
+            if idom[node] != new_idom:
+                idom[node] = new_idom
+                changed = True
+    idom[entry] = None
+    return idom
+
+
+def _tree_intervals(idom, num_nodes):
+    """Номера входа/выхода DFS по дереву доминаторов (-1 - недостижим)"""
+    children = [[] for _ in range(num_nodes)]
+    root = None
+    for node in range(num_nodes):
+        parent = idom[node]
+        if parent is not None:
+            children[parent].append(node)
+        elif node == 0:
+            root = node
+    pre = [-1] * num_nodes
+    post = [-1] * num_nodes
+    if root is None:
+        return pre, post
+    counter = 0
+    stack = [(root, iter(children[root]))]
+    pre[root] = counter
+    while stack:
+        node, it = stack[-1]
+        child = next(it, None)
+        if child is None:
+            stack.pop()
+            counter += 1
+            post[node] = counter
+        else:
+            counter += 1
+            pre[child] = counter
+            stack.append((child, iter(children[child])))
+    return pre, post
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Общее чтение Lua 5.1 байткода (формат cocos2d-x / Idle Heroes)
+Один разборщик для декомпиляторов и экстракторов констант:
+- Работает поверх memoryview (без копий bytes на каждое поле)
+- Числа читаются заранее скомпилированными struct.Struct.unpack_from
+- Массивы (код, номера строк) читаются одним вызовом
+"""
+
+import sys
+import struct
+from array import array
+
+# NumPy загружается только при первом большом прототипе (см. _numpy)
+np = None
+
+LUA_SIGNATURE = b'\x1bLua'
+
+# Заголовок Lua 5.1: сигнатура, версия, формат, порядок байт, размеры типов
+HEADER_SIZE = 12
+
+# Типы констант
+LUA_TNIL = 0
+LUA_TBOOLEAN = 1
+LUA_TNUMBER = 3
+LUA_TSTRING = 4
+
+_U32 = struct.Struct('<I')
+_F64 = struct.Struct('<d')
+_U32X2 = struct.Struct('<2I')
+
+# Смещение sBx (MAXARG_sBx) в Lua 5.1
+MAXARG_SBX = 131071
+
+# Ниже этого числа инструкций NumPy не окупается
+NUMPY_MIN_CODE = 2048
+
+
+def is_lua_chunk(data):
+    """Данные начинаются с сигнатуры Lua байткода"""
+    return bytes(data[:4]) == LUA_SIGNATURE
+
+
+class CodeArrays:
+    """Код прототипа в виде параллельных массивов полей (вместо объекта на инструкцию)
+    
+    op[pc], a[pc], b[pc], c[pc], bx[pc], sbx[pc] - обычные int при индексации,
+    хранение - компактные array (1-4 байта на поле).
+    """
+    __slots__ = ('op', 'a', 'b', 'c', 'bx', 'sbx')
+    
+    def __init__(self, op, a, b, c, bx, sbx):
+        self.op = op
+        self.a = a
+        self.b = b
+        self.c = c
+        self.bx = bx
+        self.sbx = sbx
+    
+    def __len__(self):
+        return len(self.op)
+
+
+def _numpy():
+    """Ленивый импорт NumPy: мелкие файлы не тянут его в процесс
+    
+    Модуль NumPy - это десятки тысяч объектов, которые сборщик мусора
+    проходит на каждой полной сборке. None если NumPy не установлен.
+    """
+    global np
+    if np is None:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:  # NumPy не обязателен - поля декодируются обычным циклом
+            np = False
+    return np or None
+
+
+def _to_array(typecode, values):
+    """NumPy массив → array того же типа (коды типов совпадают: B, H, I, i)"""
+    result = array(typecode)
+    result.frombytes(values.astype(typecode).tobytes())
+    return result
+
+
+def decode_code(view, pos, count):
+    """Декодирование count инструкций с позиции pos масками и сдвигами сразу по всему массиву"""
+    if count >= NUMPY_MIN_CODE and _numpy() is not None:
+        raw = np.frombuffer(view, dtype='<u4', count=count, offset=pos)
+        bx = (raw >> 14) & 0x3FFFF
+        return CodeArrays(
+            _to_array('B', raw & 0x3F),
+            _to_array('B', (raw >> 6) & 0xFF),
+            _to_array('H', raw >> 23),
+            _to_array('H', bx & 0x1FF),
+            _to_array('I', bx),
+            _to_array('i', bx.astype(np.int32) - MAXARG_SBX),
+        )
+    
+    raw = array('I')
+    raw.frombytes(view[pos:pos + 4 * count])
+    if sys.byteorder != 'little':
+        raw.byteswap()
+    bx = array('I', [x >> 14 for x in raw])
+    return CodeArrays(
+        array('B', [x & 0x3F for x in raw]),
+        array('B', [(x >> 6) & 0xFF for x in raw]),
+        array('H', [x >> 23 for x in raw]),
+        array('H', [x & 0x1FF for x in bx]),
+        bx,
+        array('i', [x - MAXARG_SBX for x in bx]),
+    )
+
+
+class ChunkReader:
+    """Последовательное чтение полей чанка с позиции pos"""
+    __slots__ = ('data', 'view', 'pos')
+    
+    def __init__(self, data, pos: int = 0):
+        self.data = data
+        self.view = data if isinstance(data, memoryview) else memoryview(data)
+        self.pos = pos
+    
+    def read_byte(self) -> int:
+        b = self.view[self.pos]
+        self.pos += 1
+        return b
+    
+    def read_int(self) -> int:
+        val = _U32.unpack_from(self.view, self.pos)[0]
+        self.pos += 4
+        return val
+    
+    def read_number(self) -> float:
+        val = _F64.unpack_from(self.view, self.pos)[0]
+        self.pos += 8
+        return val
+    
+    def read_string(self) -> str:
+        size = _U32.unpack_from(self.view, self.pos)[0]
+        self.pos += 4
+        if size == 0:
+            return ""
+        s = str(self.view[self.pos:self.pos + size - 1], 'utf-8', 'replace')
+        self.pos += size
+        return s
+    
+    def read_ints(self, count: int) -> tuple:
+        """count подряд идущих uint32 одним вызовом (код, номера строк)"""
+        vals = struct.unpack_from('<%dI' % count, self.view, self.pos)
+        self.pos += 4 * count
+        return vals
+    
+    def read_code(self) -> CodeArrays:
+        """Код прототипа (число инструкций + слова) в виде CodeArrays"""
+        count = self.read_int()
+        if self.pos + 4 * count > len(self.view):
+            raise struct.error(f"unexpected end of chunk at offset {self.pos}")
+        code = decode_code(self.view, self.pos, count)
+        self.pos += 4 * count
+        return code
+    
+    def skip_ints(self, count: int):
+        """Пропуск count uint32 без чтения (отладочные массивы)"""
+        self.pos += 4 * count
+        if self.pos > len(self.view):
+            raise struct.error(f"unexpected end of chunk at offset {self.pos - 4 * count}")
+    
+    def skip_header(self):
+        """Проверка сигнатуры и переход к главной функции"""
+        if not is_lua_chunk(self.view):
+            raise ValueError("Not a Lua bytecode file")
+        self.pos = HEADER_SIZE
+    
+    def read_constants(self) -> list:
+        """Таблица констант прототипа (неизвестные типы пропускаются без чтения)"""
+        view = self.view
+        pos = self.pos
+        u32 = _U32.unpack_from
+        f64 = _F64.unpack_from
+        count = u32(view, pos)[0]
+        pos += 4
+        
+        # Горячий цикл: позиция и функции разбора в локальных переменных
+        constants = []
+        append = constants.append
+        for _ in range(count):
+            const_type = view[pos]
+            pos += 1
+            
+            if const_type == LUA_TSTRING:
+                size = u32(view, pos)[0]
+                pos += 4
+                if size == 0:
+                    append("")
+                else:
+                    append(str(view[pos:pos + size - 1], 'utf-8', 'replace'))
+                    pos += size
+            elif const_type == LUA_TNUMBER:
+                append(f64(view, pos)[0])
+                pos += 8
+            elif const_type == LUA_TNIL:
+                append(None)
+            elif const_type == LUA_TBOOLEAN:
+                append(bool(view[pos]))
+                pos += 1
+        
+        self.pos = pos
+        return constants
+    
+    def read_locals(self) -> list:
+        """Локальные переменные (debug): [(name, startpc, endpc)]"""
+        view = self.view
+        pos = self.pos
+        u32 = _U32.unpack_from
+        u32x2 = _U32X2.unpack_from
+        count = u32(view, pos)[0]
+        pos += 4
+        
+        locals_info = []
+        for _ in range(count):
+            size = u32(view, pos)[0]
+            pos += 4
+            name = str(view[pos:pos + size - 1], 'utf-8', 'replace') if size else ""
+            pos += size
+            startpc, endpc = u32x2(view, pos)
+            pos += 8
+            locals_info.append((name, startpc, endpc))
+        
+        self.pos = pos
+        return locals_info
+    
+    def read_strings(self) -> list:
+        """Список строк с числом в начале (имена upvalues)"""
+        read_string = self.read_string
+        return [read_string() for _ in range(self.read_int())]
+    
+    def skip_string(self):
+        """Пропуск строки по ее размеру"""
+        self.pos += 4 + _U32.unpack_from(self.view, self.pos)[0]
+    
+    def skip_locals(self):
+        """Пропуск локальных переменных (debug): имя + startpc + endpc"""
+        view = self.view
+        pos = self.pos
+        u32 = _U32.unpack_from
+        count = u32(view, pos)[0]
+        pos += 4
+        for _ in range(count):
+            pos += 12 + u32(view, pos)[0]
+        self.pos = pos
+    
+    def skip_strings(self):
+        """Пропуск списка строк (имена upvalues)"""
+        view = self.view
+        pos = self.pos
+        u32 = _U32.unpack_from
+        count = u32(view, pos)[0]
+        pos += 4
+        for _ in range(count):
+            pos += 4 + u32(view, pos)[0]
+        self.pos = pos
+    
+    def skip_constants(self):
+        """Пропуск таблицы констант по типам и размерам (без создания значений)"""
+        view = self.view
+        pos = self.pos
+        u32 = _U32.unpack_from
+        count = u32(view, pos)[0]
+        pos += 4
+        for _ in range(count):
+            const_type = view[pos]
+            pos += 1
+            if const_type == LUA_TSTRING:
+                pos += 4 + u32(view, pos)[0]
+            elif const_type == LUA_TNUMBER:
+                pos += 8
+            elif const_type == LUA_TBOOLEAN:
+                pos += 1
+        self.pos = pos
+    
+    def skip_function(self):
+        """Пропуск прототипа со всеми вложенными (только размеры полей)"""
+        self.skip_string()
+        self.pos += 12
+        self.skip_ints(self.read_int())
+        self.skip_constants()
+        for _ in range(self.read_int()):
+            self.skip_function()
+        self.skip_ints(self.read_int())
+        self.skip_locals()
+        self.skip_strings()
+        if self.pos > len(self.view):
+            raise struct.error(f"unexpected end of chunk at offset {self.pos}")
+    
+    def nested_bounds(self) -> list:
+        """Границы вложенных прототипов функции с позиции pos: [(начало, конец)]
+        
+        Поля самой функции пропускаются по размеру, pos остается после
+        последнего вложенного прототипа.
+        """
+        self.skip_string()
+        self.pos += 12
+        self.skip_ints(self.read_int())
+        self.skip_constants()
+        bounds = []
+        for _ in range(self.read_int()):
+            start = self.pos
+            self.skip_function()
+            bounds.append((start, self.pos))
+        return bounds
+    
+    def scan_constants(self, nested: bool = True):
+        """Только константы: генератор (proto_path, const_index, value)
+        
+        Код, номера строк и локальные переменные не читаются - пропускаются
+        по размеру. proto_path - кортеж индексов вложенности: () - главная
+        функция, (2, 0) - первый прототип внутри третьего. Порядок - как в
+        файле (прототип, затем его вложенные, в глубину).
+        """
+        # Стек открытых прототипов: [путь, число вложенных, следующий вложенный]
+        stack = []
+        path = ()
+        while True:
+            # Начало прототипа: заголовок и код пропускаем, константы отдаем
+            self.skip_string()
+            self.pos += 12
+            self.skip_ints(self.read_int())
+            for index, value in enumerate(self.read_constants()):
+                yield path, index, value
+            
+            if not nested:
+                return
+            stack.append([path, self.read_int(), 0])
+            
+            # Следующий вложенный прототип или хвост закончившихся
+            while stack:
+                top = stack[-1]
+                if top[2] < top[1]:
+                    path = top[0] + (top[2],)
+                    top[2] += 1
+                    break
+                stack.pop()
+                self.skip_ints(self.read_int())
+                self.skip_locals()
+                self.skip_strings()
+            else:
+                return
+    
+    def read_function_info(self) -> tuple:
+        """Начало прототипа: (source, line_defined, last_line, upvalues, params, vararg, stack)"""
+        source = self.read_string()
+        line_defined, last_line = _U32X2.unpack_from(self.view, self.pos)
+        nups, params, vararg, stack = self.view[self.pos + 8:self.pos + 12]
+        self.pos += 12
+        return source, line_defined, last_line, nups, params, vararg, stack
+
+
+def iter_constants(data, nested: bool = True):
+    """Константы всех прототипов чанка: (proto_path, const_index, value)"""
+    reader = ChunkReader(data)
+    reader.skip_header()
+    return reader.scan_constants(nested)
+
+
+def main_protos(data) -> list:
+    """Границы прототипов главной функции чанка: [(начало, конец)]"""
+    reader = ChunkReader(data)
+    reader.skip_header()
+    return reader.nested_bounds()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Вычисление data-чанков Lua 5.1 (конфиги app/config/*.lua) в объекты Python
+Конфиг - это главная функция из одного большого конструктора таблицы:
+NEWTABLE / SETTABLE / SETLIST / LOADK / LOADBOOL / LOADNIL / MOVE / RETURN.
+Эти опкоды выполняются символически прямо по байткоду, без декомпиляции в
+текст. Результат - точная вложенная структура: таблица с ключами 1..n
+становится list, остальные - dict. Числа с целым значением - int.
+Любой другой опкод, запись не в таблицу, ключ nil, bool (true и 1 в dict
+совпали бы) или таблица - DataChunkError (чанк не является данными).
+"""
+
+from typing import Any, Dict, Optional
+
+from lua_pack import read_lua
+from lua_chunk import ChunkReader, is_lua_chunk
+from improved_lua_decompiler import LuaOpcode
+
+# Элементов на одну инструкцию SETLIST (LFIELDS_PER_FLUSH в Lua 5.1)
+FIELDS_PER_FLUSH = 50
+
+
+class DataChunkError(ValueError):
+    """Чанк использует опкоды вне набора для данных"""
+
+
+def _table(value, pc: int) -> dict:
+    """Таблица в регистре - цель SETTABLE/SETLIST"""
+    if value.__class__ is not dict:
+        raise DataChunkError(f"Assignment into {type(value).__name__} at pc {pc}")
+    return value
+
+
+def _opcodes(opcodes, *names):
+    """Номера опкодов по именам (отсутствующие в карте - -1)"""
+    members = opcodes.__members__
+    return tuple(members[name].value if name in members else -1 for name in names)
+
+
+def eval_chunk(data, opcodes=LuaOpcode) -> Any:
+    """Значение, которое возвращает главная функция data-чанка
+    
+    Если чанк ничего не возвращает, результат - словарь глобальных
+    переменных, заданных через SETGLOBAL (config = {...} без local).
+    opcodes - карта опкодов клиента (IntEnum, как в декомпиляторе).
+    """
+    if not is_lua_chunk(data):
+        raise ValueError("Not a Lua bytecode file")
+    reader = ChunkReader(data)
+    reader.skip_header()
+    reader.read_function_info()
+    code = reader.read_code()
+    constants = reader.read_constants()
+    
+    (NEWTABLE, SETTABLE, SETTABLE_ALT, SETLIST, SETLIST_ALT, LOADK, LOADK_BX,
+     LOADBOOL, LOADBOOL_ALT, LOADNIL, MOVE, RETURN, SETGLOBAL) = _opcodes(
+        opcodes, 'NEWTABLE', 'SETTABLE', 'SETTABLE_ALT', 'SETLIST', 'SETLIST_ALT',
+        'LOADK', 'LOADK_BX', 'LOADBOOL', 'LOADBOOL_ALT', 'LOADNIL', 'MOVE',
+        'RETURN', 'SETGLOBAL')
+    
+    ops, code_a, code_b, code_c, code_bx = code.op, code.a, code.b, code.c, code.bx
+    num_instructions = len(ops)
+    regs = [None] * 256
+    globals_ = {}
+    
+    # Горячий цикл: самые частые опкоды конструктора таблицы - первыми.
+    # Номер регистра или константы вне массива - IndexError, проверка на весь цикл
+    pc = 0
+    try:
+        while pc < num_instructions:
+            op = ops[pc]
+            a = code_a[pc]
+            
+            if op == SETTABLE or op == SETTABLE_ALT:
+                b = code_b[pc]
+                c = code_c[pc]
+                key = constants[b & 0xFF] if b & 0x100 else regs[b]
+                value = constants[c & 0xFF] if c & 0x100 else regs[c]
+                if key.__class__ is float:
+                    if key.is_integer():
+                        key = int(key)
+                elif key.__class__ is not str and key.__class__ is not int:
+                    raise DataChunkError(f"Unsupported key {key!r} at pc {pc}")
+                table = _table(regs[a], pc)
+                if value is None:
+                    table.pop(key, None)
+                else:
+                    table[key] = value
+            
+            elif op == LOADK or op == LOADK_BX:
+                regs[a] = constants[code_bx[pc]]
+            
+            elif op == NEWTABLE:
+                table = {}
+                regs[a] = table
+            
+            elif op == SETLIST or op == SETLIST_ALT:
+                b = code_b[pc]
+                c = code_c[pc]
+                if b == 0:
+                    raise DataChunkError(f"SETLIST with open top at pc {pc}")
+                if c == 0:
+                    # Номер блока в следующем слове кода
+                    pc += 1
+                    c = (code_bx[pc] << 14) | (code_a[pc] << 6) | ops[pc]
+                table = _table(regs[a], pc)
+                base = (c - 1) * FIELDS_PER_FLUSH
+                for i in range(1, b + 1):
+                    value = regs[a + i]
+                    if value is not None:
+                        table[base + i] = value
+            
+            elif op == MOVE:
+                regs[a] = regs[code_b[pc]]
+            
+            elif op == LOADBOOL or op == LOADBOOL_ALT:
+                regs[a] = code_b[pc] != 0
+                if code_c[pc]:
+                    pc += 1
+            
+            elif op == LOADNIL:
+                for reg in range(a, code_b[pc] + 1):
+                    regs[reg] = None
+            
+            elif op == SETGLOBAL:
+                globals_[constants[code_bx[pc]]] = regs[a]
+            
+            elif op == RETURN:
+                b = code_b[pc]
+                if b == 0:
+                    raise DataChunkError(f"RETURN with open top at pc {pc}")
+                result = regs[a] if b > 1 else globals_
+                return _finish(result)
+            
+            else:
+                try:
+                    name = opcodes(op).name
+                except ValueError:
+                    name = op
+                raise DataChunkError(f"Unsupported opcode {name} at pc {pc}")
+            
+            pc += 1
+    
+    except IndexError:
+        raise DataChunkError(f"Register or constant index out of range at pc {pc}") from None
+    
+    return _finish(globals_)
+
+
+def _finish(result):
+    """Таблицы → list/dict, целые числа → int (на месте, общие таблицы - один объект)"""
+    converted = {}
+    
+    def convert(value):
+        if value.__class__ is float:
+            return int(value) if value.is_integer() else value
+        if value.__class__ is not dict:
+            return value
+        done = converted.get(id(value))
+        if done is not None:
+            return done
+        # Ключи 1..n подряд - массив
+        n = len(value)
+        if n and all(i in value for i in range(1, n + 1)):
+            items = [None] * n
+            converted[id(value)] = items
+            for i in range(1, n + 1):
+                items[i - 1] = convert(value[i])
+            return items
+        converted[id(value)] = value
+        for key, item in value.items():
+            value[key] = convert(item)
+        return value
+    
+    # Глубина рекурсии - вложенность таблиц (в Lua 5.1 не больше ~200)
+    return convert(result)
+
+
+def load_config(filepath) -> Optional[Any]:
+    """Конфиг из файла или пака (decrypted_lua_FINAL): None, если это не байткод"""
+    data = read_lua(filepath)
+    if not is_lua_chunk(data):
+        return None
+    return eval_chunk(data)
+
+
+def config_records(config: Any) -> Dict[Any, Any]:
+    """Записи конфига: {id: запись} для dict, {номер с 1: запись} для list"""
+    if isinstance(config, list):
+        return {i: record for i, record in enumerate(config, 1)}
+    if isinstance(config, dict):
+        return config
+    return {}
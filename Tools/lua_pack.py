@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Пак-файл: все дерево Lua файлов в одном файле с индексом
+Формат: LUAPACK1 | данные файлов подряд | JSON индекс {rel_path: [offset, size]} | футер
+Чтение через mmap - срезы memoryview без копирования.
+
+Остальные утилиты читают пак как обычную папку: если decrypted_lua_FINAL/
+нет на диске, но рядом лежит decrypted_lua_FINAL.pack, путь
+decrypted_lua_FINAL/app/config/hero.lua берется из пака (см. read_lua).
+Так же прозрачно читается сжатый результат декомпиляции (--compress):
+вместо app/x.lua на диске или в паке лежит app/x.lua.gz (.xz, .bz2).
+"""
+
+import os
+import bz2
+import gzip
+import lzma
+import json
+import mmap
+import struct
+import fnmatch
+import posixpath
+from pathlib import Path
+
+PACK_MAGIC = b"LUAPACK1"
+PACK_SUFFIX = ".pack"
+
+# Футер: смещение индекса, размер индекса, сигнатура
+_FOOTER = struct.Struct('<QQ8s')
+
+# Сжатие файлов дерева: имя → (суффикс, модуль, уровень). Уровни - под сжатие
+# в воркерах вместе с декомпиляцией: оно должно быть заметно быстрее ее самой
+COMPRESSIONS = {
+    'gzip': ('.gz', gzip, 6),
+    'xz': ('.xz', lzma, 3),
+    'bz2': ('.bz2', bz2, 9),
+}
+
+# Суффикс → модуль для распаковки
+_DECOMPRESSORS = {suffix: module for suffix, module, _ in COMPRESSIONS.values()}
+
+
+def is_pack_path(path):
+    """Путь указывает на пак (по расширению .pack)"""
+    return Path(path).suffix.lower() == PACK_SUFFIX
+
+
+def compressed_name(path, compression=None):
+    """Имя сжатого файла: x.lua → x.lua.gz (compression None - без изменений)"""
+    if not compression:
+        return path
+    suffix = COMPRESSIONS[compression][0]
+    if isinstance(path, Path):
+        return path.with_name(path.name + suffix)
+    return str(path) + suffix
+
+
+def _plain_name(name):
+    """Имя без суффикса сжатия и модуль распаковки (None - файл не сжат)"""
+    for suffix, module in _DECOMPRESSORS.items():
+        if name.endswith(suffix):
+            return name[:-len(suffix)], module
+    return name, None
+
+
+def open_compressed(path, compression=None):
+    """Текстовый файл (UTF-8) для потоковой записи, сжатие - на лету"""
+    if not compression:
+        return open(path, 'w', encoding='utf-8')
+    _, module, level = COMPRESSIONS[compression]
+    if module is lzma:
+        return lzma.open(path, 'wt', preset=level, encoding='utf-8')
+    return module.open(path, 'wt', compresslevel=level, encoding='utf-8')
+
+
+def compress_bytes(data, compression=None):
+    """Сжатие содержимого файла целиком (для записи в пак)"""
+    if not compression:
+        return data
+    _, module, level = COMPRESSIONS[compression]
+    if module is lzma:
+        return lzma.compress(data, preset=level)
+    return module.compress(data, level)
+
+
+def _pack_key(rel_path):
+    """Ключ индекса - относительный путь с прямыми слешами"""
+    if isinstance(rel_path, Path):
+        return rel_path.as_posix()
+    return str(rel_path).replace('\\', '/').strip('/')
+
+
+class PackWriter:
+    """Запись пака (через временный файл, как save_manifest)"""
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + '.tmp')
+        self.index = {}
+        self.file = open(self.tmp_path, 'wb')
+        self.file.write(PACK_MAGIC)
+    
+    def add(self, rel_path, data):
+        """Добавить файл (bytes, bytearray или memoryview)"""
+        offset = self.file.tell()
+        self.file.write(data)
+        self.index[_pack_key(rel_path)] = [offset, self.file.tell() - offset]
+    
+    def close(self):
+        """Дописать индекс и футер, переименовать во временный файл в итоговый"""
+        index = json.dumps(self.index, ensure_ascii=False, sort_keys=True,
+                           separators=(',', ':')).encode('utf-8')
+        index_offset = self.file.tell()
+        self.file.write(index)
+        self.file.write(_FOOTER.pack(index_offset, len(index), PACK_MAGIC))
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+    
+    def abort(self):
+        """Бросить запись - битый пак не остается на диске"""
+        self.file.close()
+        if self.tmp_path.exists():
+            os.remove(self.tmp_path)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class PackReader:
+    """Чтение пака через mmap
+    
+    read() возвращает срез memoryview прямо поверх отображенного файла.
+    Пока живы полученные срезы, mmap не закрывается: close() их не трогает,
+    отображение освободится вместе с последним срезом.
+    """
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self.file = open(self.path, 'rb')
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # пустой файл
+            self.file.close()
+            raise ValueError(f"Not a pack file: {self.path}")
+        
+        size = len(self.mm)
+        if size < len(PACK_MAGIC) + _FOOTER.size or self.mm[:len(PACK_MAGIC)] != PACK_MAGIC:
+            self.close()
+            raise ValueError(f"Not a pack file: {self.path}")
+        
+        index_offset, index_size, magic = _FOOTER.unpack_from(self.mm, size - _FOOTER.size)
+        if magic != PACK_MAGIC:
+            self.close()
+            raise ValueError(f"Broken pack footer: {self.path}")
+        
+        self.index = json.loads(self.mm[index_offset:index_offset + index_size].decode('utf-8'))
+        self.view = memoryview(self.mm)
+    
+    def names(self):
+        """Все относительные пути в паке"""
+        return list(self.index)
+    
+    def __len__(self):
+        return len(self.index)
+    
+    def __contains__(self, rel_path):
+        return _pack_key(rel_path) in self.index
+    
+    def has_dir(self, rel_dir):
+        """В паке есть файлы внутри папки rel_dir"""
+        prefix = _pack_key(rel_dir) + '/'
+        return any(name.startswith(prefix) for name in self.index)
+    
+    def size(self, rel_path):
+        """Размер файла в паке"""
+        return self.index[_pack_key(rel_path)][1]
+    
+    def read(self, rel_path):
+        """Содержимое файла - memoryview без копирования"""
+        try:
+            offset, size = self.index[_pack_key(rel_path)]
+        except KeyError:
+            raise FileNotFoundError(f"{rel_path} not in {self.path}") from None
+        return self.view[offset:offset + size]
+    
+    def read_bytes(self, rel_path):
+        """Содержимое файла копией в bytes"""
+        view = self.read(rel_path)
+        data = bytes(view)
+        view.release()
+        return data
+    
+    def close(self):
+        if getattr(self, 'view', None) is not None:
+            self.view.release()
+            self.view = None
+        try:
+            self.mm.close()
+        except BufferError:  # снаружи еще живы срезы read() - закроется вместе с ними
+            pass
+        self.file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+# Открытые паки (открываются один раз на процесс)
+_open_packs = {}
+
+def open_pack(path):
+    """PackReader из кэша процесса"""
+    key = os.path.abspath(path)
+    pack = _open_packs.get(key)
+    if pack is None:
+        pack = _open_packs[key] = PackReader(path)
+    return pack
+
+
+def _locate(path):
+    """Поиск пака для пути, которого нет на диске: (PackReader, имя внутри) или (None, None)
+    
+    Подходит и явный путь внутрь пака (out.pack/app/x.lua), и папка,
+    замененная паком рядом (out/app/x.lua → out.pack).
+    """
+    parts = Path(path).parts
+    for i in range(len(parts), 0, -1):
+        base = Path(*parts[:i])
+        rest = '/'.join(parts[i:])
+        if is_pack_path(base) and base.is_file():
+            return open_pack(base), rest
+        sibling = base.with_name(base.name + PACK_SUFFIX)
+        if sibling.is_file():
+            return open_pack(sibling), rest
+        if base.exists():
+            break
+    return None, None
+
+
+def _compressed_candidates(path):
+    """Сжатые варианты пути: x.lua.gz, x.lua.xz, x.lua.bz2"""
+    return [path.with_name(path.name + suffix) for suffix in _DECOMPRESSORS]
+
+
+def remove_other_formats(path, compression=None):
+    """Удаление того же файла в другом формате перед записью x.lua (x.lua.gz и т.д.)
+    
+    Иначе после прогона с другим --compress рядом осталась бы старая копия,
+    и read_lua читал бы ее (x.lua - раньше сжатых).
+    """
+    path = Path(path)
+    keep = compressed_name(path, compression)
+    for candidate in [path] + _compressed_candidates(path):
+        if candidate != keep:
+            candidate.unlink(missing_ok=True)
+
+
+def lua_exists(path):
+    """Файл или папка есть на диске или внутри пака (в том числе сжатый файл)"""
+    path = Path(path)
+    if path.exists() or any(candidate.is_file() for candidate in _compressed_candidates(path)):
+        return True
+    pack, name = _locate(path)
+    if pack is None:
+        return False
+    return (not name or name in pack or pack.has_dir(name)
+            or any(name + suffix in pack for suffix in _DECOMPRESSORS))
+
+
+def _read_plain(path):
+    """Содержимое файла с диска (bytes) или из пака (memoryview без копирования) как есть"""
+    if path.is_file():
+        with open(path, 'rb') as f:
+            return f.read()
+    pack, name = _locate(path)
+    if pack is None or name not in pack:
+        raise FileNotFoundError(str(path))
+    return pack.read(name)
+
+
+def read_lua(path):
+    """Содержимое файла с диска или из пака
+    
+    С диска - bytes, из пака - срез memoryview прямо поверх mmap (без копии,
+    ChunkReader и eval_chunk работают с ним напрямую; для передачи в другой
+    процесс - bytes()). Сжатый файл распаковывается по суффиксу (результат -
+    bytes): и явный путь x.lua.gz, и x.lua, вместо которого лежит только
+    x.lua.gz (.xz, .bz2).
+    """
+    path = Path(path)
+    try:
+        data = _read_plain(path)
+    except FileNotFoundError:
+        for candidate in _compressed_candidates(path):
+            try:
+                data = _read_plain(candidate)
+            except FileNotFoundError:
+                continue
+            return _decompress(candidate.name, data)
+        raise
+    return _decompress(path.name, data)
+
+
+def _decompress(name, data):
+    """Распаковка по суффиксу имени (несжатые данные - как есть)"""
+    module = _plain_name(name)[1]
+    return data if module is None else module.decompress(data)
+
+
+def list_tree(base, pattern="*.lua"):
+    """Файлы дерева: [(rel_path, size)] из папки или из пака (аналог rglob)
+    
+    Сжатый файл идет под именем без суффикса (x.lua.gz → x.lua, см. read_lua),
+    size - размер на диске.
+    """
+    base = Path(base)
+    if base.is_dir():
+        tree = []
+        for root, _, names in os.walk(base):
+            for name in names:
+                plain = _plain_name(name)[0]
+                if fnmatch.fnmatch(plain, pattern):
+                    filepath = Path(root, name)
+                    rel_path = filepath.relative_to(base).as_posix()
+                    tree.append((rel_path[:len(rel_path) - len(name) + len(plain)],
+                                 filepath.stat().st_size))
+        return tree
+    
+    pack, name = _locate(base)
+    if pack is None:
+        return []
+    
+    prefix = name + '/' if name else ''
+    tree = []
+    for rel_path in pack.names():
+        plain = _plain_name(rel_path)[0]
+        if plain.startswith(prefix) and fnmatch.fnmatch(posixpath.basename(plain), pattern):
+            tree.append((plain[len(prefix):], pack.size(rel_path)))
+    return tree
@@ -5,12 +5,13 @@
 
 import re
 from pathlib import Path
-from extract_protobuf_schema import extract_constants_from_lua
+from lua_pack import lua_exists
+from extract_protobuf_schema import extract_all_constants
 
 def reconstruct_proto_from_lua(filepath):
     """Восстановить .proto файл из Lua байткода"""
     
-    constants = extract_constants_from_lua(filepath)
+    constants = extract_all_constants(filepath)
     
     # Фильтруем только строки
     strings = [c for c in constants if isinstance(c, str) and c]
@@ -103,7 +104,7 @@ def main():
         output_file = proto_info['output']
         package = proto_info['package']
         
-        if not input_file.exists():
+        if not lua_exists(input_file):
             print(f"❌ Файл не найден: {input_file}")
             continue
         
@@ -0,0 +1,54 @@
+"""
+config_snapshot: запись и чтение снимка таблицы без потерь
+"""
+
+import pytest
+
+from config_snapshot import SnapshotReader, write_snapshot
+
+RECORDS = {
+    20: {'id': 20, 'name': 'hero', 'hp': 1.5, 'alive': True, 'power': 2 ** 70,
+         'mixed': 1, 'tags': [1, 2], 'bonus': 5},
+    3: {'id': 3, 'name': 'ünicode', 'hp': 2, 'alive': False, 'power': -7,
+        'mixed': 'text', 'tags': {'slot': 'head'}},
+    7: {'id': 7, 'name': '', 'hp': -0.25, 'power': 0, 'mixed': [True, None, 1.5],
+        'tags': {10: 'ten', 20: {30: 'nested'}}},
+}
+
+
+def test_round_trip(tmp_path):
+    write_snapshot(tmp_path / 'hero.snap', RECORDS)
+    with SnapshotReader(tmp_path / 'hero.snap') as reader:
+        assert len(reader) == 3
+        assert [reader.keys[i] for i in range(3)] == [3, 7, 20]
+        kinds = {name: column.kind for name, column in reader.columns.items()}
+        assert kinds == {'id': 'int', 'name': 'str', 'hp': 'float', 'alive': 'bool',
+                         'power': 'json', 'mixed': 'json', 'tags': 'json', 'bonus': 'int'}
+        for key, record in RECORDS.items():
+            assert reader.get(key) == record
+        assert reader.get(4) is None
+        assert reader.column('bonus')[0] is None and reader.column('alive')[1] is None
+
+
+def test_string_keys_and_plain_values(tmp_path):
+    records = {'fire': [1, 2], 'water': 3, 'earth': {'power': 2 ** 63 - 1}}
+    write_snapshot(tmp_path / 'element.snap', records)
+    with SnapshotReader(tmp_path / 'element.snap') as reader:
+        for key, record in records.items():
+            assert reader.get(key) == record
+        assert reader.get('air') is None
+
+
+def test_non_string_record_fields(tmp_path):
+    records = {1: {'id': 1, 10: 'ten', 20: 'twenty'}, 2: {'id': 2, 10: 'x', '10': 'str'}}
+    write_snapshot(tmp_path / 'sparse.snap', records)
+    with SnapshotReader(tmp_path / 'sparse.snap') as reader:
+        for key, record in records.items():
+            assert reader.get(key) == record
+        assert reader.column('10').field == 10 and reader.column('str:10').field == '10'
+
+
+def test_not_a_snapshot(tmp_path):
+    (tmp_path / 'bad.snap').write_bytes(b'garbage' * 10)
+    with pytest.raises(ValueError):
+        SnapshotReader(tmp_path / 'bad.snap')
@@ -0,0 +1,45 @@
+"""
+Гигантские файлы: делятся между процессами, только если у главной функции
+от двух прототипов; статистика процессов в асинхронном режиме
+"""
+
+import improved_lua_decompiler
+from improved_lua_decompiler import decompile_data
+from decompile_all_advanced import _splittable, main
+
+FUNCTION = "local function f{0}(a) local r = a + {0} return r end "
+
+
+def test_splittable(compile_lua, tmp_path):
+    sources = {
+        'three.lua': compile_lua(''.join(FUNCTION.format(i) for i in range(3)) + "local x = f0(1) return x"),
+        'one.lua': compile_lua(FUNCTION.format(1) + "local x = f1(1) return x"),
+        'plain.lua': compile_lua("local a = ... return a"),
+        'junk.lua': b'not lua',
+    }
+    for name, data in sources.items():
+        (tmp_path / name).write_bytes(data)
+    
+    assert [name for name in sources if _splittable(tmp_path / name)] == ['three.lua']
+
+
+def test_split_output_matches_sequential(compile_lua, monkeypatch):
+    monkeypatch.setattr(improved_lua_decompiler, 'PARALLEL_MIN_SIZE', 0)
+    data = compile_lua(''.join(FUNCTION.format(i) for i in range(3)) + "local x = f0(1) return x")
+    text, status = decompile_data(data)
+    assert status == 'OK'
+    assert 'closure idx' not in text
+    assert decompile_data(data, jobs=2) == (text, status)
+
+
+def test_async_io_reports_workers(compile_lua, tmp_path, capsys):
+    source = tmp_path / 'in'
+    source.mkdir()
+    (source / 'a.lua').write_bytes(compile_lua(FUNCTION.format(1) + "local x = f1(1) return x"))
+    (source / 'b.lua').write_bytes(compile_lua("local a = ... return a"))
+    main([str(source), str(tmp_path / 'out'), '--async-io', '--jobs', '2'])
+    
+    output = capsys.readouterr().out
+    assert 'Процессы:' in output and 'Самые долгие файлы:' in output
+    assert 'a.lua' in output.split('Самые долгие файлы:')[1]
+    assert (tmp_path / 'out' / 'a.lua').read_text(encoding='utf-8')
@@ -0,0 +1,89 @@
+"""
+Структура кода после декомпиляции: условия с and/or, if/else, циклы с break,
+вывод, прерванный по Budget
+"""
+
+import pytest
+
+import improved_lua_decompiler
+from improved_lua_decompiler import Budget, BUDGET_STATUS, decompile_data
+
+KEYWORDS = ('if ', 'else', 'elseif ', 'end', 'while ', 'repeat', 'until ', 'break', 'for ')
+
+
+def structure(compile_lua, source: str) -> list:
+    """Строки управляющих конструкций в декомпилированном source"""
+    text, status = decompile_data(compile_lua(source))
+    assert status == 'OK'
+    assert 'goto' not in text
+    return [line.strip() for line in text.splitlines()
+            if line.strip().startswith(KEYWORDS)]
+
+
+@pytest.mark.parametrize('source, expected', [
+    ("local a, b, x = ... if a or b then x = 1 end return x",
+     ['if a or b then', 'end']),
+    ("local a, b, x = ... if a and b then x = 1 else x = 2 end return x",
+     ['if a and b then', 'else', 'end']),
+    ("local a, b, x = ... if a > 1 and b > 2 then x = 1 end return x",
+     ['if 1.0 < a and 2.0 < b then', 'end']),
+    ("local a, b, c, x = ... if a and (b or c) then x = 1 end return x",
+     ['if a and (b or c) then', 'end']),
+    ("local a, b, c, x = ... if a or b and c then x = 1 else x = 2 end return x",
+     ['if a or b and c then', 'else', 'end']),
+])
+def test_condition_chain(compile_lua, source, expected):
+    assert structure(compile_lua, source) == expected
+
+
+@pytest.mark.parametrize('source, expected', [
+    ("local a, b, x = ... while a do x = x + 1 if b < x then break end end return x",
+     ['while a do', 'if b < x then', 'break', 'end', 'end']),
+    ("local a, b, x = ... while a and b do x = x + 1 end return x",
+     ['while a and b do', 'end']),
+    ("local a, b, x = ... repeat x = x + 1 until a or b return x",
+     ['repeat', 'until a or b']),
+    ("local a, b, x = ... repeat x = x + 1 if a then break end until b return x",
+     ['repeat', 'if a then', 'break', 'end', 'until b']),
+    ("local a, b, x = ... repeat while a do x = x + 1 end until b return x",
+     ['repeat', 'while a do', 'end', 'until b']),
+    ("local a, b, x = ... while true do x = x + 1 if a then break end end return x",
+     ['while true do', 'if a then', 'break', 'end', 'end']),
+    ("local a, b, x = ... while true do while a do x = x + 1 end if b then break end end return x",
+     ['while true do', 'while a do', 'end', 'if b then', 'break', 'end', 'end']),
+])
+def test_loops(compile_lua, source, expected):
+    assert structure(compile_lua, source) == expected
+
+
+def test_if_then_exit_is_plain_jump(compile_lua):
+    """JMP пары условия в конце then - не выход из then (нет ложного else)"""
+    source = "local a, b, x = ... if a then x = 2 if b then x = 1 end end return x"
+    assert structure(compile_lua, source) == ['if a then', 'if b then', 'end', 'end']
+
+
+def test_testset_outside_condition_is_closed(compile_lua):
+    """a and b or c в присваивании не сворачивается: TESTSET - закрытый if"""
+    text, status = decompile_data(compile_lua("local a, b, c, x = ... x = a and b or c return x"))
+    assert status == 'OK'
+    lines = [line.strip() for line in text.splitlines()]
+    assert [line for line in lines if line.startswith(KEYWORDS)] == ['if a then', 'if b then', 'end', 'end']
+    assert lines[lines.index('if b then') + 1:lines.index('if b then') + 3] == ['x = b', 'end']
+
+
+def test_interrupted_output_closes_blocks(compile_lua, monkeypatch):
+    """Прерванная функция закрывает открытые блоки, дамп - только комментарии"""
+    monkeypatch.setattr(improved_lua_decompiler, 'budget', Budget(proto_seconds=0.0))
+    body = ' '.join(f"x = x + {i}" for i in range(100))
+    source = ("local a, b, x = ... local function f(y) local r = y + 1 return r end "
+              f"if a then repeat while b do {body} end until a end local z = f(x) return z")
+    text, status = decompile_data(compile_lua(source))
+    assert status.startswith(BUDGET_STATUS)
+    
+    lines = [line.strip() for line in text.splitlines() if 'x = (x' not in line]
+    interrupted = next(i for i, line in enumerate(lines) if 'Вывод прерван' in line)
+    assert lines[interrupted - 3:interrupted] == ['if a then', 'repeat', 'while b do']
+    assert lines[interrupted + 1:interrupted + 4] == ['end', 'until true', 'end']
+    dump = lines[interrupted + 4:]
+    assert dump[-1] == '-- [0] function at line 1, 1 params, 3 instructions'
+    assert all(line.startswith('--') for line in dump)
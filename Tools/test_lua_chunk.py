@@ -0,0 +1,63 @@
+"""
+lua_chunk: разбор полей чанка, пропуск прототипов, декодирование кода
+"""
+
+import random
+import struct
+from array import array
+
+import pytest
+
+import lua_chunk
+from lua_chunk import ChunkReader, decode_code, iter_constants, main_protos
+
+SOURCE = ("local a, b = ... local s = 'hi' local n = 1.5 "
+          "local function f(x, y) local k = 'inner' return x end "
+          "local function g(...) local m = 2.5 return m end return a")
+
+
+def test_constants_and_prototypes(compile_lua):
+    data = compile_lua(SOURCE)
+    constants = {}
+    for path, index, value in iter_constants(data):
+        constants.setdefault(path, []).append(value)
+    assert constants == {(): ['hi', 1.5], (0,): ['inner'], (1,): [2.5]}
+    assert [path for path, _, _ in iter_constants(data, nested=False)] == [(), ()]
+    
+    bounds = main_protos(data)
+    assert len(bounds) == 2
+    for (start, end), params, vararg in zip(bounds, (2, 0), (False, True)):
+        reader = ChunkReader(data, start)
+        info = reader.read_function_info()
+        # VARARG_ISVARARG = 2
+        assert (info[4], bool(info[5] & 2)) == (params, vararg)
+        reader.pos = start
+        reader.skip_function()
+        assert reader.pos == end
+    
+    reader = ChunkReader(data)
+    reader.skip_header()
+    reader.skip_function()
+    assert reader.pos == len(data)
+
+
+def test_truncated_chunk(compile_lua):
+    data = compile_lua(SOURCE)
+    reader = ChunkReader(data[:-8])
+    reader.skip_header()
+    with pytest.raises(struct.error):
+        reader.skip_function()
+    with pytest.raises(ValueError):
+        ChunkReader(b'not lua').skip_header()
+
+
+def test_decode_code_numpy_matches_plain(monkeypatch):
+    pytest.importorskip('numpy')
+    rng = random.Random(1)
+    raw = array('I', [rng.getrandbits(32) for _ in range(lua_chunk.NUMPY_MIN_CODE + 10)])
+    data = memoryview(raw.tobytes())
+    vectorized = decode_code(data, 0, len(raw))
+    monkeypatch.setattr(lua_chunk, 'NUMPY_MIN_CODE', len(raw) + 1)
+    plain = decode_code(data, 0, len(raw))
+    for field in ('op', 'a', 'b', 'c', 'bx', 'sbx'):
+        assert list(getattr(vectorized, field)) == list(getattr(plain, field)), field
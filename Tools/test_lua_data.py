@@ -0,0 +1,73 @@
+"""
+eval_chunk: значение data-чанка совпадает с тем, что вычисляет сам Lua 5.1
+"""
+
+import pytest
+
+from lua_data import DataChunkError, config_records, eval_chunk
+
+CONFIGS = [
+    "return {1, 2, 3}",
+    "return {[1] = 'a', [2] = 'b', name = 'hero', hp = 1.5, alive = true, dead = false}",
+    "return {" + ", ".join(str(i * 3) for i in range(1, 131)) + "}",
+    "return {[10] = {id = 10, skills = {101, 102}}, [20] = {id = 20, skills = {}}}",
+    "return {{x = 1}, {x = 2, y = {true, 'z'}}, [3.0] = 'three'}",
+    "return {" + ", ".join(f"k{i} = 'v{i}'" for i in range(300)) + "}",
+    "return {a = 1, b = nil, c = 3}",
+]
+
+
+def lua_to_python(lua51, value):
+    """Таблица lupa → list/dict по тем же правилам, что в lua_data"""
+    if lua51.eval('type')(value) != b'table':
+        if isinstance(value, bytes):
+            return value.decode('utf-8')
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+    items = {}
+    for key, item in value.items():
+        key = lua_to_python(lua51, key)
+        items[key] = lua_to_python(lua51, item)
+    if items and all(i in items for i in range(1, len(items) + 1)):
+        return [items[i] for i in range(1, len(items) + 1)]
+    return items
+
+
+@pytest.mark.parametrize('source', CONFIGS)
+def test_eval_matches_lua(compile_lua, lua51, source):
+    expected = lua_to_python(lua51, lua51.execute(source.encode()))
+    assert eval_chunk(compile_lua(source)) == expected
+
+
+def test_shared_table_and_globals(compile_lua):
+    config = eval_chunk(compile_lua("local s = {1, 2} return {a = s, b = s}"))
+    assert config == {'a': [1, 2], 'b': [1, 2]} and config['a'] is config['b']
+    
+    config = eval_chunk(compile_lua("hero = {hp = 10} item = {1} level = 2"))
+    assert config == {'hero': {'hp': 10}, 'item': [1], 'level': 2}
+
+
+def test_code_chunk_is_rejected(compile_lua):
+    with pytest.raises(DataChunkError):
+        eval_chunk(compile_lua("local a = ... local b = a + 1 return b"))
+    with pytest.raises(ValueError):
+        eval_chunk(b'not lua')
+
+
+@pytest.mark.parametrize('source', [
+    "local a = 1 a[1] = 2",
+    "local a = 'x' a.k = 2",
+    "return {[true] = 1}",
+    "local t = {} return {[t] = 1}",
+])
+def test_invalid_data_is_rejected(compile_lua, source):
+    """Запись не в таблицу и ключи bool/таблица - DataChunkError, а не TypeError"""
+    with pytest.raises(DataChunkError):
+        eval_chunk(compile_lua(source))
+
+
+def test_config_records():
+    assert config_records(['a', 'b']) == {1: 'a', 2: 'b'}
+    assert config_records({10: 'x'}) == {10: 'x'}
+    assert config_records(5) == {}
@@ -0,0 +1,62 @@
+"""
+lua_pack: запись и чтение пака, сжатые файлы рядом с несжатыми
+"""
+
+import pytest
+
+from lua_pack import (PackReader, PackWriter, compress_bytes, compressed_name, list_tree,
+                      lua_exists, open_compressed, read_lua, remove_other_formats)
+
+FILES = {
+    'app/config/hero.lua': b'\x1bLuaQ hero',
+    'app/fight/skill.lua': b'skill' * 1000,
+    'main.lua': b'',
+}
+
+
+def test_pack_round_trip(tmp_path):
+    with PackWriter(tmp_path / 'out.pack') as pack:
+        for rel_path, data in FILES.items():
+            pack.add(rel_path, data)
+        pack.add(compressed_name('app/packed.lua', 'gzip'), compress_bytes(b'packed = 1', 'gzip'))
+    assert not (tmp_path / 'out.pack.tmp').exists()
+    
+    with PackReader(tmp_path / 'out.pack') as reader:
+        assert sorted(reader.names()) == sorted(list(FILES) + ['app/packed.lua.gz'])
+        for rel_path, data in FILES.items():
+            view = reader.read(rel_path)
+            assert isinstance(view, memoryview) and view == data
+            view.release()
+            assert reader.read_bytes(rel_path) == data
+        with pytest.raises(FileNotFoundError):
+            reader.read('missing.lua')
+    
+    # Папка out/ заменена паком out.pack рядом
+    base = tmp_path / 'out'
+    assert bytes(read_lua(base / 'app/config/hero.lua')) == FILES['app/config/hero.lua']
+    assert read_lua(base / 'app/packed.lua') == b'packed = 1'
+    assert lua_exists(base / 'app/fight') and not lua_exists(base / 'app/missing.lua')
+    assert dict(list_tree(base / 'app')) == {
+        'config/hero.lua': len(FILES['app/config/hero.lua']),
+        'fight/skill.lua': len(FILES['app/fight/skill.lua']),
+        'packed.lua': len(compress_bytes(b'packed = 1', 'gzip')),
+    }
+
+
+def test_aborted_pack_leaves_nothing(tmp_path):
+    with pytest.raises(RuntimeError):
+        with PackWriter(tmp_path / 'out.pack') as pack:
+            pack.add('main.lua', b'data')
+            raise RuntimeError
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_rewrite_in_other_format_removes_stale_copy(tmp_path):
+    output_file = tmp_path / 'x.lua'
+    for compression, code in ((None, 'old = 1'), ('gzip', 'new = 2'), ('xz', 'newer = 3')):
+        remove_other_formats(output_file, compression)
+        with open_compressed(compressed_name(output_file, compression), compression) as f:
+            f.write(code)
+    
+    assert [path.name for path in tmp_path.iterdir()] == ['x.lua.xz']
+    assert read_lua(output_file) == b'newer = 3'
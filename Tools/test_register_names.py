@@ -0,0 +1,80 @@
+"""
+RegisterNames: регистры локальных по правилу Lua 5.1 и имена по ходу pc
+"""
+
+import random
+
+from improved_lua_decompiler import ImprovedLuaDecompiler, LocalVar, RegisterNames
+
+SOURCE = """
+local a, b = ...
+do local x = a + 1 b = x end
+do local y = b * 2 a = y end
+for i = 1, 3 do local z = i + a a = z end
+local c = a + b
+return c
+"""
+
+
+def reference_registers(locals_info):
+    """Регистр локальной - число активных в ее startpc (перебором)"""
+    return [sum(1 for other in locals_info[:index]
+                if other.startpc <= local_var.startpc < other.endpc)
+            for index, local_var in enumerate(locals_info)]
+
+
+def nested_intervals(rng, start, end, depth=0):
+    """Случайные вложенные области видимости внутри [start, end)"""
+    result = []
+    pc = start
+    while pc < end - 1 and rng.random() < 0.8:
+        first = rng.randrange(pc, end - 1)
+        last = rng.randrange(first + 1, end)
+        result.append(LocalVar(f"v{first}_{last}", first, last, -1))
+        if depth < 4:
+            result.extend(nested_intervals(rng, first + 1, last, depth + 1))
+        pc = last
+    return result
+
+
+def test_registers_of_compiled_chunk(compile_lua):
+    proto = ImprovedLuaDecompiler(compile_lua(SOURCE)).read_chunk()
+    locals_info = proto.locals_info
+    RegisterNames(locals_info, {})
+    registers = {local_var.name: local_var.reg for local_var in locals_info}
+    assert registers['a'] == 0 and registers['b'] == 1
+    assert registers['x'] == registers['y'] == registers['(for index)'] == registers['c'] == 2
+    assert registers['i'] == 5 and registers['z'] == 6
+    assert [local_var.reg for local_var in locals_info] == reference_registers(locals_info)
+
+
+def test_registers_match_reference_on_random_scopes():
+    rng = random.Random(7)
+    for _ in range(200):
+        locals_info = nested_intervals(rng, 0, 60)
+        RegisterNames(locals_info, {})
+        assert [local_var.reg for local_var in locals_info] == reference_registers(locals_info)
+
+
+def test_names_follow_pc():
+    locals_info = [
+        LocalVar('a', 0, 10, -1),
+        LocalVar('x', 2, 4, -1),
+        LocalVar('(for index)', 5, 8, -1),
+        LocalVar('i', 6, 8, -1),
+        LocalVar('c', 8, 10, -1),
+    ]
+    scope = RegisterNames(locals_info, {5: 'arg5'})
+    expected = {
+        0: {0: 'a', 1: 'x', 2: 'i', 5: 'arg5'},
+        4: {0: 'a', 2: 'i', 5: 'arg5'},
+        8: {0: 'a', 1: 'c', 5: 'arg5'},
+        10: {5: 'arg5'},
+    }
+    next_pc = scope.advance(0)
+    assert scope.names == expected[0] and next_pc == 4
+    for pc in range(1, 11):
+        if pc >= next_pc:
+            next_pc = scope.advance(pc)
+        if pc in expected:
+            assert scope.names == expected[pc], pc